@@ -0,0 +1,98 @@
+import argparse
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import BaseHTTPServer
+import SocketServer
+import pycurl
+import common_tools as ct
+
+
+"""
+Benchmark requests/sec of 'get_json_data' against a local HTTPS stub, with and without
+reusing connections. Each request without reuse pays for a full TCP and TLS handshake.
+"""
+
+
+parser = argparse.ArgumentParser(description="Benchmark HTTP connection reuse in get_json_data against a local HTTPS stub")
+parser.add_argument('-n', '--nbr-requests', type=int, dest='nbr_requests', default=500, help='Specify number of requests per run (default = 500)')
+parser.add_argument('-p', '--port', type=int, dest='port', default=8443, help='Specify port of local HTTPS stub (default = 8443)')
+parser.add_argument('-s', '--payload-size', type=int, dest='payload_size', default=1024, help='Specify size of JSON payload in bytes (default = 1024)')
+args = parser.parse_args()
+
+
+NBR_REQUESTS = args.nbr_requests
+PORT = args.port
+PAYLOAD = '{"data":"' + "x" * max(args.payload_size - 11, 0) + '"}'
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	""" Answer every GET request with the same JSON payload, keeping connections alive. """
+	protocol_version = "HTTP/1.1"
+	disable_nagle_algorithm = True
+	
+	def do_GET(self):
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json;charset=utf-8")
+		self.send_header("Content-Length", str(len(PAYLOAD)))
+		self.end_headers()
+		self.wfile.write(PAYLOAD)
+	
+	def log_message(self, format, *args):
+		pass
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+
+
+def create_certificate(cert_dir):
+	""" Create self-signed certificate for localhost with openssl. """
+	cert_file = os.path.join(cert_dir, "cert.pem")
+	key_file = os.path.join(cert_dir, "key.pem")
+	with open(os.devnull, 'w') as devnull:
+		subprocess.check_call(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+					"-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+					"-keyout", key_file, "-out", cert_file], stdout=devnull, stderr=devnull)
+	return [cert_file, key_file]
+
+
+def run_benchmark(api_cmd, reuse_connection):
+	""" Send NBR_REQUESTS requests, and return requests/sec. """
+	start = time.time()
+	for i in range(NBR_REQUESTS):
+		[json_data, json_str] = ct.get_json_data(api_cmd, sleep_time=0, reuse_connection=reuse_connection)
+		if json_data is None:
+			raise SystemExit("ERROR: Request to local HTTPS stub failed. Exiting...")
+	return NBR_REQUESTS / (time.time() - start)
+
+
+cert_dir = tempfile.mkdtemp()
+try:
+	[cert_file, key_file] = create_certificate(cert_dir)
+	ct.CURL_OPTIONS[pycurl.CAINFO] = cert_file
+	
+	server = StubServer(("127.0.0.1", PORT), StubHandler)
+	server.socket = ssl.wrap_socket(server.socket, certfile=cert_file, keyfile=key_file, server_side=True)
+	server_thread = threading.Thread(target=server.serve_forever)
+	server_thread.daemon = True
+	server_thread.start()
+	
+	api_cmd = "https://localhost:" + str(PORT) + "/lol/match/v3/matches/1"
+	
+	print "INFO: Sending " + str(NBR_REQUESTS) + " requests per run to " + api_cmd
+	without_reuse = run_benchmark(api_cmd, reuse_connection=False)
+	print "INFO: Without connection reuse: %.1f requests/sec" % without_reuse
+	with_reuse = run_benchmark(api_cmd, reuse_connection=True)
+	print "INFO: With connection reuse: %.1f requests/sec" % with_reuse
+	print "INFO: Speedup: %.2fx" % (with_reuse / without_reuse)
+	
+	server.shutdown()
+	ct.get_curl_handle().close()
+	ct.CURL_SHARE.close()
+finally:
+	shutil.rmtree(cert_dir)
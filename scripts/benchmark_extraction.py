@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import generate_synthetic_games as gg
+import table_sinks as ts
+
+
+"""
+Benchmark extract_ranked_game_data.py over endpoint and timeline files of synthetic games (see
+generate_synthetic_games.py), which are generated once and kept in a data directory.
+
+Each configuration (extra arguments of the extractor, e.g., "-w 4 -z") is run in its own process,
+and timed end to end, with rows/sec, input MB/sec, and peak RSS of the extractor (of its largest
+process if it uses workers). Results can be saved as baselines, keyed by dataset and configuration,
+and later runs are compared against them, failing if rows/sec drops or peak RSS grows by more than
+a given tolerance.
+"""
+EXTRACT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extract_ranked_game_data.py")
+
+
+parser = argparse.ArgumentParser(description="Benchmark extract_ranked_game_data.py over synthetic games, against stored baselines")
+parser.add_argument('-n', '--nbr-games', type=int, dest='nbr_games', default=2000, help='Specify number of synthetic games (default = 2000, as in stored baselines)')
+parser.add_argument('-v', '--nbr-events', type=int, dest='nbr_events', default=30, help='Specify mean number of events per timeline frame (default = 30)')
+parser.add_argument('-E', '--endpoints-only', dest='endpoints_only', action='store_true', help='Benchmark extraction of endpoint data only')
+parser.add_argument('-i', '--data-dir', type=str, dest='data_dir', default="data/synthetic/", help='Provide path to directory of synthetic games, generated if missing (default = data/synthetic/)')
+parser.add_argument('-a', '--extract-args', type=str, dest='extract_args', action='append', help='Provide a configuration to benchmark as extra arguments of extract_ranked_game_data.py, e.g., -a="-w 4", once per configuration (default = no extra arguments)')
+parser.add_argument('-k', '--nbr-rounds', type=int, dest='nbr_rounds', default=1, help='Specify number of runs per configuration, of which the fastest is kept (default = 1)')
+parser.add_argument('-b', '--baseline-file', type=str, dest='baseline_file', default="benchmarks/extraction_baselines.json", help='Provide path to baseline file (default = benchmarks/extraction_baselines.json)')
+parser.add_argument('-s', '--save-baseline', dest='save_baseline', action='store_true', help='Save results as baselines, replacing those of the same dataset and configurations')
+parser.add_argument('-x', '--tolerance', type=float, dest='tolerance', default=0.1, help='Specify relative tolerance of rows/sec and peak RSS against baselines (default = 0.1)')
+parser.add_argument('-w', '--workers', type=int, dest='workers', default=1, help='Specify number of processes generating missing synthetic games (default = 1)')
+args = parser.parse_args()
+
+
+EXTRACT_ARGS = args.extract_args if args.extract_args is not None else [""]
+NBR_EVENTS = None if args.endpoints_only else args.nbr_events
+DATASET = "games=%d,events=%s" % (args.nbr_games, NBR_EVENTS)
+
+
+def get_option(extract_args, name, default):
+	""" Get value of an option in extra arguments of the extractor, e.g., '-F'. """
+	return extract_args[extract_args.index(name) + 1] if name in extract_args else default
+
+
+def run_extraction(in_files, extract_args, out_dir):
+	""" Run extractor once, and return [elapsed time, peak RSS in MB, number of rows]. """
+	output_format = get_option(extract_args, "-F", get_option(extract_args, "--format", "csv"))
+	timeline_format = get_option(extract_args, "-t", get_option(extract_args, "--timeline-format", output_format))
+	out_files = [os.path.join(out_dir, "endpoints." + output_format), os.path.join(out_dir, "timelines." + timeline_format)]
+	for file_name in out_files:
+		if os.path.isdir(file_name):
+			shutil.rmtree(file_name)
+		elif os.path.exists(file_name):
+			os.remove(file_name)
+	
+	cmd = [sys.executable, EXTRACT_SCRIPT, "-e", in_files[0], "-f", out_files[0]]
+	if len(in_files) > 1:
+		cmd += ["-i", in_files[1], "-o", out_files[1]]
+	cmd += extract_args
+	
+	start = time.time()
+	with open(os.devnull, 'w') as devnull:
+		process = subprocess.Popen(cmd, stdout=devnull)
+		[pid, status, rusage] = os.wait4(process.pid, 0)
+	elapsed_time = time.time() - start
+	if status != 0:
+		raise SystemExit("ERROR: Extraction failed with arguments '" + " ".join(extract_args) + "'. Exiting...")
+	
+	nbr_rows = sum(ts.count_rows(x, y) for x, y in zip(out_files, [output_format, timeline_format])[:len(in_files)])
+	return [elapsed_time, rusage.ru_maxrss / 1024.0, nbr_rows]
+
+
+def load_baselines(file_name):
+	if not os.path.exists(file_name):
+		return {}
+	with open(file_name, 'r') as fh:
+		return json.load(fh)
+
+
+def save_baselines(file_name, baselines):
+	if os.path.dirname(file_name) and not os.path.exists(os.path.dirname(file_name)):
+		os.makedirs(os.path.dirname(file_name))
+	with open(file_name, 'w') as fh:
+		json.dump(baselines, fh, indent=2, sort_keys=True, separators=(',', ': '))
+		fh.write("\n")
+
+
+def compare_to_baseline(result, baseline):
+	""" Get list of regressions of a result against its baseline, beyond tolerance. """
+	regressions = []
+	if result['rows_per_sec'] < baseline['rows_per_sec'] * (1 - args.tolerance):
+		regressions.append("rows/sec %.0f < %.0f" % (result['rows_per_sec'], baseline['rows_per_sec']))
+	if result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + args.tolerance):
+		regressions.append("peak RSS %.1f MB > %.1f MB" % (result['peak_rss_mb'], baseline['peak_rss_mb']))
+	return regressions
+
+
+in_files = gg.get_file_names(args.data_dir, "KR", args.nbr_games)[:1 if NBR_EVENTS is None else 2]
+if not all(os.path.exists(x) for x in in_files):
+	print "INFO: Generating " + str(args.nbr_games) + " synthetic games into " + args.data_dir
+	gg.generate_games(args.data_dir, "KR", args.nbr_games, NBR_EVENTS, args.workers)
+nbr_bytes = sum(os.path.getsize(x) for x in in_files)
+
+baselines = load_baselines(args.baseline_file)
+dataset_baselines = baselines.get(DATASET, {})
+results = {}
+regressions = []
+no_baselines = []
+
+print "INFO: Extracting %s (%.1f MB)" % (DATASET, nbr_bytes / 1e6)
+print "%-24s %10s %9s %12s %9s %13s  %s" % ("configuration", "rows", "time", "rows/sec", "MB/sec", "peak RSS MB", "baseline")
+out_dir = tempfile.mkdtemp()
+try:
+	for extract_args in EXTRACT_ARGS:
+		runs = [run_extraction(in_files, extract_args.split(), out_dir) for i in range(args.nbr_rounds)]
+		[elapsed_time, peak_rss, nbr_rows] = min(runs)
+		result = {	'rows': nbr_rows,
+				'time': round(elapsed_time, 3),
+				'rows_per_sec': round(nbr_rows / elapsed_time, 1),
+				'mb_per_sec': round(nbr_bytes / 1e6 / elapsed_time, 2),
+				'peak_rss_mb': round(peak_rss, 1)
+				}
+		results[extract_args] = result
+		
+		comparison = "none"
+		if extract_args not in dataset_baselines:
+			no_baselines.append(extract_args or "default")
+		else:
+			baseline = dataset_baselines[extract_args]
+			config_regressions = compare_to_baseline(result, baseline)
+			regressions.extend((extract_args or "default") + ": " + x for x in config_regressions)
+			comparison = "%+.1f%% rows/sec, %+.1f%% RSS" % (100.0 * (result['rows_per_sec'] / baseline['rows_per_sec'] - 1),
+					100.0 * (result['peak_rss_mb'] / baseline['peak_rss_mb'] - 1))
+			if config_regressions:
+				comparison += " REGRESSION"
+		
+		print "%-24s %10d %8.1fs %12.1f %9.2f %13.1f  %s" % (extract_args or "default", nbr_rows, elapsed_time,
+				result['rows_per_sec'], result['mb_per_sec'], result['peak_rss_mb'], comparison)
+finally:
+	shutil.rmtree(out_dir)
+
+if no_baselines and not args.save_baseline:
+	print "WARNING: No baselines for %s of %s in %s, so they are not checked for regressions" % (", ".join(no_baselines), DATASET, args.baseline_file)
+
+if args.save_baseline:
+	dataset_baselines.update(results)
+	baselines[DATASET] = dataset_baselines
+	save_baselines(args.baseline_file, baselines)
+	print "INFO: Saved baselines to " + args.baseline_file
+elif regressions:
+	raise SystemExit("ERROR: Regressions against baselines:\n" + "\n".join("ERROR: " + x for x in regressions))
@@ -0,0 +1,91 @@
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import common_tools as ct
+import riot_simulator as rs
+
+
+"""
+Benchmark end-to-end games/min of fetch_ranked_game_data.py against a local Riot API simulator
+(see riot_simulator.py), for every combination of numbers of workers and rate limits.
+The simulator enforces the same rate limits as the crawler is given, so that 429s are
+answered as by the Riot API when the crawler exceeds them.
+"""
+FETCH_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fetch_ranked_game_data.py")
+TOTAL_PATTERN = re.compile(r"INFO: Total: (\d+) players, (\d+) games, (\d+) requests in ([\d.]+) sec")
+
+
+def check_rate_limits(rate_limits):
+	""" Accept "none" for a run without rate limits. """
+	if rate_limits.lower() == "none":
+		return None
+	return ct.check_rate_limits(rate_limits)
+
+
+parser = argparse.ArgumentParser(description="Benchmark games/min of fetch_ranked_game_data.py against a local Riot API simulator")
+parser.add_argument('-r', '--region', type=ct.check_region_names, dest='regions', nargs='+', default=['NA1'], help='Specify one or more regions crawled in parallel (default = NA1)')
+parser.add_argument('-n', '--nbr-players', type=int, dest='nbr_players', default=20, help='Specify number of players per region (default = 20)')
+parser.add_argument('-g', '--nbr-games', type=int, dest='nbr_games', default=10, help='Specify number of games per player (default = 10)')
+parser.add_argument('-y', '--get-timeline', dest='get_timeline', action='store_true', help='Retrieve timeline data')
+parser.add_argument('-w', '--workers', type=int, dest='workers', nargs='+', default=[1, 4, 8], help='Specify numbers of workers to benchmark (default = 1 4 8)')
+parser.add_argument('-R', '--rate-limits', type=check_rate_limits, dest='rate_limits', nargs='+', default=[None], help='Specify rate limits to benchmark as max_requests:period pairs, or none (default = none)')
+parser.add_argument('-l', '--latency', type=float, dest='latency', default=0.02, help='Specify mean latency of simulator in sec (default = 0.02)')
+parser.add_argument('-e', '--error-rate', type=float, dest='error_rate', default=0.0, help='Specify probability of server errors of simulator (default = 0)')
+parser.add_argument('-p', '--port', type=int, dest='port', default=8080, help='Specify port of simulator (default = 8080)')
+parser.add_argument('-a', '--fetch-args', type=str, dest='fetch_args', default="", help='Provide extra arguments of fetch_ranked_game_data.py, e.g., "-P -x -J"')
+args = parser.parse_args()
+
+
+def run_benchmark(workers, rate_limits, out_dir, api_key_file):
+	""" Run a crawl against a new simulator, and return [players, games, requests, elapsed time]. """
+	simulator = rs.RiotSimulator(rate_limits=rate_limits, error_rate=args.error_rate, latency=args.latency,
+					nbr_matches=max(args.nbr_games, 100), pool_size=args.nbr_players * args.nbr_games * 2)
+	server = rs.start_simulator(args.port, simulator)
+	
+	cmd = [sys.executable, FETCH_SCRIPT, "-r"] + args.regions + [
+			"-n", str(args.nbr_players), "-g", str(args.nbr_games), "-w", str(workers),
+			"-m", "1000000", "-t", "1", "-o", out_dir, "-k", api_key_file,
+			"-b", rs.DEFAULT_BASE_URL.format(port=args.port, region="{region}")]
+	if args.get_timeline:
+		cmd.append("-y")
+	if rate_limits is not None:
+		cmd += ["-R", ",".join(str(x) + ":" + str(y) for x, y in rate_limits)]
+	cmd += args.fetch_args.split()
+	
+	try:
+		output = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+	finally:
+		server.shutdown()
+		server.server_close()
+	
+	match = TOTAL_PATTERN.search(output)
+	if match is None:
+		print output
+		raise SystemExit("ERROR: Crawl did not report its total. Exiting...")
+	return [int(match.group(1)), int(match.group(2)), int(match.group(3)), float(match.group(4))]
+
+
+work_dir = tempfile.mkdtemp()
+try:
+	api_key_file = os.path.join(work_dir, "API_KEY")
+	with open(api_key_file, 'w') as fh:
+		fh.write("SIMULATED-KEY\n")
+	
+	print "INFO: Crawling " + str(args.nbr_players) + " players and " + str(args.nbr_games) + " games per player in " + ", ".join(args.regions)
+	print "%8s %16s %8s %9s %10s %9s %10s %13s" % ("workers", "rate_limits", "players", "games", "requests", "time", "games/min", "requests/min")
+	for rate_limits in args.rate_limits:
+		for workers in args.workers:
+			out_dir = tempfile.mkdtemp(dir=work_dir) + "/"
+			[nbr_players, nbr_games, nbr_requests, elapsed_time] = run_benchmark(workers, rate_limits, out_dir, api_key_file)
+			limits = ",".join(str(x) + ":" + str(y) for x, y in rate_limits) if rate_limits is not None else "none"
+			print "%8d %16s %8d %9d %10d %8.1fs %10.1f %13.1f" % (workers, limits, nbr_players, nbr_games, nbr_requests, elapsed_time,
+					nbr_games * 60.0 / elapsed_time, nbr_requests * 60.0 / elapsed_time)
+			shutil.rmtree(out_dir)
+			time.sleep(0.5)
+finally:
+	shutil.rmtree(work_dir)
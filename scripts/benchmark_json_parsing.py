@@ -0,0 +1,55 @@
+import argparse
+import glob
+import time
+import json_backend as jb
+
+
+"""
+Benchmark parse throughput of available JSON backends over files with 'id<TAB>JSON string' lines,
+e.g., the summoner and match list files in example_data, or endpoint and timeline dumps of the fetcher.
+"""
+
+
+parser = argparse.ArgumentParser(description="Benchmark JSON parse throughput of available backends")
+parser.add_argument('-i', '--in-files', type=str, dest='in_files', nargs='+', default=["example_data/*.json"], help='Provide input files or glob patterns (default = example_data/*.json)')
+parser.add_argument('-n', '--nbr-rounds', type=int, dest='nbr_rounds', default=5, help='Specify number of rounds over input files per backend (default = 5)')
+parser.add_argument('-k', '--fields', type=str, dest='fields', nargs='+', help='Provide top-level fields to decode lazily, benchmarked in addition to full decoding')
+args = parser.parse_args()
+
+
+IN_FILES = sorted(set(x for pattern in args.in_files for x in glob.glob(pattern)))
+NBR_ROUNDS = args.nbr_rounds
+FIELDS = args.fields
+
+if not IN_FILES:
+	raise SystemExit("ERROR: No input files found. Exiting...")
+
+""" Load JSON strings in memory, so that only parsing is timed. """
+json_strs = []
+for file_name in IN_FILES:
+	for line in open(file_name, 'r'):
+		json_strs.append(line.rstrip("\n").split("\t", 1)[1])
+
+nbr_bytes = sum(len(x) for x in json_strs)
+print "INFO: %d JSON strings, %.1f MB in %d files" % (len(json_strs), nbr_bytes / 1e6, len(IN_FILES))
+
+
+def run_benchmark(decode):
+	""" Decode all JSON strings NBR_ROUNDS times, and return MB/sec and documents/sec. """
+	start = time.time()
+	for i in range(NBR_ROUNDS):
+		for json_str in json_strs:
+			decode(json_str)
+	elapsed_time = time.time() - start
+	return [nbr_bytes * NBR_ROUNDS / 1e6 / elapsed_time, len(json_strs) * NBR_ROUNDS / elapsed_time]
+
+
+for backend in jb.get_backends():
+	jb.set_backend(backend)
+	
+	[mb_per_sec, docs_per_sec] = run_benchmark(jb.loads)
+	print "INFO: %-10s full: %8.1f MB/sec, %10.1f documents/sec" % (backend, mb_per_sec, docs_per_sec)
+	
+	if FIELDS is not None:
+		[mb_per_sec, docs_per_sec] = run_benchmark(lambda x: jb.loads_fields(x, FIELDS))
+		print "INFO: %-10s lazy: %8.1f MB/sec, %10.1f documents/sec" % (backend, mb_per_sec, docs_per_sec)
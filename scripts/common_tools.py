@@ -1,8 +1,11 @@
 import argparse
-import json
 import math
+import os
 import time
 import pycurl
+import threading
+import rate_limiting as rl
+import json_backend as jb
 from datetime import date
 from StringIO import StringIO
 
@@ -25,10 +28,8 @@ VALID_QUEUE_TYPES = [	'RANKED_SOLO_5x5',		# queueType = 4
 
 
 """ Simple utilities """
-def get_api_key ():
-	""" The file containing the API key is assumed to be in the main directory. """
-	api_key_file = "API_KEY"
-	
+def get_api_key (api_key_file="API_KEY"):
+	""" The file containing the API key is assumed to be in the main directory, unless given. """
 	key = None
 	with open(api_key_file) as file:
 		key = file.read().rstrip()
@@ -36,6 +37,34 @@ def get_api_key ():
 	return key
 
 
+def truncate_partial_line(file_name):
+	""" Remove incomplete last line of a file, e.g., left behind by a crash while writing. """
+	if not os.path.exists(file_name):
+		return
+	
+	with open(file_name, 'rb+') as fh:
+		fh.seek(0, os.SEEK_END)
+		end = fh.tell()
+		while end > 0:
+			start = max(end - 65536, 0)
+			fh.seek(start)
+			block = fh.read(end - start)
+			if "\n" in block:
+				end = start + block.rindex("\n") + 1
+				break
+			end = start
+		fh.truncate(end)
+
+
+def get_json_lines_ids(file_name):
+	""" Get set of ids in the first column of a file with 'id<TAB>JSON string' lines. """
+	ids = set()
+	if os.path.exists(file_name):
+		for line in open(file_name, 'r'):
+			ids.add(line.split("\t", 1)[0])
+	return ids
+
+
 def check_league_name(league_name):
 	""" Check if league name is valid. """
 	if league_name not in VALID_LEAGUE_NAMES:
@@ -56,6 +85,14 @@ def check_region_name(region_name):
 		return region_name
 
 
+def check_region_names(region_name):
+	""" Check if region name is valid, allowing ALL for all regions. """
+	if region_name == "ALL":
+		return region_name
+	else:
+		return check_region_name(region_name)
+
+
 def check_queue_type(queue_type):
 	""" Check if queue type is valid. """
 	if queue_type not in VALID_QUEUE_TYPES:
@@ -66,6 +103,44 @@ def check_queue_type(queue_type):
 		return queue_type
 
 
+def check_rate_limits(rate_limits):
+	"""
+	Check if rate limits are given as 'max_requests:period' pairs, e.g., "20:1,100:120",
+	and return a list of (max_requests, period_in_sec) tuples.
+	"""
+	try:
+		limits = [tuple(int(x) for x in limit.split(":")) for limit in rate_limits.split(",")]
+		if any(len(limit) != 2 or min(limit) <= 0 for limit in limits):
+			raise ValueError
+	except ValueError:
+		msg1 = "ERROR: Rate limits are invalid!\n"
+		msg2 = "ERROR: Use comma-separated 'max_requests:period' pairs, e.g., 20:1,100:120"
+		raise argparse.ArgumentTypeError(msg1 + msg2)
+	else:
+		return limits
+
+
+def get_endpoint_type(api_cmd):
+	""" Get type of Riot API endpoint called by request, i.e., league, summoner, matchlist, match, or timeline. """
+	if "/league/" in api_cmd:
+		return "league"
+	elif "/summoner/" in api_cmd:
+		return "summoner"
+	elif "/matchlists/" in api_cmd:
+		return "matchlist"
+	elif "/timelines/" in api_cmd:
+		return "timeline"
+	elif "/matches/" in api_cmd:
+		return "match"
+	else:
+		return "other"
+
+
+def get_host(api_cmd):
+	""" Get host of request, i.e., its URL up to the API path, e.g., https://na1.api.riotgames.com """
+	return api_cmd.split("/lol/", 1)[0]
+
+
 def get_sleep_time(max_requests_per_min, time_gap=2):
 	""" Compute sleep time between requests in seconds. """
 	return math.ceil(max_requests_per_min / 60.0) + time_gap
@@ -77,9 +152,12 @@ def get_formatted_date():
 
 
 """ Thin wrappers around Riot API (v3) """
+BASE_URL = "https://{region}.api.riotgames.com/lol"	# Riot Game API website, or e.g. a local riot_simulator.py
+
+
 def get_url_prefix(region_name):
 	""" Create URL prefix, which is the Riot Game API website. """
-	return "https://" + region_name + ".api.riotgames.com/lol"
+	return BASE_URL.replace("{region}", region_name)
 
 
 def get_url_suffix(user_api_key):
@@ -111,7 +189,7 @@ def get_summoner_by_id(url_prefix, url_suffix, summoner_id):
 	return url_prefix + "/summoner/v3/summoners/" + str(summoner_id) + url_suffix
 
 
-def get_match_list_by_account_id(url_prefix, url_suffix, account_id, recent=False):
+def get_match_list_by_account_id(url_prefix, url_suffix, account_id, recent=False, begin_time=None, begin_index=None, end_index=None):
 	"""
 	Use Match v3 API call, and return MatchlistDto, which contains a list of MatchReferenceDto.
 	This return the full match history available, and data for each match is accessed via MatchReferenceDto.	
@@ -120,11 +198,21 @@ def get_match_list_by_account_id(url_prefix, url_suffix, account_id, recent=Fals
 	MatchReferenceDto contains 'lane', 'gameId', 'champion', 'role', but see Riot API doc.
 	
 	If recent set to True, then only data for the last 20 matches played are retrieved.
+	
+	Otherwise, matches can be limited to those played since 'begin_time' (epoch milliseconds),
+	and paged with 'begin_index' and 'end_index' (exclusive), at most 100 matches per page.
 	"""
 	if recent:
 		return url_prefix + "/match/v3/matchlists/by-account/" + str(account_id) + "/recent" + url_suffix
-	else:
-		return url_prefix + "/match/v3/matchlists/by-account/" + str(account_id) + url_suffix
+	
+	api_cmd = url_prefix + "/match/v3/matchlists/by-account/" + str(account_id) + url_suffix
+	if begin_time is not None:
+		api_cmd += "&beginTime=" + str(begin_time)
+	if begin_index is not None:
+		api_cmd += "&beginIndex=" + str(begin_index)
+	if end_index is not None:
+		api_cmd += "&endIndex=" + str(end_index)
+	return api_cmd
 
 
 def get_match_endpoint_by_match_id(url_prefix, url_suffix, match_id):
@@ -143,62 +231,225 @@ def get_match_timeline_by_match_id(url_prefix, url_suffix, match_id):
 	return url_prefix + "/match/v3/timelines/by-match/" + str(match_id) + url_suffix
 
 
-def get_json_data(api_cmd, max_attempts=5, sleep_time=3):
+""" Persistent HTTP connections """
+CURL_SHARE = pycurl.CurlShare()		# DNS cache, TLS sessions, and connections shared by all handles
+CURL_SHARE.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+CURL_SHARE.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_SSL_SESSION)
+if hasattr(pycurl, "LOCK_DATA_CONNECT"):
+	CURL_SHARE.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_CONNECT)
+
+CURL_OPTIONS = {}	# Extra options set on every handle, e.g., {pycurl.CAINFO: path} for a local test server
+
+CURL_HANDLES = threading.local()	# One reusable handle per thread, as handles cannot be used concurrently
+
+
+def create_curl_handle(reuse_connection=True):
+	""" Create curl handle, which keeps connections alive and shares them with other handles if 'reuse_connection'. """
+	c = pycurl.Curl()
+	if reuse_connection:
+		c.setopt(c.SHARE, CURL_SHARE)
+		c.setopt(c.TCP_KEEPALIVE, 1)
+	else:
+		c.setopt(c.FORBID_REUSE, 1)
+		c.setopt(c.FRESH_CONNECT, 1)
+	for option, value in CURL_OPTIONS.items():
+		c.setopt(option, value)
+	return c
+
+
+def get_curl_handle():
+	"""
+	Get curl handle of the calling thread. Its connections to each region host stay open
+	between requests, so only the first request to a host pays for the TCP and TLS handshakes.
+	"""
+	c = getattr(CURL_HANDLES, "handle", None)
+	if c is None:
+		c = create_curl_handle()
+		CURL_HANDLES.handle = c
+	return c
+
+
+""" Back-off schedulers of calls given none, shared like connections, so that rate limit windows seen by one call hold for the next """
+DEFAULT_SCHEDULERS = {}		# (host, base back-off time) to BackoffScheduler
+DEFAULT_SCHEDULERS_LOCK = threading.Lock()
+
+
+def get_default_scheduler(host, base_time):
+	""" Get back-off scheduler shared by requests to a host with the same base back-off time, creating it on first use. """
+	with DEFAULT_SCHEDULERS_LOCK:
+		if (host, base_time) not in DEFAULT_SCHEDULERS:
+			DEFAULT_SCHEDULERS[(host, base_time)] = rl.BackoffScheduler(base_time=base_time)
+		return DEFAULT_SCHEDULERS[(host, base_time)]
+
+
+def parse_header_line(header_line, headers):
+	""" Add response header line to dict, with lower-case header names as keys. """
+	if ":" in header_line:
+		[name, value] = header_line.split(":", 1)
+		headers[name.strip().lower()] = value.strip()
+	elif header_line.startswith("HTTP/"):
+		headers.clear()	# New response, e.g., after redirect
+
+
+def handle_response(resp_code, buffer):
+	"""
+	Handle response of an attempt with response body in 'buffer', or None if the request failed,
+	and return [decoded JSON data or None, True if the request is not to be retried].
+	"""
+	if resp_code == 200:
+		""" Success! Do something with response body. """
+		try:
+			return [jb.loads(buffer.getvalue()), True]
+		except ValueError as e:
+			print "ERROR: Problematic JSON string... Retry..."
+	elif resp_code == 400:
+		print "ERROR: Bad request with code " + str(resp_code) + ". Skipping..."
+		return [None, True]
+	elif resp_code == 403:
+		print "ERROR: Rate limit exceeded! Check with Riot! Skipping..."
+		return [None, True]
+	elif resp_code == 404:
+		""" No data, e.g., no matches in time range of match list request. """
+		print "ERROR: Data not found with code " + str(resp_code) + ". Skipping..."
+		return [None, True]
+	elif resp_code == 429:
+		""" Rate limit exceeded or service temporarily unavailable. Retry after 'Retry-After' seconds... """
+		print "ERROR: Too many requests. Retry..."
+	elif resp_code in [500, 503]:
+		print "ERROR: Riot API server is down or unable to fulfill request. Retry..."
+	elif resp_code is not None:
+		print "ERROR: Unrecognized HTTP response code " + str(resp_code) + ". Retry..."
+	return [None, False]
+
+
+def get_cached_json_data(api_cmd, endpoint_type, cache, metrics=None):
+	""" Look up response of request in 'cache', and return [decoded JSON data, JSON string], or [None, None] if it is not cached. """
+	json_str = cache.get(api_cmd, endpoint_type)
+	if json_str is not None:
+		try:
+			json_data = jb.loads(json_str)
+			if metrics is not None:
+				metrics.record_cache_hit(endpoint_type)
+			return [json_data, json_str]
+		except ValueError as e:
+			print "ERROR: Problematic JSON string in cache... Retry..."
+	return [None, None]
+
+
+def handle_attempt(api_cmd, endpoint_type, resp_code, buffer, headers, latency, nbr_attempts, max_attempts, scheduler, cache=None, metrics=None):
+	"""
+	Handle response of attempt 'nbr_attempts' (counted from 0) of a request, as sent by get_json_data or a RiotClient:
+	record it in 'metrics', decode it, and decide on the wait before the next attempt or after a success by 'scheduler'.
+	Successful responses are stored in 'cache'.
+	Return [decoded JSON data, JSON string, seconds to wait before retrying or None if the request is done,
+	seconds to wait after the request before sending another one].
+	"""
+	if metrics is not None:
+		metrics.record_request(endpoint_type, resp_code, latency, buffer.tell(), nbr_attempts)
+	
+	[json_data, is_final] = handle_response(resp_code, buffer)
+	if json_data is None:
+		if is_final or nbr_attempts + 1 >= max_attempts:
+			return [None, None, None, 0.0]
+		
+		retry_time = scheduler.get_retry_time(resp_code, headers, nbr_attempts + 1)
+		if metrics is not None:
+			metrics.record_sleep(endpoint_type, "retry", retry_time)
+		return [None, None, retry_time, 0.0]
+	
+	json_str = buffer.getvalue()
+	if cache is not None:
+		cache.put(api_cmd, endpoint_type, json_str)
+	
+	success_time = scheduler.get_success_time(headers, method=endpoint_type)
+	if metrics is not None:
+		metrics.record_sleep(endpoint_type, "success", success_time)
+	return [json_data, json_str, None, success_time]
+
+
+def get_json_data(api_cmd, max_attempts=5, sleep_time=3, rate_limiter=None, reuse_connection=True, scheduler=None, cache=None, metrics=None, concurrency=None):
 	""" 
 	Send request to Riot API server, and handle response, retrying requests up to 'max_attempts' times.
 	Decode returned JSON string, and retry if JSON string is invalid up to 'max_attempts' times.
+	
+	If 'rate_limiter' is given, every attempt waits for a token from it, so it can be shared by
+	threads sending requests in parallel.
+	
+	Sleep times are decided by 'scheduler' from response headers (see BackoffScheduler), with
+	'sleep_time' as base back-off time. No sleep follows a success while rate budget remains.
+	Without 'scheduler', the default scheduler of the host is used (see get_default_scheduler).
+	
+	Connections are kept alive and reused across calls unless 'reuse_connection' is False.
+	
+	If 'cache' is given (see ResponseCache), responses are looked up there first, and
+	successful responses are stored there.
+	
+	If 'metrics' is given (see CrawlMetrics), every attempt, cache hit, and sleep is recorded there.
+	
+	If 'concurrency' is given (see ConcurrencyController), every attempt waits for a slot of its host
+	and endpoint type, whose number adapts to latencies and 429/503 responses.
 	"""
 	json_str = None		# Encoded
 	json_data = None	# Decoded
 	
+	endpoint_type = get_endpoint_type(api_cmd)
+	concurrency_key = (get_host(api_cmd), endpoint_type)
+	
+	if cache is not None:
+		[json_data, json_str] = get_cached_json_data(api_cmd, endpoint_type, cache, metrics)
+		if json_data is not None:
+			return [json_data, json_str]
+	
+	if scheduler is None:
+		scheduler = get_default_scheduler(concurrency_key[0], sleep_time)
+	
 	nbr_attempts = 0
 	
-	buffer = StringIO()
-	c = pycurl.Curl()
+	c = get_curl_handle() if reuse_connection else create_curl_handle(reuse_connection=False)
 	
 	while True:
+		if concurrency is not None:
+			[concurrency_start, waited] = concurrency.acquire(concurrency_key)
+			if metrics is not None:
+				metrics.record_sleep(endpoint_type, "concurrency", waited)
+		
+		if rate_limiter is not None:
+			waited = rate_limiter.acquire()
+			if metrics is not None:
+				metrics.record_sleep(endpoint_type, "limiter", waited)
+		
+		buffer = StringIO()
+		headers = {}
 		c.setopt(c.URL, api_cmd)
 		c.setopt(c.WRITEDATA, buffer)
-		c.perform()
+		c.setopt(c.HEADERFUNCTION, lambda line: parse_header_line(line, headers))
 		
-		""" Retry until successful. Not entirely sure if 0 is really the expected response... """
-		resp_code = c.getinfo(c.RESPONSE_CODE)
+		start_time = time.time()
+		try:
+			c.perform()
+			resp_code = c.getinfo(c.RESPONSE_CODE)
+		except pycurl.error as e:
+			print "ERROR: Request failed with '" + str(e) + "'. Retry..."
+			resp_code = None
 		
-		if resp_code == 200:
-			""" Success! Do something with response body. """
-			try:
-				json_str = buffer.getvalue()
-				json_data = json.loads(json_str)
-				break
-			except ValueError as e:
-				print "ERROR: Problematic JSON string... Retry..."
-		elif resp_code == 400:
-			print "ERROR: Bad request with code " + str(resp_code) + ". Skipping..."
-			break
-		elif resp_code == 403:
-			print "ERROR: Rate limit exceeded! Check with Riot! Skipping..."
-			break
-		elif resp_code == 429:
-			"""
-			Service could have been temporarily unavailable. Retry...
-			TODO: Figure out if sleep time can be informed by 'Retry-After' in response header.
-			"""
-		elif resp_code in [500, 503]:
-			print "ERROR: Riot API server is down or unable to fulfill request. Retry..."
-		else:
-			print "ERROR: Unrecognized HTTP response code " + str(resp_code) + ". Retry..."
+		latency = time.time() - start_time
+		if concurrency is not None:
+			concurrency.release(concurrency_key, concurrency_start, resp_code, latency)
 		
-		nbr_attempts += 1
-		if nbr_attempts >= max_attempts:
+		[json_data, json_str, retry_time, success_time] = handle_attempt(api_cmd, endpoint_type, resp_code, buffer, headers, latency,
+										nbr_attempts, max_attempts, scheduler, cache, metrics)
+		if retry_time is None:
 			break
 		
 		# Sleep before next attempt
-		time.sleep(sleep_time)
+		nbr_attempts += 1
+		time.sleep(retry_time)
 	
-	c.close()
+	if not reuse_connection:
+		c.close()
 	
-	# Sleep before next API call
-	time.sleep(sleep_time)
+	# Sleep before next API call only if rate limit would be exceeded
+	time.sleep(success_time)
 	
 	return [json_data, json_str]
 
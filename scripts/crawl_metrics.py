@@ -0,0 +1,151 @@
+import json
+import math
+import threading
+import time
+
+
+"""
+Instrumentation of requests to the Riot API, by endpoint type (see common_tools.get_endpoint_type).
+
+For every endpoint type, counts of requests, responses by code, retries, and cache hits are kept,
+with bytes received, time waiting on the network, and time waiting for a concurrency slot or the
+rate limiter, before retries, and after successes. Latencies go into a histogram of fixed, log-spaced
+buckets, so that recording a request takes constant time and memory, and percentiles are exact to
+within a bucket.
+"""
+BUCKET_FACTOR = 1.1	# Ratio of upper bounds of consecutive latency buckets
+MIN_LATENCY = 0.001	# Upper bound of first latency bucket in seconds
+NBR_BUCKETS = 128	# Up to about 3 minutes, beyond which latencies fall in the last bucket
+
+SLEEP_TYPES = ["concurrency", "limiter", "retry", "success"]
+
+
+def get_bucket(latency):
+	if latency <= MIN_LATENCY:
+		return 0
+	return min(int(math.ceil(math.log(latency / MIN_LATENCY, BUCKET_FACTOR))), NBR_BUCKETS - 1)
+
+
+def get_bucket_bound(bucket):
+	return MIN_LATENCY * BUCKET_FACTOR ** bucket
+
+
+class EndpointMetrics(object):
+	def __init__(self):
+		self.nbr_requests = 0
+		self.nbr_retries = 0
+		self.nbr_cache_hits = 0
+		self.resp_codes = {}	# Response code (or "error" if no response) to count
+		self.nbr_bytes = 0
+		self.network_time = 0.0
+		self.sleep_times = dict((x, 0.0) for x in SLEEP_TYPES)
+		self.latencies = [0] * NBR_BUCKETS
+	
+	def get_percentile(self, percentile):
+		""" Get upper bound of latency bucket holding given percentile, or None without requests. """
+		nbr_latencies = sum(self.latencies)
+		if nbr_latencies == 0:
+			return None
+		rank = percentile / 100.0 * nbr_latencies
+		count = 0
+		for bucket, nbr in enumerate(self.latencies):
+			count += nbr
+			if count >= rank:
+				return round(get_bucket_bound(bucket), 4)
+	
+	def get_snapshot(self):
+		return {	'requests': self.nbr_requests,
+				'retries': self.nbr_retries,
+				'cache_hits': self.nbr_cache_hits,
+				'responses': dict((str(x), n) for x, n in self.resp_codes.items()),
+				'bytes': self.nbr_bytes,
+				'network_time': round(self.network_time, 3),
+				'sleep_time': dict((x, round(t, 3)) for x, t in self.sleep_times.items()),
+				'latency_p50': self.get_percentile(50),
+				'latency_p95': self.get_percentile(95),
+				'latency_p99': self.get_percentile(99)
+				}
+
+
+class CrawlMetrics(object):
+	""" Metrics of requests sent by one crawler, e.g., of one region, shared by its threads. """
+	def __init__(self, name):
+		self.name = name
+		self.start_time = time.time()
+		self.endpoints = {}	# Endpoint type to EndpointMetrics
+		self.lock = threading.Lock()
+	
+	def get_endpoint(self, endpoint_type):
+		if endpoint_type not in self.endpoints:
+			self.endpoints[endpoint_type] = EndpointMetrics()
+		return self.endpoints[endpoint_type]
+	
+	def record_request(self, endpoint_type, resp_code, latency, nbr_bytes, nbr_attempts=0):
+		""" Record an attempt of a request, which is a retry if earlier attempts were made. """
+		with self.lock:
+			endpoint = self.get_endpoint(endpoint_type)
+			endpoint.nbr_requests += 1
+			if nbr_attempts > 0:
+				endpoint.nbr_retries += 1
+			resp_code = resp_code if resp_code is not None else "error"
+			endpoint.resp_codes[resp_code] = endpoint.resp_codes.get(resp_code, 0) + 1
+			endpoint.nbr_bytes += nbr_bytes
+			endpoint.network_time += latency
+			endpoint.latencies[get_bucket(latency)] += 1
+	
+	def record_sleep(self, endpoint_type, sleep_type, sleep_time):
+		""" Record time spent waiting before a request ("concurrency" or "limiter"), or after it ("retry" or "success"). """
+		with self.lock:
+			self.get_endpoint(endpoint_type).sleep_times[sleep_type] += sleep_time
+	
+	def record_cache_hit(self, endpoint_type):
+		with self.lock:
+			self.get_endpoint(endpoint_type).nbr_cache_hits += 1
+	
+	def get_snapshot(self):
+		""" Get cumulative metrics since start, by endpoint type. """
+		with self.lock:
+			return {	'name': self.name,
+					'time': round(time.time(), 3),
+					'elapsed_time': round(time.time() - self.start_time, 3),
+					'endpoints': dict((x, endpoint.get_snapshot()) for x, endpoint in self.endpoints.items())
+					}
+	
+	def get_summary(self):
+		""" Summarize metrics by endpoint type, one line per endpoint type. """
+		summary = []
+		with self.lock:
+			for endpoint_type, endpoint in sorted(self.endpoints.items()):
+				latencies = [endpoint.get_percentile(x) for x in [50, 95, 99]]
+				latencies = "/".join("%.0f" % (x * 1000) if x is not None else "NA" for x in latencies)
+				sleep_times = ", ".join("%s %.1f" % (x, endpoint.sleep_times[x]) for x in SLEEP_TYPES)
+				summary.append("%s %s: %d requests, %d retries, %d 429s, %d cache hits, %.1f MB, p50/p95/p99 %s ms, network %.1f sec, sleep %.1f sec (%s)" % (
+						self.name, endpoint_type, endpoint.nbr_requests, endpoint.nbr_retries, endpoint.resp_codes.get(429, 0),
+						endpoint.nbr_cache_hits, endpoint.nbr_bytes / 1e6, latencies, endpoint.network_time,
+						sum(endpoint.sleep_times.values()), sleep_times))
+		return summary
+
+
+class MetricsReporter(threading.Thread):
+	""" Append snapshots of metrics as JSON lines to a file every 'interval' seconds, and once more when stopped. """
+	def __init__(self, file_name, metrics, interval=60.0):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.file_name = file_name
+		self.metrics = metrics
+		self.interval = interval
+		self.stopped = threading.Event()
+	
+	def write_snapshots(self):
+		with open(self.file_name, 'a') as fh:
+			for metrics in self.metrics:
+				fh.write(json.dumps(metrics.get_snapshot(), sort_keys=True) + "\n")
+	
+	def run(self):
+		while not self.stopped.wait(self.interval):
+			self.write_snapshots()
+	
+	def stop(self):
+		self.stopped.set()
+		self.join()
+		self.write_snapshots()
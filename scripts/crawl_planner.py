@@ -0,0 +1,47 @@
+import collections
+
+
+"""
+Crawl planning across the match lists of all players of a league.
+
+Players of a league share many games, so that fetching up to NBR_GAMES games per player,
+player by player, spends requests on games that cover one player when others would cover several.
+A crawl plan is built from all match lists at once instead, indexing games by id, and orders
+unique games by the number of tracked players in them, then by recency.
+"""
+RANKED_QUEUES = [4, 420, 42]	# RANKED_SOLO_5x5, TEAM_BUILDER_RANKED_SOLO, RANKED_TEAM_5x5
+
+
+def build_game_index(match_lists, queues=RANKED_QUEUES):
+	""" Map game id to [set of account ids of tracked players in game, timestamp], from MatchReferenceDto lists by account id. """
+	game_index = {}
+	for account_id, matches in match_lists.items():
+		for x in matches:
+			if x["queue"] not in queues:
+				continue
+			game_index.setdefault(x["gameId"], [set(), x["timestamp"]])[0].add(account_id)
+	return game_index
+
+
+def plan_games(match_lists, nbr_games, is_game_retrieved=None):
+	"""
+	Get ids of games to fetch, in order of priority: number of tracked players in game, then recency.
+	In this order, a game is planned if any of its players has fewer than 'nbr_games' games planned,
+	so that every player gets up to 'nbr_games' games, and a game shared by players counts for all of them.
+	Games for which 'is_game_retrieved' is True are skipped, but count for their players, so that resuming a crawl
+	plans only games missing from it.
+	"""
+	game_index = build_game_index(match_lists)
+	game_ids = sorted(game_index, key=lambda x: (len(game_index[x][0]), game_index[x][1]), reverse=True)
+	
+	nbr_player_games = collections.Counter()
+	plan = []
+	for game_id in game_ids:
+		players = game_index[game_id][0]
+		if is_game_retrieved is not None and is_game_retrieved(game_id):
+			nbr_player_games.update(players)
+			continue
+		if any(nbr_player_games[x] < nbr_games for x in players):
+			plan.append(game_id)
+			nbr_player_games.update(players)
+	return plan
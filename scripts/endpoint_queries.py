@@ -0,0 +1,478 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import extract_ranked_game_data as ex
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+
+"""
+Analytical queries over endpoint tables (e.g., challengers-endpoints-NA1-RANKED_SOLO_5x5-2017_06_23.csv),
+such as win rate by champion, by role and lane, or by region, and distributions of damage and gold.
+
+Endpoint CSV files are loaded once into typed columns of a NumPy array each:
+- ids (gameId, accountId) as int64
+- other numbers, and booleans (e.g., win), as float64, with "NA" as NaN, so that means are rates
+- strings (e.g., role, lane, and the region, taken from file names) as int32 codes into a list of values
+
+Files with different headers (e.g., older ones without gameId and champId) are loaded together, with
+missing columns as NA. Loaded tables can be saved as .npy files, and memory-mapped when loaded again,
+so that only files new since are parsed.
+
+Aggregates (count, sum, mean, std, min, max) by group-by columns are served from summary tables,
+which hold per-group counts, sums, sums of squares, minima, and maxima of every numeric column.
+A summary table is built by one pass over the columns on its first query, and is then updated
+with added rows only, so that repeated queries take time proportional to the number of groups.
+Summary tables are saved along with the table, so that they are built once across runs too.
+Quantiles and histograms are computed on sorted group indexes, built once per group-by columns.
+"""
+ID_COLUMNS = ["gameId", "accountId"]
+REGION_COLUMN = "region"
+VALID_STATS = ["count", "sum", "mean", "std", "min", "max"]
+TABLE_FORMAT = 1	# Version of layout of saved tables, bumped when it changes
+
+
+def get_region(file_name):
+	""" Get region from name of file written by the fetcher, e.g., challengers-endpoints-NA1-RANKED_SOLO_5x5-2017_06_23.csv """
+	parts = os.path.basename(file_name).split("-")
+	return parts[2] if len(parts) > 2 else "UNKNOWN"	# Not "NA", which stands for missing values
+
+
+def get_column_kind(column_name):
+	""" Get storage kind of a column: "id", "str", or "num". """
+	if column_name in ID_COLUMNS:
+		return "id"
+	if column_name == REGION_COLUMN or ex.get_endpoint_types().get(column_name) == "str":
+		return "str"
+	return "num"
+
+
+def parse_column(values, kind):
+	""" Convert CSV strings of a column into an array, or into [codes, distinct values] for strings. """
+	if kind == "str":
+		distinct_values = sorted(set(values))
+		value_codes = dict((x, i) for i, x in enumerate(distinct_values))
+		return [np.array([value_codes[x] for x in values], dtype=np.int32), distinct_values]
+	if kind == "id":
+		return np.array([int(x) if x != "NA" else -1 for x in values], dtype=np.int64)
+	try:
+		return np.array(values, dtype=np.float64)
+	except ValueError:
+		""" Booleans, or numbers with "NA" """
+		converted = {"True": 1.0, "False": 0.0, "NA": float("nan"), "": float("nan")}
+		return np.array([converted[x] if x in converted else float(x) for x in values], dtype=np.float64)
+
+
+def get_na_column(kind, nbr_rows):
+	if kind == "str":
+		return [np.zeros(nbr_rows, dtype=np.int32), ["NA"]]
+	if kind == "id":
+		return np.full(nbr_rows, -1, dtype=np.int64)
+	return np.full(nbr_rows, float("nan"), dtype=np.float64)
+
+
+class Summary(object):
+	"""
+	Per-group count, and per-group non-NA count, sum, sum of squares, min, and max of numeric columns,
+	for one tuple of group-by columns. Groups are keyed by tuples of values, in order of first appearance.
+	"""
+	def __init__(self, group_by, columns):
+		self.group_by = group_by
+		self.columns = columns
+		self.group_ids = {}	# Tuple of group values to index in arrays below
+		self.group_keys = []
+		self.counts = np.zeros(0, dtype=np.int64)
+		self.stats = dict((x, np.zeros((5, 0), dtype=np.float64)) for x in columns)	# Rows: non-NA count, sum, sum of squares, min, max
+	
+	def grow(self, nbr_groups):
+		nbr_new = nbr_groups - len(self.counts)
+		self.counts = np.concatenate([self.counts, np.zeros(nbr_new, dtype=np.int64)])
+		new_stats = np.zeros((5, nbr_new), dtype=np.float64)
+		new_stats[3] = np.inf
+		new_stats[4] = -np.inf
+		for column_name in self.columns:
+			self.stats[column_name] = np.concatenate([self.stats[column_name], new_stats], axis=1)
+	
+	def update(self, keys, group_codes, columns):
+		"""
+		Add rows, given as group codes into 'keys' (tuples of group values), and the arrays of
+		summarized columns for these rows.
+		"""
+		global_ids = np.empty(len(keys), dtype=np.intp)
+		for i, key in enumerate(keys):
+			if key not in self.group_ids:
+				self.group_ids[key] = len(self.group_keys)
+				self.group_keys.append(key)
+			global_ids[i] = self.group_ids[key]
+		if len(self.group_keys) > len(self.counts):
+			self.grow(len(self.group_keys))
+		
+		nbr_groups = len(keys)
+		group_counts = np.bincount(group_codes, minlength=nbr_groups)
+		self.counts[global_ids] += group_counts
+		
+		""" Minima and maxima are reduced over rows sorted by group, as ufunc.at is slow """
+		order = np.argsort(group_codes, kind='mergesort')
+		present = group_counts > 0
+		starts = np.concatenate([[0], np.cumsum(group_counts)[:-1]])[present]
+		present_ids = global_ids[present]
+		
+		for column_name in self.columns:
+			values = np.asarray(columns[column_name])
+			valid = ~np.isnan(values)
+			codes = group_codes[valid]
+			valid_values = values[valid]
+			
+			stats = self.stats[column_name]
+			stats[0, global_ids] += np.bincount(codes, minlength=nbr_groups)
+			stats[1, global_ids] += np.bincount(codes, weights=valid_values, minlength=nbr_groups)
+			stats[2, global_ids] += np.bincount(codes, weights=valid_values * valid_values, minlength=nbr_groups)
+			
+			sorted_values = values[order]
+			minima = np.fmin.reduceat(sorted_values, starts)	# NaN only for groups without values
+			maxima = np.fmax.reduceat(sorted_values, starts)
+			stats[3, present_ids] = np.fmin(stats[3, present_ids], minima)
+			stats[4, present_ids] = np.fmax(stats[4, present_ids], maxima)
+	
+	def get_stat(self, column_name, stat):
+		""" Get array of a statistic of a column by group, NaN for groups without values. """
+		if stat == "count":
+			return self.counts.astype(np.float64)
+		[nbr_values, sums, squares, minima, maxima] = self.stats[column_name]
+		with np.errstate(divide='ignore', invalid='ignore'):
+			if stat == "sum":
+				return sums
+			elif stat == "mean":
+				return sums / nbr_values
+			elif stat == "std":
+				means = sums / nbr_values
+				return np.sqrt(np.maximum(squares / nbr_values - means * means, 0.0))
+			elif stat == "min":
+				return np.where(nbr_values > 0, minima, np.nan)
+			else:
+				return np.where(nbr_values > 0, maxima, np.nan)
+
+
+class EndpointTable(object):
+	def __init__(self):
+		if np is None:
+			raise SystemExit("ERROR: numpy is required for endpoint queries. Exiting...")
+		
+		self.column_names = []
+		self.chunks = {}	# Column name to list of arrays, or of [codes, distinct values] for strings, one per loaded file
+		self.nbr_rows = 0
+		self.files = []		# [file name, size, mtime] of loaded files
+		
+		self.columns = {}	# Column name to array of all rows, or [codes, distinct values] for strings, built from chunks on demand
+		self.summaries = {}	# Tuple of group-by columns to Summary
+		self.saved_summaries = set()	# Tuples of group-by columns of summaries as last saved
+		self.group_indexes = {}	# Tuple of group-by columns to [keys, codes, order, offsets]
+	
+	def has_file(self, file_name):
+		stat = os.stat(file_name)
+		return [os.path.abspath(file_name), stat.st_size, int(stat.st_mtime)] in self.files
+	
+	def add_file(self, file_name):
+		""" Load an endpoint CSV file, with region taken from file name, and return number of rows added. """
+		with open(file_name, 'rb') as fh:
+			reader = csv.reader(fh)
+			header = next(reader)
+			rows = list(reader)
+		if not rows:
+			return 0
+		
+		values = dict(zip(header, zip(*rows)))
+		values[REGION_COLUMN] = [get_region(file_name)] * len(rows)
+		chunk = dict((x, parse_column(values[x], get_column_kind(x))) for x in header + [REGION_COLUMN])
+		
+		stat = os.stat(file_name)
+		self.add_chunk(chunk, len(rows))
+		self.files.append([os.path.abspath(file_name), stat.st_size, int(stat.st_mtime)])
+		return len(rows)
+	
+	def add_chunk(self, chunk, nbr_rows):
+		""" Add columns of new rows, filling columns missing either in them or in earlier rows with NA. """
+		for column_name in chunk:
+			if column_name not in self.chunks:
+				self.summaries = {}	# Summaries are built again with new columns
+				self.column_names.append(column_name)
+				kind = get_column_kind(column_name)
+				self.chunks[column_name] = [get_na_column(kind, self.nbr_rows)] if self.nbr_rows > 0 else []
+		for column_name in self.column_names:
+			if column_name not in chunk:
+				chunk[column_name] = get_na_column(get_column_kind(column_name), nbr_rows)
+			self.chunks[column_name].append(chunk[column_name])
+		
+		self.nbr_rows += nbr_rows
+		self.columns = {}
+		self.group_indexes = {}
+		for summary in self.summaries.values():
+			self.update_summary(summary, chunk, nbr_rows)
+	
+	def get_column(self, column_name):
+		""" Get array of all rows of a column, or [codes, distinct values] for strings, merging chunks once. """
+		if column_name not in self.chunks:
+			raise SystemExit("ERROR: Column " + column_name + " is not in endpoint data. Exiting...")
+		if column_name not in self.columns:
+			chunks = self.chunks[column_name]
+			if get_column_kind(column_name) == "str":
+				self.columns[column_name] = merge_codes(chunks)
+			else:
+				self.columns[column_name] = np.concatenate(chunks) if len(chunks) != 1 else chunks[0]
+			self.chunks[column_name] = [self.columns[column_name]]
+		return self.columns[column_name]
+	
+	def get_numeric_columns(self):
+		return [x for x in self.column_names if get_column_kind(x) == "num"]
+	
+	def update_summary(self, summary, chunk, nbr_rows):
+		[keys, group_codes] = get_groups(chunk, summary.group_by, nbr_rows)
+		summary.update(keys, group_codes, dict((x, chunk[x]) for x in summary.columns))
+	
+	def get_summary(self, group_by):
+		""" Get summary table of given group-by columns, building it with one pass over all rows on first use. """
+		group_by = tuple(group_by)
+		if group_by not in self.summaries:
+			summary = Summary(group_by, self.get_numeric_columns())
+			columns = dict((x, self.get_column(x)) for x in set(group_by) | set(summary.columns))
+			self.update_summary(summary, columns, self.nbr_rows)
+			self.summaries[group_by] = summary
+		return self.summaries[group_by]
+	
+	def aggregate(self, group_by, column_names, stats=("count", "mean")):
+		"""
+		Get rows of group values followed by each stat of each column, sorted by group values,
+		e.g., aggregate(["champId"], ["win"], ["count", "mean"]) for games and win rate by champion.
+		"""
+		summary = self.get_summary(group_by)
+		for column_name in column_names:
+			if column_name not in summary.columns:
+				raise SystemExit("ERROR: Column " + column_name + " is not numeric endpoint data. Exiting...")
+		values = [summary.get_stat(x, stat) for x in column_names for stat in stats if stat != "count"]
+		counts = summary.counts
+		rows = []
+		for key, group_id in sorted(summary.group_ids.items()):
+			row = list(key)
+			if "count" in stats:
+				row.append(int(counts[group_id]))
+			rows.append(row + [x[group_id] for x in values])
+		return rows
+	
+	def get_group_index(self, group_by):
+		""" Get [keys, group codes, row order by group, offsets of groups in row order] of given group-by columns. """
+		group_by = tuple(group_by)
+		if group_by not in self.group_indexes:
+			columns = dict((x, self.get_column(x)) for x in group_by)
+			[keys, group_codes] = get_groups(columns, group_by, self.nbr_rows)
+			order = np.argsort(group_codes, kind='mergesort')
+			offsets = np.concatenate([[0], np.cumsum(np.bincount(group_codes, minlength=len(keys)))])
+			self.group_indexes[group_by] = [keys, group_codes, order, offsets]
+		return self.group_indexes[group_by]
+	
+	def iter_group_values(self, column_name, group_by):
+		""" Stream (group values, non-NA values of a column) by group, sorted by group values. """
+		values = self.get_column(column_name)
+		if get_column_kind(column_name) != "num":
+			raise SystemExit("ERROR: Column " + column_name + " is not numeric endpoint data. Exiting...")
+		if not group_by:
+			yield [(), values[~np.isnan(values)]]
+			return
+		
+		[keys, group_codes, order, offsets] = self.get_group_index(group_by)
+		for key, group_id in sorted((x, i) for i, x in enumerate(keys)):
+			group_values = values[order[offsets[group_id]:offsets[group_id + 1]]]
+			yield [key, group_values[~np.isnan(group_values)]]
+	
+	def get_quantiles(self, column_name, quantiles, group_by=()):
+		""" Get rows of group values followed by given quantiles (between 0 and 1) of a column. """
+		rows = []
+		for key, values in self.iter_group_values(column_name, group_by):
+			rows.append(list(key) + (list(np.percentile(values, [x * 100 for x in quantiles])) if len(values) else [float("nan")] * len(quantiles)))
+		return rows
+	
+	def get_histogram(self, column_name, bins, group_by=()):
+		""" Get edges of 'bins' equal bins over the range of a column, and rows of group values followed by counts per bin. """
+		all_values = self.get_column(column_name)
+		all_values = all_values[~np.isnan(all_values)]
+		edges = np.histogram_bin_edges(all_values, bins) if hasattr(np, "histogram_bin_edges") else np.histogram(all_values, bins)[1]
+		rows = [list(key) + list(np.histogram(values, edges)[0]) for key, values in self.iter_group_values(column_name, group_by)]
+		return [list(edges), rows]
+	
+	def has_unsaved_summaries(self):
+		return set(self.summaries) != self.saved_summaries
+	
+	def save(self, path, columns=True):
+		"""
+		Save columns as .npy files unless 'columns' is False, e.g., if only summaries were built since
+		the table was saved, summaries as .npz files, and column names, loaded files, and group values
+		of summaries in meta.json.
+		"""
+		if not os.path.exists(path):
+			os.makedirs(path)
+		distinct_values = {}
+		for column_name in self.column_names:
+			column = self.get_column(column_name)
+			if get_column_kind(column_name) == "str":
+				[column, distinct_values[column_name]] = column
+			if columns:
+				np.save(os.path.join(path, column_name + ".npy"), column)
+		
+		summaries = []
+		for i, group_by in enumerate(sorted(self.summaries)):
+			summary = self.summaries[group_by]
+			file_name = "summary-%d.npz" % i
+			stats = np.array([summary.stats[x] for x in summary.columns]).reshape((len(summary.columns), 5, len(summary.counts)))
+			np.savez(os.path.join(path, file_name), counts=summary.counts, stats=stats)
+			summaries.append({"group_by": list(group_by), "columns": summary.columns, "keys": summary.group_keys, "file": file_name})
+		self.saved_summaries = set(self.summaries)
+		
+		meta = {"format": TABLE_FORMAT, "columns": self.column_names, "values": distinct_values, "nbr_rows": self.nbr_rows, "files": self.files, "summaries": summaries}
+		with open(os.path.join(path, "meta.json.tmp"), 'w') as fh:
+			json.dump(meta, fh)
+		os.rename(os.path.join(path, "meta.json.tmp"), os.path.join(path, "meta.json"))
+
+
+def merge_codes(chunks):
+	""" Merge [codes, distinct values] chunks of a string column into one, re-coding values. """
+	if len(chunks) == 1:
+		return chunks[0]
+	distinct_values = sorted(set(x for codes, values in chunks for x in values))
+	value_codes = dict((x, i) for i, x in enumerate(distinct_values))
+	codes = [np.array([value_codes[x] for x in values], dtype=np.int32)[chunk_codes] for chunk_codes, values in chunks]
+	return [np.concatenate(codes), distinct_values]
+
+
+def get_groups(columns, group_by, nbr_rows):
+	"""
+	Group rows by values of group-by columns, and return [keys, group codes], where keys are
+	tuples of group values, and group codes are indices of the keys of the rows.
+	"""
+	if not group_by:
+		return [[()], np.zeros(nbr_rows, dtype=np.intp)]
+	
+	combined = np.zeros(nbr_rows, dtype=np.int64)
+	levels = []
+	for column_name in group_by:
+		column = columns[column_name]
+		if get_column_kind(column_name) == "str":
+			[codes, distinct_values] = column
+			[unique_codes, inverse] = np.unique(codes, return_inverse=True)
+			levels.append([distinct_values[x] for x in unique_codes])
+		else:
+			if column.dtype.kind == 'f':
+				column = np.where(np.isnan(column), np.inf, column)	# One group of NA, as NaN differs from itself
+			[unique_values, inverse] = np.unique(column, return_inverse=True)
+			levels.append([x.item() if x != np.inf else "NA" for x in unique_values])
+		combined = combined * len(levels[-1]) + inverse
+	
+	[unique_combined, group_codes] = np.unique(combined, return_inverse=True)
+	keys = []
+	for value in unique_combined:
+		key = []
+		for level in reversed(levels):
+			key.append(level[value % len(level)])
+			value //= len(level)
+		keys.append(tuple(int(x) if isinstance(x, float) and x.is_integer() else x for x in reversed(key)))
+	return [keys, group_codes.astype(np.intp)]
+
+
+def load_table(path, mmap=True):
+	""" Load table saved with EndpointTable.save, memory-mapping its columns unless 'mmap' is False. """
+	table = EndpointTable()
+	with open(os.path.join(path, "meta.json"), 'r') as fh:
+		meta = json.load(fh)
+	if meta["format"] != TABLE_FORMAT:
+		raise SystemExit("ERROR: Saved endpoint table " + path + " has an outdated format. Exiting...")
+	
+	for column_name in meta["columns"]:
+		column_name = str(column_name)
+		column = np.load(os.path.join(path, column_name + ".npy"), mmap_mode='r' if mmap else None)
+		if get_column_kind(column_name) == "str":
+			column = [column, [str(x) for x in meta["values"][column_name]]]
+		table.column_names.append(column_name)
+		table.chunks[column_name] = [column]
+	table.nbr_rows = meta["nbr_rows"]
+	table.files = meta["files"]
+	
+	""" Summaries are updated in memory as rows are added, so their arrays are loaded, not memory-mapped """
+	for summary_meta in meta.get("summaries", []):
+		summary = Summary(tuple(str(x) for x in summary_meta["group_by"]), [str(x) for x in summary_meta["columns"]])
+		summary.group_keys = [tuple(str(x) if isinstance(x, unicode) else x for x in key) for key in summary_meta["keys"]]
+		summary.group_ids = dict((x, i) for i, x in enumerate(summary.group_keys))
+		arrays = np.load(os.path.join(path, summary_meta["file"]))
+		summary.counts = arrays["counts"]
+		summary.stats = dict(zip(summary.columns, arrays["stats"]))
+		table.summaries[summary.group_by] = summary
+	table.saved_summaries = set(table.summaries)
+	return table
+
+
+def load_tables(file_names, table_dir=None):
+	"""
+	Load endpoint CSV files into one table. With 'table_dir', the table saved there is loaded first,
+	only files not in it (by name, size, and mtime) are parsed, and the table is saved again if they added rows.
+	Summaries saved with the table are updated with added rows, see 'save_summaries'.
+	"""
+	if table_dir is not None and os.path.exists(os.path.join(table_dir, "meta.json")):
+		table = load_table(table_dir)
+	else:
+		table = EndpointTable()
+	
+	nbr_added = 0
+	for file_name in file_names:
+		if not table.has_file(file_name):
+			nbr_added += table.add_file(file_name)
+	
+	if table_dir is not None and nbr_added > 0:
+		table.save(table_dir)
+	return table
+
+
+def save_summaries(table, table_dir):
+	""" Save summaries built by queries since the table was loaded from 'table_dir', if saved there. """
+	if os.path.exists(os.path.join(table_dir, "meta.json")) and table.has_unsaved_summaries():
+		table.save(table_dir, columns=False)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Aggregate endpoint data in CSV files by group-by columns, e.g., win rate by champion")
+	parser.add_argument('-i', '--in-endpoint-file', type=str, dest='in_endpoint_files', nargs='+', default=["example_data/*-endpoints-*.csv"], help='Input files or glob patterns with match endpoint data in CSV (default = example_data/*-endpoints-*.csv)')
+	parser.add_argument('-T', '--table-dir', type=str, dest='table_dir', help='Provide path to directory of saved columns, memory-mapped, and updated with input files not in it')
+	parser.add_argument('-g', '--group-by', type=str, dest='group_by', nargs='+', default=[], help='Specify group-by columns, e.g., champId, role, lane, win, or region (default = none)')
+	parser.add_argument('-c', '--columns', type=str, dest='columns', nargs='+', default=["win"], help='Specify numeric columns to aggregate (default = win)')
+	parser.add_argument('-s', '--stats', type=str, dest='stats', nargs='+', default=["count", "mean"], choices=VALID_STATS, help='Specify aggregates (default = count mean)')
+	parser.add_argument('-Q', '--quantiles', type=float, dest='quantiles', nargs='+', help='Specify quantiles (between 0 and 1) of columns to get instead of aggregates')
+	parser.add_argument('-H', '--histogram', type=int, dest='histogram', help='Specify number of bins of histograms of columns to get instead of aggregates')
+	args = parser.parse_args()
+	
+	start = time.time()
+	table = load_tables(ex.get_file_names(args.in_endpoint_files), args.table_dir)
+	load_time = time.time() - start
+	
+	start = time.time()
+	writer = csv.writer(sys.stdout, lineterminator="\n")
+	if args.quantiles is not None:
+		for column_name in args.columns:
+			writer.writerow(args.group_by + [column_name + "_q" + str(x) for x in args.quantiles])
+			writer.writerows(table.get_quantiles(column_name, args.quantiles, args.group_by))
+	elif args.histogram is not None:
+		for column_name in args.columns:
+			[edges, rows] = table.get_histogram(column_name, args.histogram, args.group_by)
+			writer.writerow(args.group_by + [column_name + "_" + repr(x) for x in edges[:-1]])
+			writer.writerows(rows)
+	else:
+		writer.writerow(args.group_by + (["count"] if "count" in args.stats else []) +
+				[x + "_" + stat for x in args.columns for stat in args.stats if stat != "count"])
+		writer.writerows(table.aggregate(args.group_by, args.columns, args.stats))
+	query_time = time.time() - start
+	
+	if args.table_dir is not None:
+		save_summaries(table, args.table_dir)
+	
+	sys.stderr.write("INFO: %d rows from %d files loaded in %.3f sec, queried in %.3f sec\n" % (table.nbr_rows, len(table.files), load_time, query_time))
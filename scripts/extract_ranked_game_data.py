@@ -1,82 +1,245 @@
 import argparse
-import copy
-import json
-from io import StringIO
+import collections
+import glob
+import multiprocessing
+import os
+import table_sinks as ts
+import json_backend as jb
+import game_store as gs
+import static_data as sd
 
+try:
+	import numpy as np
+except ImportError:
+	np = None
 
-parser = argparse.ArgumentParser(description="Extract endpoint and/or timeline data from JSON files and dump into them into a CSV file")
-parser.add_argument('-i', '--in-timeline-file', type=str, dest='in_timeline_file', help='Input file with match timeline data in JSON')
-parser.add_argument('-e', '--in-endpoint-file', type=str, dest='in_endpoint_file', required=True, help='Input file with match endpoint data in JSON')
-parser.add_argument('-o', '--out-timeline-file', type=str, dest='out_timeline_file', help='Output file with match timeline data in CSV')
-parser.add_argument('-f', '--out-endpoint-file', type=str, dest='out_endpoint_file', required=True, help='Output file with match endpoint data in CSV')
-args = parser.parse_args()
 
+""" CSV header of match endpoint data """
+ENDPOINT_HEADER = [
+			### General
+			"gameId", "seasonId", "accountId",
+			"champId", "marksman", "role", "lane",
+			"totalScoreRank", "totalPlayerScore", "objectivePlayerScore", "combatPlayerScore",
+			"champLevel", "win", "assists", "deaths",
+			"goldEarned", "goldSpent",
+			### Offense
+			"totalDamageDealt", "physicalDamageDealt", "magicDamageDealt", "trueDamageDealt",
+			"totalDamageDealtToChampions", "physicalDamageDealtToChampions", "magicDamageDealtToChampions", "trueDamageDealtToChampions",
+			"largestCriticalStrike", "totalTimeCrowdControlDealt", "timeCCingOthers",
+			### Defense
+			"longestTimeSpentLiving", "damageSelfMitigated",
+			"totalDamageTaken", "physicalDamageTaken", "magicalDamageTaken", "trueDamageTaken",
+			"totalHeal", "totalUnitsHealed",
+			### Building damage
+			"turretKills", "inhibitorKills",
+			"damageDealtToTurrets", "damageDealtToObjectives",
+			### Creep score
+			"totalMinionsKilled", "neutralMinionsKilled", "neutralMinionsKilledTeamJungle", "neutralMinionsKilledEnemyJungle",
+			### Kills
+			"kills", "doubleKills", "tripleKills", "quadraKills", "pentaKills",
+			"largestMultiKill", "killingSprees", "largestKillingSpree",
+			### Vision
+			"visionScore", "wardsPlaced", "wardsKilled", "sightWardsBoughtInGame", "visionWardsBoughtInGame"
+			]
 
-IN_TIMELINE_FILE = args.in_timeline_file
-IN_ENDPOINT_FILE = args.in_endpoint_file
-OUT_TIMELINE_FILE = args.out_timeline_file
-OUT_ENDPOINT_FILE = args.out_endpoint_file
+""" CSV header of match timeline data """
+TIMELINE_HEADER = [
+			'gameId', 'gameDuration', 'timestamp',
+			'accountId', 'teamId', 'win',
+			'totalGold', 'currentGold', 'level', 'xp',
+			'minionsKilled', 'jungleMinionsKilled',
+			'positionX', 'positionY',
+			'championKills', 'assists', 'deaths',
+			'wardsPlaced', 'buildingKills', 'monsterKills',
+			'dragonKills', 'heraldKills', 'baronKills'
+			]
 
-if (IN_TIMELINE_FILE is None and OUT_TIMELINE_FILE is not None) or (IN_TIMELINE_FILE is not None and OUT_TIMELINE_FILE is None):
-		raise SystemExit("ERROR: Either input or output timeline data file is not provided")
+""" Top-level fields of MatchDto and MatchTimelineDto used by row builders, decoded in lazy JSON mode """
+ENDPOINT_FIELDS = ["seasonId", "gameDuration", "participantIdentities", "participants", "teams"]
+TIMELINE_FIELDS = ["frames"]
 
+""" Types of columns in columnar output, where other columns are integers """
+ENDPOINT_TYPES = {'marksman': "bool", 'role': "str", 'lane': "str", 'win': "bool"}
+TIMELINE_TYPES = {'win': "str"}
 
-"""
-Extract match endpoint data
-"""
-ENDPOINT_DATA = {}	# Final performance characteristics of each player for each game
-ACCOUNT_DATA = {}	# Account id
-TEAM_DATA = {}		# Team id
-DURATION_DATA = {}	# Game duration, "gameDuration" in MatchDto
-OUTCOME_DATA = {}	# Win, "win" in TeamStatsDto
+""" Champion static data, with marksmen being champions whose primary tag is Marksman """
+CHAMPIONS = sd.load_champions()
+MARKSMEN = CHAMPIONS.get_champions_with_primary_tag("Marksman")
 
-""" TODO: Take info from champion.json instead """
-MARKSMEN = set([22, 51, 42, 119, 81, 104, 202, 429, 96, 236, 21, 133, 15, 18, 29, 6, 110, 67])
+""" Columns of champion static data joined into endpoint rows by champion id (see static_data.COLUMN_NAMES) """
+CHAMP_COLUMNS = []
 
-""" Ignore duplicate game data """
-GAME_PLAYER_DATA = set()
 
-fh_endpoints = open(OUT_ENDPOINT_FILE, 'w')
+def set_champion_columns(column_names):
+	""" Join given columns of champion static data into endpoint rows, in processes started from then on. """
+	global CHAMP_COLUMNS
+	CHAMP_COLUMNS = list(column_names)
 
-fh_endpoints.write(",".join([
-				### General
-				"gameId", "seasonId", "accountId",
-				"champId", "marksman", "role", "lane",
-				"totalScoreRank", "totalPlayerScore", "objectivePlayerScore", "combatPlayerScore",
-				"champLevel", "win", "assists", "deaths",
-				"goldEarned", "goldSpent",
-				### Offense
-				"totalDamageDealt", "physicalDamageDealt", "magicDamageDealt", "trueDamageDealt",
-				"totalDamageDealtToChampions", "physicalDamageDealtToChampions", "magicDamageDealtToChampions", "trueDamageDealtToChampions",
-				"largestCriticalStrike", "totalTimeCrowdControlDealt", "timeCCingOthers",
-				### Defense
-				"longestTimeSpentLiving", "damageSelfMitigated",
-				"totalDamageTaken", "physicalDamageTaken", "magicalDamageTaken", "trueDamageTaken",
-				"totalHeal", "totalUnitsHealed",
-				### Building damage
-				"turretKills", "inhibitorKills",
-				"damageDealtToTurrets", "damageDealtToObjectives",
-				### Creep score
-				"totalMinionsKilled", "neutralMinionsKilled", "neutralMinionsKilledTeamJungle", "neutralMinionsKilledEnemyJungle",
-				### Kills
-				"kills", "doubleKills", "tripleKills", "quadraKills", "pentaKills",
-				"largestMultiKill", "killingSprees", "largestKillingSpree",
-				### Vision
-				"visionScore", "wardsPlaced", "wardsKilled", "sightWardsBoughtInGame", "visionWardsBoughtInGame"
-				]) + "\n")
 
-for game_id, json_str in [x.strip().split("\t") for x in open(IN_ENDPOINT_FILE, 'r')]:
+def get_endpoint_header():
+	return ENDPOINT_HEADER + CHAMP_COLUMNS
+
+
+def get_endpoint_types():
+	column_types = dict(ENDPOINT_TYPES)
+	column_types.update(sd.COLUMN_TYPES)
+	return column_types
+
+
+def iter_json_lines(file_name):
+	""" Stream (game id, JSON string) pairs from a file with 'id<TAB>JSON string' lines, one line at a time. """
+	with open(file_name, 'r') as fh:
+		for line in fh:
+			[game_id, json_str] = line.strip().split("\t")
+			yield [game_id, json_str]
+
+
+def index_json_lines(file_name):
+	""" Map game id to byte offset of its first line, without decoding any JSON string. """
+	index = {}
+	with open(file_name, 'rb') as fh:
+		offset = 0
+		for line in iter(fh.readline, ""):
+			game_id = line.split("\t", 1)[0]
+			if game_id not in index:
+				index[game_id] = offset
+			offset += len(line)
+	return index
+
+
+def iter_games(in_endpoint_file, in_timeline_file=None, games_seen=None):
+	"""
+	Stream games as (game id, endpoint JSON string, timeline JSON string or None), joining
+	match endpoint and timeline data by game id. Duplicate games are skipped, as are games
+	in 'games_seen', which is updated with the games streamed.
+	
+	The fetcher writes games in the same order to both files, so they are joined in lockstep,
+	holding one game in memory at a time. Only if the order differs is the timeline file indexed
+	by game id (byte offsets only), and read by random access from then on.
+	"""
+	if games_seen is None:
+		games_seen = set()	# Ignore duplicate game data
+	
+	fh_timelines = open(in_timeline_file, 'rb') if in_timeline_file is not None else None
+	timeline_index = None
+	
+	for game_id, endpoint_str in iter_json_lines(in_endpoint_file):
+		if game_id in games_seen:
+			continue
+		games_seen.add(game_id)
+		
+		timeline_str = None
+		if fh_timelines is not None and timeline_index is None:
+			line = fh_timelines.readline()
+			if line.split("\t", 1)[0] == game_id:
+				timeline_str = line.strip().split("\t")[1]
+			else:
+				timeline_index = index_json_lines(in_timeline_file)
+		
+		if timeline_index is not None and game_id in timeline_index:
+			fh_timelines.seek(timeline_index[game_id])
+			timeline_str = fh_timelines.readline().strip().split("\t")[1]
+		
+		yield [game_id, endpoint_str, timeline_str]
+	
+	if fh_timelines is not None:
+		fh_timelines.close()
+
+
+def get_game_key(game):
+	"""
+	Key of a game in the manifest of an output dataset: the game id, qualified by region for games
+	streamed with their region, e.g., from a game store, as games of different regions may share ids.
+	"""
+	if len(game) > 3 and game[3] is not None:
+		return "%s_%s" % (game[3], game[0])
+	return game[0]
+
+
+def pair_files(in_endpoint_files, in_timeline_files):
+	"""
+	Pair each endpoint file with the timeline file of the same name, with "endpoints" in place of
+	"timelines", as written by fetch_ranked_game_data.py. Exit if a file has no partner.
+	"""
+	if len(in_endpoint_files) != len(in_timeline_files):
+		raise SystemExit("ERROR: Numbers of input endpoint and timeline data files differ")
+	
+	timeline_files = {}
+	for in_timeline_file in in_timeline_files:
+		timeline_files[in_timeline_file.replace("timelines", "endpoints")] = in_timeline_file
+	
+	pairs = []
+	for in_endpoint_file in in_endpoint_files:
+		if in_endpoint_file not in timeline_files:
+			raise SystemExit("ERROR: No input timeline data file for endpoint data file %s" % in_endpoint_file)
+		pairs.append([in_endpoint_file, timeline_files.pop(in_endpoint_file)])
+	
+	if len(timeline_files) > 0:
+		raise SystemExit("ERROR: No input endpoint data file for timeline data file %s" % timeline_files.values()[0])
+	
+	return pairs
+
+
+def iter_games_from_files(in_endpoint_files, in_timeline_files=None, games_seen=None):
+	"""
+	Stream games of several pairs of endpoint and timeline files, e.g., of several dates and regions,
+	one pair after another. Files are paired by name, see 'pair_files', before any game is read. Games
+	are skipped as in 'iter_games', across all files.
+	"""
+	if games_seen is None:
+		games_seen = set()
+	
+	if in_timeline_files is not None:
+		pairs = pair_files(in_endpoint_files, in_timeline_files)
+	else:
+		pairs = [[x, None] for x in in_endpoint_files]
+	
+	def iter_pairs():
+		for in_endpoint_file, in_timeline_file in pairs:
+			for game in iter_games(in_endpoint_file, in_timeline_file, games_seen):
+				yield game
+	
+	return iter_pairs()
+
+
+def get_file_names(patterns):
+	""" Expand glob patterns into a sorted list of file names, keeping names matching no file as they are. """
+	file_names = set()
+	for pattern in patterns:
+		file_names.update(glob.glob(pattern) or [pattern])
+	return sorted(file_names)
+
+
+GAMES_PER_CHECKPOINT = 100	# Games extracted between additions to the manifest in incremental extraction
+
+
+def get_manifest_file(out_endpoint_file):
+	""" Manifest of an output dataset, listing keys of extracted games, one per line. """
+	return out_endpoint_file + ".manifest"
+
+
+def read_manifest(file_name):
+	""" Get keys of games already extracted, ignoring a last line cut short by a crash. """
+	if not os.path.exists(file_name):
+		return set()
+	with open(file_name, 'r') as fh:
+		return set(line.strip() for line in fh if line.endswith("\n"))
+
+
+def get_endpoint_rows(game_id, json_data):
 	"""
+	Get one row of final performance characteristics per player, and game info needed
+	for timeline rows, i.e., maps of participant id to account id and team id, game duration,
+	and map of team id to win.
+	
 	Participant ids (ranging from 1 to 10) are used in match timeline data 
 	instead of account id (unique player identifiers outside each game).
 	
 	Extract from the corresponding match endpoint data to find the mapping
 	between in-game participant ids and account ids/team ids/game duration/win.
 	"""
-	json_data = json.loads(json_str)
 	season_id = json_data["seasonId"]
 	
-	participant_endpoint_map = {}	# Dict within dict, game_id to player id to features
 	participant_account_map = {}	# Map participant id to account id
 	participant_team_map = {}	# Map participant id to team id
 	team_outcome_map = {}		# Map team id to win
@@ -87,6 +250,8 @@ for game_id, json_str in [x.strip().split("\t") for x in open(IN_ENDPOINT_FILE,
 		account_id = participant["player"]["accountId"]
 		participant_account_map[participant_id] = account_id
 	
+	rows = []
+	
 	list_participant_dto = json_data["participants"]
 	for participant in list_participant_dto:
 		participant_id = participant["participantId"]
@@ -99,85 +264,78 @@ for game_id, json_str in [x.strip().split("\t") for x in open(IN_ENDPOINT_FILE,
 		player_role = participant["timeline"]["role"]
 		player_lane = participant["timeline"]["lane"]
 		
-		game_player_id = "_".join([str(game_id), str(participant_id)])
-		if game_player_id in GAME_PLAYER_DATA:
-			continue
-		else:
-			GAME_PLAYER_DATA.add(game_player_id)
-		
-		fh_endpoints.write(",".join(str(x)
-					for x in [
-						### General
-						game_id,
-						season_id,
-						participant_account_map[participant_id],
-						champ_id,
-						marksman_bool,
-						player_role,
-						player_lane,
-						player_stats["totalScoreRank"],
-						player_stats["totalPlayerScore"],
-						player_stats["objectivePlayerScore"],
-						player_stats["combatPlayerScore"],
-						#player_stats["teamObjective"],
-						player_stats["champLevel"],
-						player_stats["win"],
-						player_stats["assists"],
-						player_stats["deaths"],
-						player_stats["goldEarned"],
-						player_stats["goldSpent"],
-						### Offense
-						player_stats["totalDamageDealt"],
-						player_stats["physicalDamageDealt"],
-						player_stats["magicDamageDealt"],
-						player_stats["trueDamageDealt"],
-						player_stats["totalDamageDealtToChampions"],
-						player_stats["physicalDamageDealtToChampions"],
-						player_stats["magicDamageDealtToChampions"],
-						player_stats["trueDamageDealtToChampions"],
-						player_stats["largestCriticalStrike"],
-						player_stats["totalTimeCrowdControlDealt"],
-						player_stats["timeCCingOthers"],
-						### Defense
-						player_stats["longestTimeSpentLiving"],
-						player_stats["damageSelfMitigated"],
-						player_stats["totalDamageTaken"],
-						player_stats["physicalDamageTaken"],
-						player_stats["magicalDamageTaken"],
-						player_stats["trueDamageTaken"],
-						player_stats["totalHeal"],
-						player_stats["totalUnitsHealed"],
-						### Building
-						#player_stats["firstTowerKill"],
-						#player_stats["firstTowerAssist"],
-						#player_stats["firstInhibitorKill"],
-						#player_stats["firstInhibitorAssist"],
-						player_stats["turretKills"],
-						player_stats["inhibitorKills"],
-						player_stats["damageDealtToTurrets"],
-						player_stats["damageDealtToObjectives"],
-						### Minions
-						player_stats["totalMinionsKilled"],
-						player_stats["neutralMinionsKilled"],
-						player_stats["neutralMinionsKilledTeamJungle"],
-						player_stats["neutralMinionsKilledEnemyJungle"],
-						### Kills
-						#player_stats["firstBloodKill"],
-						#player_stats["firstBloodAssist"],
-						player_stats["kills"],
-						player_stats["doubleKills"],
-						player_stats["tripleKills"],
-						player_stats["quadraKills"],
-						player_stats["pentaKills"],
-						player_stats["largestMultiKill"],
-						player_stats["killingSprees"],
-						player_stats["largestKillingSpree"],
-						player_stats["visionScore"],
-						player_stats["wardsPlaced"],
-						player_stats["wardsKilled"],
-						player_stats["sightWardsBoughtInGame"],
-						player_stats["visionWardsBoughtInGame"]
-						]) + "\n")
+		rows.append([
+				### General
+				game_id,
+				season_id,
+				participant_account_map[participant_id],
+				champ_id,
+				marksman_bool,
+				player_role,
+				player_lane,
+				player_stats["totalScoreRank"],
+				player_stats["totalPlayerScore"],
+				player_stats["objectivePlayerScore"],
+				player_stats["combatPlayerScore"],
+				#player_stats["teamObjective"],
+				player_stats["champLevel"],
+				player_stats["win"],
+				player_stats["assists"],
+				player_stats["deaths"],
+				player_stats["goldEarned"],
+				player_stats["goldSpent"],
+				### Offense
+				player_stats["totalDamageDealt"],
+				player_stats["physicalDamageDealt"],
+				player_stats["magicDamageDealt"],
+				player_stats["trueDamageDealt"],
+				player_stats["totalDamageDealtToChampions"],
+				player_stats["physicalDamageDealtToChampions"],
+				player_stats["magicDamageDealtToChampions"],
+				player_stats["trueDamageDealtToChampions"],
+				player_stats["largestCriticalStrike"],
+				player_stats["totalTimeCrowdControlDealt"],
+				player_stats["timeCCingOthers"],
+				### Defense
+				player_stats["longestTimeSpentLiving"],
+				player_stats["damageSelfMitigated"],
+				player_stats["totalDamageTaken"],
+				player_stats["physicalDamageTaken"],
+				player_stats["magicalDamageTaken"],
+				player_stats["trueDamageTaken"],
+				player_stats["totalHeal"],
+				player_stats["totalUnitsHealed"],
+				### Building
+				#player_stats["firstTowerKill"],
+				#player_stats["firstTowerAssist"],
+				#player_stats["firstInhibitorKill"],
+				#player_stats["firstInhibitorAssist"],
+				player_stats["turretKills"],
+				player_stats["inhibitorKills"],
+				player_stats["damageDealtToTurrets"],
+				player_stats["damageDealtToObjectives"],
+				### Minions
+				player_stats["totalMinionsKilled"],
+				player_stats["neutralMinionsKilled"],
+				player_stats["neutralMinionsKilledTeamJungle"],
+				player_stats["neutralMinionsKilledEnemyJungle"],
+				### Kills
+				#player_stats["firstBloodKill"],
+				#player_stats["firstBloodAssist"],
+				player_stats["kills"],
+				player_stats["doubleKills"],
+				player_stats["tripleKills"],
+				player_stats["quadraKills"],
+				player_stats["pentaKills"],
+				player_stats["largestMultiKill"],
+				player_stats["killingSprees"],
+				player_stats["largestKillingSpree"],
+				player_stats["visionScore"],
+				player_stats["wardsPlaced"],
+				player_stats["wardsKilled"],
+				player_stats["sightWardsBoughtInGame"],
+				player_stats["visionWardsBoughtInGame"]
+			] + CHAMPIONS.get_columns(champ_id, CHAMP_COLUMNS))
 	
 	list_team_stats_dto = json_data["teams"]
 	for team in list_team_stats_dto:
@@ -185,120 +343,327 @@ for game_id, json_str in [x.strip().split("\t") for x in open(IN_ENDPOINT_FILE,
 		win = team["win"]
 		team_outcome_map[team_id] = win
 	
-	ACCOUNT_DATA[game_id] = participant_account_map
-	TEAM_DATA[game_id] = participant_team_map
-	DURATION_DATA[game_id] = json_data["gameDuration"]
-	OUTCOME_DATA[game_id] = team_outcome_map
-
-fh_endpoints.close()
-
-
-"""
-Extract match timeline data
-"""
-if IN_TIMELINE_FILE is None or OUT_TIMELINE_FILE is None:
-	raise SystemExit()
-
-fh_timelines = open(OUT_TIMELINE_FILE, 'w')
-
-# Print header
-fh_timelines.write(",".join([
-				'gameId', 'gameDuration', 'timestamp',
-				'accountId', 'teamId', 'win',
-				'totalGold', 'currentGold', 'level', 'xp',
-				'minionsKilled', 'jungleMinionsKilled',
-				'positionX', 'positionY',
-				'championKills', 'assists', 'deaths',
-				'wardsPlaced', 'buildingKills', 'monsterKills',
-				'dragonKills', 'heraldKills', 'baronKills'
-				]) + "\n")
-
-for line in [x.strip() for x in open(IN_TIMELINE_FILE, 'r')]:
-	[game_id, json_str] = line.split("\t")
-	json_data = json.loads(json_str)
-	endpoint_data = ACCOUNT_DATA[game_id]
-	team_data = TEAM_DATA[game_id]
-	duration_data = DURATION_DATA[game_id]
-	outcome_data = OUTCOME_DATA[game_id]
-	
-	for frame in json_data["frames"]:
-		# Parse event data in dict, where key is participant id and value is count
-		# TODO: Figure out what creatorId = 0 means...
-		ini_key = range(0, 11)
-		ini_val = [0] * 11
-		
-		kills = {k:v for k,v in zip(ini_key, ini_val)}
-		assists = copy.copy(kills)
-		deaths = copy.copy(kills)
-		wards_placed = copy.copy(kills)
-		building_kills = copy.copy(kills)
-		monster_kills = copy.copy(kills)
-		dragon_kills = copy.copy(kills)
-		herald_kills = copy.copy(kills)
-		baron_kills = copy.copy(kills)
-		
+	game_info = [participant_account_map, participant_team_map, json_data["gameDuration"], team_outcome_map]
+	
+	return [rows, game_info]
+
+
+""" Per-frame event counters of each participant, in order of timeline CSV columns """
+[	KILLS, ASSISTS, DEATHS,
+	WARDS_PLACED, BUILDING_KILLS, MONSTER_KILLS,
+	DRAGON_KILLS, HERALD_KILLS, BARON_KILLS
+	] = range(9)
+NBR_COUNTERS = 9
+
+MONSTER_COUNTERS = {	"DRAGON": DRAGON_KILLS,
+			"RIFTHERALD": HERALD_KILLS,
+			"BARON_NASHOR": BARON_KILLS
+			}
+
+
+def get_event_indices(frames):
+	"""
+	Flatten events of all frames of a game into one list of counter indices, one per increment,
+	where index = (frame index * 11 + participant id) * NBR_COUNTERS + counter.
+	Participant id 0 (e.g., minions and turrets) is counted, but never written.
+	"""
+	indices = []
+	add = indices.append
+	
+	for frame_index, frame in enumerate(frames):
+		offset = frame_index * 11
 		for event in frame["events"]:
-			if event["type"] == "CHAMPION_KILL":
-				kills[event["killerId"]] += 1
-				deaths[event["victimId"]] += 1
-				
-				for i in event["assistingParticipantIds"]:
-					assists[i] += 1
-			elif event["type"] == "WARD_PLACED":
-				wards_placed[event["creatorId"]] += 1
-			elif event["type"] == "BUILDING_KILL":
-				building_kills[event["killerId"]] += 1
-				
-				# TODO: Check if this can be missing
-				for i in event["assistingParticipantIds"]:
-					building_kills[i] += 1
-			elif event["type"] == "ELITE_MONSTER_KILL":
+			event_type = event["type"]
+			if event_type == "CHAMPION_KILL":
+				add((offset + event["killerId"]) * NBR_COUNTERS + KILLS)
+				add((offset + event["victimId"]) * NBR_COUNTERS + DEATHS)
+				for i in event.get("assistingParticipantIds", ()):
+					add((offset + i) * NBR_COUNTERS + ASSISTS)
+			elif event_type == "WARD_PLACED":
+				# TODO: Figure out what creatorId = 0 means...
+				add((offset + event["creatorId"]) * NBR_COUNTERS + WARDS_PLACED)
+			elif event_type == "BUILDING_KILL":
+				add((offset + event["killerId"]) * NBR_COUNTERS + BUILDING_KILLS)
+				for i in event.get("assistingParticipantIds", ()):
+					add((offset + i) * NBR_COUNTERS + BUILDING_KILLS)
+			elif event_type == "ELITE_MONSTER_KILL":
 				# TODO: Add participants?
-				monster_kills[event["killerId"]] += 1
-				
-				if event["monsterType"] == "DRAGON":
-					dragon_kills[event["killerId"]] += 1
-				elif event["monsterType"] == "RIFTHERALD":
-					herald_kills[event["killerId"]] += 1
-				elif event["monsterType"] == "BARON_NASHOR":
-					baron_kills[event["killerId"]] += 1
-		
-		# Print game statistcs for each player in this frame interval
+				add((offset + event["killerId"]) * NBR_COUNTERS + MONSTER_KILLS)
+				if event["monsterType"] in MONSTER_COUNTERS:
+					add((offset + event["killerId"]) * NBR_COUNTERS + MONSTER_COUNTERS[event["monsterType"]])
+	
+	return indices
+
+
+def get_event_counts(frames):
+	"""
+	Count kills, assists, deaths, wards, buildings, and elite monsters of each participant in each frame,
+	returned as nested lists indexed by [frame index][participant id][counter].
+	All counters of a game are computed at once, with one NumPy pass if NumPy is available.
+	"""
+	indices = get_event_indices(frames)
+	size = len(frames) * 11 * NBR_COUNTERS
+	
+	if np is not None:
+		counts = np.bincount(np.array(indices, dtype=np.intp), minlength=size).reshape(len(frames), 11, NBR_COUNTERS)
+		return counts.tolist()
+	
+	counts = [0] * size
+	for index in indices:
+		counts[index] += 1
+	return [[counts[(f * 11 + p) * NBR_COUNTERS:(f * 11 + p + 1) * NBR_COUNTERS] for p in range(11)] for f in range(len(frames))]
+
+
+def get_timeline_rows(game_id, json_data, game_info):
+	""" Get one row of performance characteristics per player per frame, joined with game info from endpoint data. """
+	[participant_account_map, participant_team_map, game_duration, team_outcome_map] = game_info
+	
+	rows = []
+	
+	frames = json_data["frames"]
+	event_counts = get_event_counts(frames)
+	
+	for frame, frame_counts in zip(frames, event_counts):
+		# Game statistcs for each player in this frame interval
 		for player in range(1, 11):
 			player_data = frame["participantFrames"][str(player)]
 			player_id = player_data["participantId"]	# Should be equal to 'player'
 			
 			# Position data missing in last frame
 			# TODO: Check if this is true...
-			if "position" not in player_data.keys():
-				player_data["position"] = {"y": "NA", "x": "NA"}
+			position = player_data["position"] if "position" in player_data else {"y": "NA", "x": "NA"}
 			
-			fh_timelines.write(",".join(str(x)
-						for x in [
-								game_id,
-								duration_data,
-								frame["timestamp"],
-								endpoint_data[player_id],		# account id
-								team_data[player_id],			# team id
-								outcome_data[team_data[player_id]],
-								player_data["totalGold"],
-								player_data["currentGold"],
-								player_data["level"],
-								player_data["xp"],
-								player_data["minionsKilled"],
-								player_data["jungleMinionsKilled"],
-								player_data["position"]["x"],
-								player_data["position"]["y"],
-								kills[player_id],
-								assists[player_id],
-								deaths[player_id],
-								wards_placed[player_id],
-								building_kills[player_id],
-								monster_kills[player_id],
-								dragon_kills[player_id],
-								herald_kills[player_id],
-								baron_kills[player_id]
-								]) + "\n")
-
-fh_timelines.close()
+			rows.append([
+					game_id,
+					game_duration,
+					frame["timestamp"],
+					participant_account_map[player_id],	# account id
+					participant_team_map[player_id],	# team id
+					team_outcome_map[participant_team_map[player_id]],
+					player_data["totalGold"],
+					player_data["currentGold"],
+					player_data["level"],
+					player_data["xp"],
+					player_data["minionsKilled"],
+					player_data["jungleMinionsKilled"],
+					position["x"],
+					position["y"]
+					] + frame_counts[player_id])
+	
+	return rows
+
+
+def extract_game_data(game_id, endpoint_data, timeline_data=None, output_format="csv", timeline_format=None):
+	"""
+	Turn decoded endpoint data and timeline data (or None) of a game into rows, encoded for output format,
+	or for 'timeline_format' if given for timeline rows.
+	"""
+	[endpoint_rows, game_info] = get_endpoint_rows(game_id, endpoint_data)
+	
+	timeline_rows = None
+	if timeline_data is not None:
+		timeline_rows = ts.encode_rows(get_timeline_rows(game_id, timeline_data, game_info), timeline_format or output_format)
+	
+	return [ts.encode_rows(endpoint_rows, output_format), timeline_rows]
+
+
+def extract_game(game, output_format="csv", lazy_json=False, timeline_format=None):
+	"""
+	Turn a game from 'iter_games' into its endpoint rows and timeline rows (or None), encoded for output format.
+	If 'lazy_json', only fields used by the row builders are decoded.
+	"""
+	[game_id, endpoint_str, timeline_str] = game[:3]
+	
+	endpoint_data = jb.loads_fields(endpoint_str, ENDPOINT_FIELDS) if lazy_json else jb.loads(endpoint_str)
+	
+	timeline_data = None
+	if timeline_str is not None:
+		timeline_data = jb.loads_fields(timeline_str, TIMELINE_FIELDS) if lazy_json else jb.loads(timeline_str)
+	
+	return extract_game_data(game_id, endpoint_data, timeline_data, output_format, timeline_format)
+
+
+def extract_chunk(games, output_format="csv", lazy_json=False, timeline_format=None):
+	return [extract_game(game, output_format, lazy_json, timeline_format) for game in games]
+
 
+def iter_chunks(iterable, chunk_size):
+	chunk = []
+	for x in iterable:
+		chunk.append(x)
+		if len(chunk) >= chunk_size:
+			yield chunk
+			chunk = []
+	if chunk:
+		yield chunk
+
+
+def iter_extracted_games(games, workers=1, chunk_size=16, output_format="csv", lazy_json=False, timeline_format=None):
+	"""
+	Extract games in input order, in a pool of 'workers' processes if more than one.
+	Chunks of 'chunk_size' games are sent to the pool, with at most two chunks per worker
+	in flight, so that memory stays bounded and output is identical to the serial path.
+	Workers are terminated if the consumer stops early, e.g., on an error or KeyboardInterrupt.
+	"""
+	if workers <= 1:
+		for game in games:
+			yield extract_game(game, output_format, lazy_json, timeline_format)
+		return
+	
+	pool = multiprocessing.Pool(workers)
+	pending = collections.deque()
+	done = False
+	try:
+		for chunk in iter_chunks(games, chunk_size):
+			pending.append(pool.apply_async(extract_chunk, (chunk, output_format, lazy_json, timeline_format)))
+			while len(pending) >= 2 * workers:
+				for extracted_game in pending.popleft().get():
+					yield extracted_game
+		
+		while pending:
+			for extracted_game in pending.popleft().get():
+				yield extracted_game
+		done = True
+	finally:
+		if done:
+			pool.close()
+		else:
+			pool.terminate()
+		pool.join()
+
+
+def extract_games(in_endpoint_files, out_endpoint_file, in_timeline_files=None, out_timeline_file=None, workers=1, output_format="csv", lazy_json=False, games=None, incremental=False, timeline_format=None):
+	"""
+	Extract match endpoint data and, if given, match timeline data into output tables in one streaming pass,
+	decoding one game at a time, so that memory stays flat no matter how large the input files are.
+	Decoding and row building are CPU-bound, and can be spread over 'workers' processes.
+	Tables are written as CSV or, in row groups as games are processed, as columnar files (see table_sinks).
+	Timeline data are written in 'timeline_format' if given, e.g., as timeline tensors (see timeline_tensors).
+	JSON strings are decoded by the backend set in json_backend, lazily if 'lazy_json'.
+	Games are read from input files, unless given as an iterable like 'iter_games', e.g., from a game store.
+	
+	If 'incremental', only games missing from the manifest of the output dataset are extracted, and
+	appended to existing CSV tables. Keys of games (see 'get_game_key') are added to the manifest once their
+	rows are on disk, every GAMES_PER_CHECKPOINT games and when extraction ends or is interrupted, so that
+	a rerun does not append rows of games extracted before again.
+	"""
+	if isinstance(in_endpoint_files, basestring):
+		in_endpoint_files = [in_endpoint_files]
+	if isinstance(in_timeline_files, basestring):
+		in_timeline_files = [in_timeline_files]
+	
+	games_seen = set()
+	mode = 'w'
+	if incremental:
+		games_seen = read_manifest(get_manifest_file(out_endpoint_file))
+		if os.path.exists(out_endpoint_file):
+			mode = 'a'
+	
+	if games is None:
+		games = iter_games_from_files(in_endpoint_files, in_timeline_files, games_seen)
+	else:
+		games = (x for x in games if get_game_key(x) not in games_seen)
+	
+	endpoint_sink = ts.create_sink(out_endpoint_file, get_endpoint_header(), get_endpoint_types(), output_format, mode)
+	
+	timeline_sink = None
+	if out_timeline_file is not None:
+		timeline_mode = 'a' if mode == 'a' and os.path.exists(out_timeline_file) else 'w'
+		timeline_sink = ts.create_sink(out_timeline_file, TIMELINE_HEADER, TIMELINE_TYPES, timeline_format or output_format, timeline_mode)
+	
+	""" Record keys of games as they are sent for extraction, which yields games in the same order. """
+	game_ids = collections.deque()
+	def record_game_ids(games):
+		for game in games:
+			game_ids.append(get_game_key(game))
+			yield game
+	
+	fh_manifest = open(get_manifest_file(out_endpoint_file), 'a') if incremental else None
+	def checkpoint(checkpoint_game_ids):
+		""" Make rows written so far durable, and only then add ids of their games to the manifest. """
+		for sink in [endpoint_sink, timeline_sink]:
+			if sink is not None:
+				sink.sync()
+		fh_manifest.write("".join(x + "\n" for x in checkpoint_game_ids))
+		fh_manifest.flush()
+		os.fsync(fh_manifest.fileno())
+	
+	extracted_game_ids = []
+	nbr_checkpointed = 0
+	extracted_games = iter_extracted_games(record_game_ids(games), workers=workers, output_format=output_format, lazy_json=lazy_json, timeline_format=timeline_format)
+	try:
+		for endpoint_data, timeline_data in extracted_games:
+			endpoint_sink.write(endpoint_data)
+			if timeline_sink is not None and timeline_data is not None:
+				timeline_sink.write(timeline_data)
+			extracted_game_ids.append(game_ids.popleft())
+			
+			if incremental and len(extracted_game_ids) - nbr_checkpointed >= GAMES_PER_CHECKPOINT:
+				checkpoint(extracted_game_ids[nbr_checkpointed:])
+				nbr_checkpointed = len(extracted_game_ids)
+	finally:
+		extracted_games.close()	# Terminate workers at once on early exit
+		if incremental:
+			checkpoint(extracted_game_ids[nbr_checkpointed:])
+			fh_manifest.close()
+		
+		endpoint_sink.close()
+		if timeline_sink is not None:
+			timeline_sink.close()
+	
+	return extracted_game_ids
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Extract endpoint and/or timeline data from JSON files and dump into them into a CSV file")
+	parser.add_argument('-i', '--in-timeline-file', type=str, dest='in_timeline_files', nargs='+', help='Input files or glob patterns with match timeline data in JSON, paired with endpoint files of the same name with "endpoints" in place of "timelines"')
+	parser.add_argument('-e', '--in-endpoint-file', type=str, dest='in_endpoint_files', nargs='+', help='Input files or glob patterns with match endpoint data in JSON')
+	parser.add_argument('-S', '--in-store', type=str, dest='in_store', help='Input game store with match endpoint and timeline data, instead of input files')
+	parser.add_argument('-r', '--region', type=str, dest='region', help='Specify region of games read from game store (default = all regions)')
+	parser.add_argument('-o', '--out-timeline-file', type=str, dest='out_timeline_file', help='Output file with match timeline data in CSV')
+	parser.add_argument('-f', '--out-endpoint-file', type=str, dest='out_endpoint_file', required=True, help='Output file with match endpoint data in CSV')
+	parser.add_argument('-w', '--workers', type=int, dest='workers', default=1, help='Specify number of processes extracting games in parallel (default = 1)')
+	parser.add_argument('-j', '--json-backend', type=str, dest='json_backend', default='auto', choices=['auto'] + jb.get_backends(), help='Specify JSON parser (default = auto, i.e., fastest available)')
+	parser.add_argument('-z', '--lazy-json', dest='lazy_json', action='store_true', help='Decode only JSON fields used in output, lazily with simdjson')
+	parser.add_argument('-F', '--format', type=str, dest='output_format', default='csv', choices=ts.VALID_OUTPUT_FORMATS, help='Specify format of output files (default = csv)')
+	parser.add_argument('-t', '--timeline-format', type=str, dest='timeline_format', choices=ts.VALID_TIMELINE_FORMATS, help='Specify format of output timeline data, e.g., tensor for a directory of memory-mappable timeline tensors (default = format of output files)')
+	parser.add_argument('-c', '--champ-columns', type=str, dest='champ_columns', nargs='+', default=[], choices=sd.COLUMN_NAMES, help='Specify columns of champion static data added to endpoint data')
+	parser.add_argument('-a', '--incremental', dest='incremental', action='store_true', help='Extract only games not in the manifest of output files, appending them to CSV output files')
+	args = parser.parse_args()
+	
+	IN_TIMELINE_FILES = get_file_names(args.in_timeline_files) if args.in_timeline_files is not None else None
+	IN_ENDPOINT_FILES = get_file_names(args.in_endpoint_files) if args.in_endpoint_files is not None else None
+	OUT_TIMELINE_FILE = args.out_timeline_file
+	OUT_ENDPOINT_FILE = args.out_endpoint_file
+	IN_STORE = args.in_store
+	REGION = args.region
+	WORKERS = args.workers
+	OUTPUT_FORMAT = args.output_format
+	TIMELINE_FORMAT = args.timeline_format
+	LAZY_JSON = args.lazy_json
+	INCREMENTAL = args.incremental
+	
+	jb.set_backend(args.json_backend)
+	set_champion_columns(args.champ_columns)
+	
+	if IN_STORE is None and IN_ENDPOINT_FILES is None:
+		raise SystemExit("ERROR: Either input endpoint data file or input game store must be provided")
+	
+	if IN_STORE is None and ((IN_TIMELINE_FILES is None and OUT_TIMELINE_FILE is not None) or (IN_TIMELINE_FILES is not None and OUT_TIMELINE_FILE is None)):
+		raise SystemExit("ERROR: Either input or output timeline data file is not provided")
+	
+	if IN_TIMELINE_FILES is not None:
+		pair_files(IN_ENDPOINT_FILES, IN_TIMELINE_FILES)
+	
+	if INCREMENTAL and (OUTPUT_FORMAT != "csv" or TIMELINE_FORMAT not in [None, "csv", "tensor"]):
+		raise SystemExit("ERROR: Incremental extraction appends to CSV output files and timeline tensors only")
+	
+	if IN_STORE is not None:
+		store = gs.GameStore(IN_STORE)
+		games = store.iter_games(region=REGION, with_timeline=OUT_TIMELINE_FILE is not None)
+		game_ids = extract_games(None, OUT_ENDPOINT_FILE, None, OUT_TIMELINE_FILE, workers=WORKERS, output_format=OUTPUT_FORMAT, lazy_json=LAZY_JSON, games=games, incremental=INCREMENTAL, timeline_format=TIMELINE_FORMAT)
+		store.close()
+	else:
+		game_ids = extract_games(IN_ENDPOINT_FILES, OUT_ENDPOINT_FILE, IN_TIMELINE_FILES, OUT_TIMELINE_FILE, workers=WORKERS, output_format=OUTPUT_FORMAT, lazy_json=LAZY_JSON, incremental=INCREMENTAL, timeline_format=TIMELINE_FORMAT)
+	
+	print "INFO: Extracted " + str(len(game_ids)) + " games"
@@ -1,166 +1,168 @@
-import json
 import argparse
 import common_tools as ct
+import response_cache as rc
+import game_store as gs
+import matchlist_state as ms
+import summoner_store as ss
+import table_sinks as ts
+import region_crawler as cr
 
 
 """
-Basic workflow to get match data:
-1. Get list of Challenger/Master players
-2. Get 'account id' for each player by 'summoner name'
-3. Get match list for each player by 'account id'
-4. Get match endpoint data for each match by 'match id'
-5. Get also match timeline data for each match by 'match_id', if available
-6. Dump summoner, match list, endpoint, and timeline data into separate files
+Fetch match data of Challenger/Master players in one or more regions (see region_crawler for the workflow).
+The crawl itself is done by region_crawler.Crawl, which can also be run from other Python code.
 """
 
 
-parser = argparse.ArgumentParser(description="Fetch match data using Riot API for Challenger/Master games.")
-parser.add_argument('-l', '--league', type=ct.check_league_name, dest='league', default='CHALLENGER', help='Specify league to get data for (default = CHALLENGER)' )
-parser.add_argument('-r', '--region', type=ct.check_region_name, dest='region', required=True, help='Specify region (e.g., NA1, BR1, EUN1, KR, and OC1)')
-parser.add_argument('-q', '--queue-type', type=ct.check_queue_type, dest='queue_type', default='RANKED_SOLO_5x5', help='Specify queue type (default = RANKED_SOLO_5x5)')
-parser.add_argument('-m', '--max-requests-per-min', type=int, dest='max_requests_per_min', default=40, help='Specify max request per minute (default = 40 sec)')
-parser.add_argument('-n', '--nbr-players', type=int, dest='nbr_players', default=100, help='Specify number of players to get data for (default = 100)')
-parser.add_argument('-g', '--nbr-games', type=int, dest='nbr_games', default=20, help='Specify number of recent games to get data for (default = 20)')
-parser.add_argument('-y', '--get-timeline', dest='get_timeline', action='store_true', help='Retreve timeline data')
-parser.add_argument('-o', '--output-dir', type=str, dest='out_dir', default="data/", help='Provide path to output directory (default = data/)')
-parser.add_argument('-t', '--time-gap', type=int, dest='time_gap', default=3, help='Specify time between requests (default = 3 sec)')
-parser.add_argument('-d', '--debug', dest='debug', action='store_true', help='Switch on debug mode')
-args = parser.parse_args()
-
-
-LEAGUE = args.league
-REGION = args.region
-QUEUE_TYPE = args.queue_type
-NBR_PLAYERS = args.nbr_players
-NBR_GAMES = args.nbr_games
-GET_TIMELINE = args.get_timeline
-OUT_DIR = args.out_dir
-TIME_GAP = args.time_gap
-DEBUG = args.debug
-
-MAX_REQUESTS_PER_MIN = args.max_requests_per_min
-SLEEP_TIME = ct.get_sleep_time(MAX_REQUESTS_PER_MIN, time_gap=TIME_GAP)
-if DEBUG:
-	print "DEBUG: max requests per min is " + str(MAX_REQUESTS_PER_MIN)
-	print "DEBUG: sleep time is " + str(SLEEP_TIME)
-
-USER_API_KEY = ct.get_api_key()
-DATETIME = ct.get_formatted_date()
-
-URL_PREFIX = ct.get_url_prefix(REGION)
-URL_SUFFIX = ct.get_url_suffix(USER_API_KEY)
-
-def get_file_name(data_type):
-	return OUT_DIR + "-".join([LEAGUE, data_type, REGION, QUEUE_TYPE, DATETIME]) + ".json"
-
-
-OUT_FILE_SUMMONERS = get_file_name("summoners")
-OUT_FILE_MATCHLIST = get_file_name("matchlist")
-OUT_FILE_ENDPOINTS = get_file_name("endpoints")
-
-fh_summoners = open(OUT_FILE_SUMMONERS, 'w')
-fh_matchlist = open(OUT_FILE_MATCHLIST, 'w')
-fh_endpoints = open(OUT_FILE_ENDPOINTS, 'w')
-
-if GET_TIMELINE:
-	OUT_FILE_TIMELINES = get_file_name("timelines")
-	fh_timelines = open(OUT_FILE_TIMELINES, 'w')
-
-
-""" Keep track of ids of games for which data are already obtained in order to avoid getting duplicate data. """
-games_retrieved = set()
-
-
-""" Retrieve list of current players in specified league. """
-cmd_get_league_list_dto = ""
-if LEAGUE == "CHALLENGER":
-	cmd_get_league_list_dto = ct.get_challengers_by_queue(URL_PREFIX, URL_SUFFIX, QUEUE_TYPE)
-elif LEAGUE == "MASTER":
-	cmd_get_league_list_dto = ct.get_masters_by_queue(URL_PREFIX, URL_SUFFIX, QUEUE_TYPE)
-if DEBUG: print "DEBUG: " + cmd_get_league_list_dto
-
-
-[league_list_dto, league_list_str] = ct.get_json_data(cmd_get_league_list_dto, sleep_time=SLEEP_TIME)
-if league_list_dto is None:
-	msg = "ERROR: League list not available by given query parameters. Exiting..."
-	raise SystemExit(msg)
-
-
-entries_to_iter = len(league_list_dto["entries"]) if len(league_list_dto["entries"]) < NBR_PLAYERS else NBR_PLAYERS
-for league_item_dto in league_list_dto["entries"][:entries_to_iter]:
-	player_id = league_item_dto["playerOrTeamId"]
-	print "INFO: Getting data for player " + player_id
-	
-	""" Extract accountId from SummonerDTO for querying match history. """
-	account_id = None
-	
-	cmd_get_summoner_dto = ct.get_summoner_by_id(URL_PREFIX, URL_SUFFIX, player_id)
-	if DEBUG: print "DEBUG: " + cmd_get_summoner_dto
-	
-	[summoner_dto, summoner_str] = ct.get_json_data(cmd_get_summoner_dto, sleep_time=SLEEP_TIME)
-	if summoner_dto is None:
-		continue
-	else:
-		account_id = summoner_dto["accountId"]
-	
-	matches = None
-	
-	cmd_get_match_list_dto = ct.get_match_list_by_account_id(URL_PREFIX, URL_SUFFIX, account_id)
-	if DEBUG: print "DEBUG: " + cmd_get_match_list_dto
-	
-	[match_list_dto, match_list_str] = ct.get_json_data(cmd_get_match_list_dto, sleep_time=SLEEP_TIME)
-	if match_list_dto is None:
-		continue
-	else:
-		matches = match_list_dto["matches"]
-	
-	""" Store SummonerDTO and MatchListDTO separately. """
-	fh_summoners.write(str(account_id) + "\t" + summoner_str + "\n")
-	fh_matchlist.write(str(account_id) + "\t" + match_list_str + "\n")
-	
-	""" Get match endpoint and timeline data for NBR_GAMES games. """
-	matches_to_iter = len(matches) if len(matches) < NBR_GAMES else NBR_GAMES
-	matches_retrieved = 0
-	for match_reference_dto in matches:
-		""" Retrieve game data only if not yet retrieved. """
-		game_id = match_reference_dto["gameId"]
-		if game_id in games_retrieved: continue
-		
-		"""
-		Skip game unless it belongs to supported queue types:
-		1. RANKED_SOLO_5x5 (queueType=4) or 
-		2. TEAM_BUILDER_RANKED_SOLO (queueType=420) or
-		3. RANKED_TEAM_5x5 (queueType=42)
-		"""
-		queue = match_reference_dto["queue"]
-		if queue not in [4, 420, 42]: continue
-		
-		cmd_get_match_dto = ct.get_match_endpoint_by_match_id(URL_PREFIX, URL_SUFFIX, game_id)
-		if DEBUG: print "DEBUG: " + cmd_get_match_dto
-		[match_dto, match_str] = ct.get_json_data(cmd_get_match_dto, sleep_time=SLEEP_TIME)
-		
-		if GET_TIMELINE:
-			cmd_get_match_timeline_dto = ct.get_match_timeline_by_match_id(URL_PREFIX, URL_SUFFIX, game_id)
-			if DEBUG: print "DEBUG: " + cmd_get_match_timeline_dto
-			[match_timeline_dto, match_timeline_str] = ct.get_json_data(cmd_get_match_timeline_dto, sleep_time=SLEEP_TIME)
-			
-			if match_dto is not None and match_timeline_dto is not None:
-				fh_endpoints.write(str(game_id) + "\t" + match_str + "\n")
-				fh_timelines.write(str(game_id) + "\t" + match_timeline_str + "\n")
-				games_retrieved.add(game_id)
-				matches_retrieved += 1
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Fetch match data using Riot API for Challenger/Master games.")
+	parser.add_argument('-l', '--league', type=ct.check_league_name, dest='league', default='CHALLENGER', help='Specify league to get data for (default = CHALLENGER)' )
+	parser.add_argument('-r', '--region', type=ct.check_region_names, dest='regions', nargs='+', required=True, help='Specify one or more regions crawled in parallel (e.g., NA1, BR1, EUN1, KR, and OC1), or ALL')
+	parser.add_argument('-q', '--queue-type', type=ct.check_queue_type, dest='queue_type', default='RANKED_SOLO_5x5', help='Specify queue type (default = RANKED_SOLO_5x5)')
+	parser.add_argument('-m', '--max-requests-per-min', type=int, dest='max_requests_per_min', default=40, help='Specify max request per minute (default = 40 sec)')
+	parser.add_argument('-n', '--nbr-players', type=int, dest='nbr_players', default=100, help='Specify number of players to get data for (default = 100)')
+	parser.add_argument('-g', '--nbr-games', type=int, dest='nbr_games', default=20, help='Specify number of recent games to get data for (default = 20)')
+	parser.add_argument('-y', '--get-timeline', dest='get_timeline', action='store_true', help='Retreve timeline data')
+	parser.add_argument('-o', '--output-dir', type=str, dest='out_dir', default="data/", help='Provide path to output directory (default = data/)')
+	parser.add_argument('-t', '--time-gap', type=int, dest='time_gap', default=3, help='Specify base time to wait before retrying a request (default = 3 sec)')
+	parser.add_argument('-w', '--workers', type=int, dest='workers', default=1, help='Specify number of requests sent in parallel (default = 1)')
+	parser.add_argument('-R', '--rate-limits', type=ct.check_rate_limits, dest='rate_limits', help='Specify rate limits of API key as max_requests:period pairs (e.g., 20:1,100:120)')
+	parser.add_argument('-A', '--adaptive', dest='adaptive', action='store_true', help='Adapt number of requests in flight per region and method to latencies and 429/503 responses, up to WORKERS')
+	parser.add_argument('-c', '--cache-file', type=str, dest='cache_file', help='Provide path to on-disk cache of API responses, which is created if missing')
+	parser.add_argument('-s', '--cache-size', type=int, dest='cache_size', default=1024, help='Specify max size of cache in MB (default = 1024)')
+	parser.add_argument('-S', '--store', type=str, dest='store', help='Provide path to compressed game store, to which games are also written, and whose games are not fetched again')
+	parser.add_argument('-M', '--matchlist-state', type=str, dest='matchlist_state', help='Provide path to state file of newest match seen per player, so that only newer matches are requested')
+	parser.add_argument('-U', '--summoner-store', type=str, dest='summoner_store', help='Provide path to store of summoner and account ids, so that only unknown, renamed, or outdated summoners are requested')
+	parser.add_argument('-e', '--summoner-max-age', type=float, dest='summoner_max_age', default=30.0, help='Specify days after which summoners in summoner store are requested again (default = 30)')
+	parser.add_argument('-P', '--plan', dest='plan', action='store_true', help='Collect match lists of all players first, and fetch games shared by most players first, each game once')
+	parser.add_argument('-x', '--extract', dest='extract', action='store_true', help='Extract endpoint and timeline tables as games are fetched, as by extract_ranked_game_data.py')
+	parser.add_argument('-F', '--format', type=str, dest='output_format', default='csv', choices=ts.VALID_OUTPUT_FORMATS, help='Specify format of extracted tables (default = csv)')
+	parser.add_argument('-J', '--no-json', dest='no_json', action='store_true', help='Do not dump endpoint and timeline data into JSON files')
+	parser.add_argument('-T', '--metrics-file', type=str, dest='metrics_file', help='Provide path to file to which request metrics by region are appended as JSON lines')
+	parser.add_argument('-I', '--metrics-interval', type=float, dest='metrics_interval', default=60.0, help='Specify interval between request metrics in metrics file (default = 60 sec)')
+	parser.add_argument('-b', '--base-url', type=str, dest='base_url', help='Specify base URL of API with {region} placeholder, e.g., of riot_simulator.py (default = ' + ct.BASE_URL + ')')
+	parser.add_argument('-k', '--api-key-file', type=str, dest='api_key_file', default='API_KEY', help='Provide path to file containing API key (default = API_KEY)')
+	parser.add_argument('-u', '--resume', dest='resume', action='store_true', help='Resume crawl from its checkpoint journal, appending to its output files')
+	parser.add_argument('-D', '--date', type=str, dest='date', help='Specify date YYYY_MM_DD in output file names, e.g., of the crawl to resume (default = today)')
+	parser.add_argument('-d', '--debug', dest='debug', action='store_true', help='Switch on debug mode')
+	args = parser.parse_args(argv)
+	
+	regions = ct.VALID_REGION_NAMES if "ALL" in args.regions else sorted(set(args.regions))
+	rate_limits = args.rate_limits
+	max_requests_per_min = args.max_requests_per_min
+	sleep_time = ct.get_sleep_time(max_requests_per_min, time_gap=args.time_gap)
+	
+	"""
+	All requests to a region draw from one shared rate limiter, which enforces the limits of the API key.
+	Without explicit limits, fall back on max requests per minute, unless requests in flight are adapted,
+	in which case the rate is found from 429 responses and rate limit headers.
+	Sleep times after responses are decided by one shared scheduler from rate limit headers,
+	so there is no sleep after a successful request while rate budget remains.
+	"""
+	if rate_limits is None and not args.adaptive:
+		rate_limits = [(max_requests_per_min, 60)]
+	
+	"""
+	With extraction, games go through the row builders of the extractor as soon as they are fetched, from the decoded
+	JSON data, and out to tables next to the JSON files, which are then optional.
+	"""
+	if args.no_json and not args.extract and args.store is None:
+		raise SystemExit("ERROR: Endpoint and timeline data must be dumped into JSON files, a game store, or extracted tables")
+	
+	if args.extract and args.resume and args.output_format != "csv":
+		raise SystemExit("ERROR: Only CSV tables can be appended to when resuming a crawl")
+	
+	if args.debug:
+		print "DEBUG: regions are " + ", ".join(regions)
+		print "DEBUG: max requests per min is " + str(max_requests_per_min)
+		print "DEBUG: sleep time is " + str(sleep_time)
+		print "DEBUG: rate limits are " + str(rate_limits)
+		print "DEBUG: number of workers per region is " + str(args.workers)
+		print "DEBUG: adaptive concurrency is " + ("on" if args.adaptive else "off")
+		print "DEBUG: crawl plan is " + ("on" if args.plan else "off")
+	
+	api_key = ct.get_api_key(args.api_key_file)
+	
+	"""
+	Responses are cached on disk, so that reruns do not download data of finished matches again.
+	League lists and match lists expire after a short time (see response_cache.DEFAULT_TTLS).
+	The cache is shared by all regions.
+	"""
+	cache = None
+	if args.cache_file is not None:
+		cache = rc.ResponseCache(args.cache_file, max_size=args.cache_size * 1024 ** 2)
+	
+	"""
+	Games are also written to an indexed, compressed game store, if given, which dedupes games across runs.
+	"""
+	game_store = None
+	if args.store is not None:
+		game_store = gs.GameStore(args.store)
+	
+	"""
+	With a match list state, match lists of players seen by earlier crawls are requested from the newest match seen on,
+	instead of as full match history.
+	"""
+	matchlist_state = None
+	if args.matchlist_state is not None:
+		matchlist_state = ms.MatchlistState(args.matchlist_state)
+	
+	"""
+	With a summoner store, summoners of all league entries are resolved in bulk before players are crawled,
+	from the store if known, and by request otherwise. Summoners renamed since, or stored longer than the max age in days,
+	are requested again, and kept as stored if the request fails.
+	"""
+	summoner_store = None
+	if args.summoner_store is not None:
+		summoner_store = ss.SummonerStore(args.summoner_store)
+	
+	""" Crawl all regions at the same time, each in its own thread. """
+	crawl = cr.Crawl(regions, api_key, league=args.league, queue_type=args.queue_type, nbr_players=args.nbr_players,
+			nbr_games=args.nbr_games, get_timeline=args.get_timeline, out_dir=args.out_dir, date=args.date, workers=args.workers,
+			sleep_time=sleep_time, rate_limits=rate_limits, adaptive=args.adaptive, base_url=args.base_url, cache=cache,
+			game_store=game_store, matchlist_state=matchlist_state, summoner_store=summoner_store,
+			summoner_max_age=args.summoner_max_age, plan=args.plan, extract=args.extract, output_format=args.output_format,
+			no_json=args.no_json, resume=args.resume, metrics_file=args.metrics_file, metrics_interval=args.metrics_interval,
+			debug=args.debug)
+	crawl.run()
+	crawlers = crawl.crawlers
+	
+	""" Report progress and throughput by region and combined, with partial counts of failed crawls. """
+	for crawler in crawlers:
+		if crawler.error is not None:
+			print "ERROR: " + crawler.region + ": " + crawler.error
+			print "INFO: " + cr.get_report_line(crawler.region + " (incomplete)", crawler.nbr_players, crawler.nbr_games, crawler.client.nbr_requests, crawler.elapsed_time)
 		else:
-			if match_dto is not None:
-				fh_endpoints.write(str(game_id) + "\t" + match_str + "\n")
-				games_retrieved.add(game_id)
-				matches_retrieved += 1
-		
-		if matches_retrieved >= matches_to_iter:
-			break
-
+			print "INFO: " + cr.get_report_line(crawler.region, crawler.nbr_players, crawler.nbr_games, crawler.client.nbr_requests, crawler.elapsed_time)
+	
+	for crawler in crawlers:
+		for line in crawler.metrics.get_summary():
+			print "INFO: Metrics " + line
+	
+	if args.adaptive:
+		for crawler in crawlers:
+			for line in crawler.client.concurrency.get_summary():
+				print "INFO: Concurrency " + crawler.region + " " + line
+	
+	print "INFO: " + cr.get_report_line("Total", sum(x.nbr_players for x in crawlers), sum(x.nbr_games for x in crawlers), sum(x.client.nbr_requests for x in crawlers), crawl.elapsed_time)
+	
+	if game_store is not None:
+		game_store.close()
+	
+	if matchlist_state is not None:
+		matchlist_state.close()
+	
+	if summoner_store is not None:
+		summoner_store.close()
+	
+	if cache is not None:
+		for line in cache.get_summary():
+			print "INFO: Cache " + line
+		cache.close()
+	
+	if crawl.get_failed_regions():
+		raise SystemExit("ERROR: Crawl of " + ", ".join(crawl.get_failed_regions()) + " failed")
 
-fh_summoners.close()
-fh_matchlist.close()
-fh_endpoints.close()
-if GET_TIMELINE: fh_timelines.close()
 
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,223 @@
+import collections
+import os
+import sqlite3
+import threading
+import zlib
+import json_backend as jb
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+
+"""
+Append-only, block-compressed store of match endpoint and timeline JSON strings.
+
+A store is a directory with two files:
+- blocks.dat: compressed blocks appended one after another, each holding many JSON strings
+- index.sqlite: offset index of blocks, of JSON strings by region, game id, and data type,
+  and of games by account id
+
+Each game is stored once per region, however many times it is put. JSON strings are read by random
+access, decompressing only the block holding them. Blocks are compressed with zstd if the 'zstandard'
+module is available, and with zlib otherwise; the codec of each block is recorded in the index.
+"""
+BLOCK_SIZE = 4 * 1024 ** 2	# Uncompressed bytes per block
+
+
+def compress(data):
+	if zstandard is not None:
+		return ["zstd", zstandard.ZstdCompressor(level=3).compress(data)]
+	else:
+		return ["zlib", zlib.compress(data, 6)]
+
+
+def decompress(codec, data):
+	if codec == "zstd":
+		if zstandard is None:
+			raise SystemExit("ERROR: zstandard is required to read zstd blocks. Exiting...")
+		return zstandard.ZstdDecompressor().decompress(data)
+	else:
+		return zlib.decompress(data)
+
+
+def get_account_ids(endpoint_str):
+	""" Get account ids of players in MatchDto. """
+	json_data = jb.loads_fields(endpoint_str, ["participantIdentities"])
+	return [x["player"]["accountId"] for x in json_data.get("participantIdentities", []) if "player" in x]
+
+
+class GameStore(object):
+	def __init__(self, path, block_size=BLOCK_SIZE):
+		if not os.path.exists(path):
+			os.makedirs(path)
+		
+		self.block_size = block_size
+		self.lock = threading.RLock()
+		
+		self.db = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+		self.db.executescript("""
+			CREATE TABLE IF NOT EXISTS blocks (
+				block_id INTEGER PRIMARY KEY,
+				offset INTEGER,
+				size INTEGER,
+				codec TEXT);
+			CREATE TABLE IF NOT EXISTS records (
+				region TEXT,
+				game_id INTEGER,
+				data_type TEXT,
+				block_id INTEGER,
+				start INTEGER,
+				size INTEGER,
+				PRIMARY KEY (region, game_id, data_type));
+			CREATE TABLE IF NOT EXISTS accounts (
+				account_id INTEGER,
+				region TEXT,
+				game_id INTEGER,
+				PRIMARY KEY (account_id, region, game_id));
+			CREATE INDEX IF NOT EXISTS records_game_id ON records (game_id);
+			""")
+		self.db.commit()
+		
+		""" Blocks are appended at end of data file, after any bytes of a block not committed to index. """
+		self.fh = open(os.path.join(path, "blocks.dat"), 'ab+')
+		self.fh.seek(0, os.SEEK_END)
+		
+		self.pending = []		# [region, game_id, data_type, JSON string] of records in block being filled
+		self.pending_keys = {}		# (region, game_id, data_type) to index in pending
+		self.pending_accounts = []	# [account_id, region, game_id] of games in block being filled
+		self.pending_size = 0
+		
+		self.block_cache = collections.OrderedDict()	# Recently decompressed blocks, by block id
+	
+	def has_game(self, region, game_id, data_type="endpoint"):
+		with self.lock:
+			if (region, int(game_id), data_type) in self.pending_keys:
+				return True
+			row = self.db.execute("SELECT 1 FROM records WHERE region = ? AND game_id = ? AND data_type = ?",
+						(region, int(game_id), data_type)).fetchone()
+			return row is not None
+	
+	def put_game(self, region, game_id, endpoint_str, timeline_str=None, account_ids=None):
+		"""
+		Add endpoint and, if given, timeline JSON strings of a game, unless already stored.
+		Account ids are taken from endpoint data, unless given.
+		"""
+		game_id = int(game_id)
+		with self.lock:
+			if not self.has_game(region, game_id, "endpoint"):
+				if account_ids is None:
+					account_ids = get_account_ids(endpoint_str)
+				self.add_record(region, game_id, "endpoint", endpoint_str)
+				self.pending_accounts.extend([int(x), region, game_id] for x in account_ids)
+			
+			if timeline_str is not None and not self.has_game(region, game_id, "timeline"):
+				self.add_record(region, game_id, "timeline", timeline_str)
+			
+			if self.pending_size >= self.block_size:
+				self.flush()
+	
+	def add_record(self, region, game_id, data_type, json_str):
+		self.pending_keys[(region, game_id, data_type)] = len(self.pending)
+		self.pending.append([region, game_id, data_type, json_str])
+		self.pending_size += len(json_str)
+	
+	def flush(self):
+		""" Compress pending records into one block, append it to data file, and commit it to index. """
+		with self.lock:
+			if not self.pending:
+				return
+			
+			data = []
+			records = []
+			start = 0
+			for region, game_id, data_type, json_str in self.pending:
+				data.append(json_str)
+				records.append([region, game_id, data_type, start, len(json_str)])
+				start += len(json_str)
+			
+			[codec, block] = compress("".join(data))
+			self.fh.seek(0, os.SEEK_END)
+			offset = self.fh.tell()
+			self.fh.write(block)
+			self.fh.flush()
+			os.fsync(self.fh.fileno())
+			
+			cursor = self.db.execute("INSERT INTO blocks (offset, size, codec) VALUES (?, ?, ?)", (offset, len(block), codec))
+			block_id = cursor.lastrowid
+			self.db.executemany("INSERT OR IGNORE INTO records VALUES (?, ?, ?, ?, ?, ?)",
+						[[region, game_id, data_type, block_id, start, size] for region, game_id, data_type, start, size in records])
+			self.db.executemany("INSERT OR IGNORE INTO accounts VALUES (?, ?, ?)", self.pending_accounts)
+			self.db.commit()
+			
+			self.pending = []
+			self.pending_keys = {}
+			self.pending_accounts = []
+			self.pending_size = 0
+	
+	def read_block(self, block_id):
+		""" Decompress block, keeping a few recently read blocks in memory. """
+		if block_id in self.block_cache:
+			block = self.block_cache.pop(block_id)
+		else:
+			[offset, size, codec] = self.db.execute("SELECT offset, size, codec FROM blocks WHERE block_id = ?", (block_id,)).fetchone()
+			self.fh.seek(offset)
+			block = decompress(codec, self.fh.read(size))
+			if len(self.block_cache) >= 4:
+				self.block_cache.popitem(last=False)
+		self.block_cache[block_id] = block
+		return block
+	
+	def get(self, region, game_id, data_type="endpoint"):
+		""" Get JSON string of a game, or None if it is not stored. """
+		game_id = int(game_id)
+		with self.lock:
+			key = (region, game_id, data_type)
+			if key in self.pending_keys:
+				return self.pending[self.pending_keys[key]][3]
+			
+			row = self.db.execute("SELECT block_id, start, size FROM records WHERE region = ? AND game_id = ? AND data_type = ?", key).fetchone()
+			if row is None:
+				return None
+			
+			[block_id, start, size] = row
+			return self.read_block(block_id)[start:start + size]
+	
+	def get_games_by_account(self, account_id, region=None):
+		""" Get (region, game id) of stored games played by an account. """
+		with self.lock:
+			self.flush()
+			if region is None:
+				rows = self.db.execute("SELECT region, game_id FROM accounts WHERE account_id = ?", (int(account_id),))
+			else:
+				rows = self.db.execute("SELECT region, game_id FROM accounts WHERE account_id = ? AND region = ?", (int(account_id), region))
+			return [tuple(x) for x in rows.fetchall()]
+	
+	def get_game_ids(self, region=None, data_type="endpoint"):
+		""" Get (region, game id) of stored games, in storage order. """
+		with self.lock:
+			self.flush()
+			query = "SELECT region, game_id FROM records WHERE data_type = ?"
+			params = [data_type]
+			if region is not None:
+				query += " AND region = ?"
+				params.append(region)
+			return [tuple(x) for x in self.db.execute(query + " ORDER BY block_id, start", params).fetchall()]
+	
+	def iter_games(self, region=None, with_timeline=True):
+		"""
+		Stream games as (game id, endpoint JSON string, timeline JSON string or None, region), in storage
+		order, so that every block is decompressed about once. Each game is stored once per region, and
+		games of different regions may share ids, so games are told apart by region and id.
+		"""
+		for game_region, game_id in self.get_game_ids(region):
+			endpoint_str = self.get(game_region, game_id, "endpoint")
+			timeline_str = self.get(game_region, game_id, "timeline") if with_timeline else None
+			yield [str(game_id), endpoint_str, timeline_str, game_region]
+	
+	def close(self):
+		with self.lock:
+			self.flush()
+			self.fh.close()
+			self.db.close()
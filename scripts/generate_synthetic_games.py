@@ -0,0 +1,86 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import common_tools as ct
+import synthetic_games as sg
+
+
+"""
+Generate match endpoint and timeline data of synthetic games (see synthetic_games.py) at scale, in files
+of 'game id<TAB>JSON string' lines as written by fetch_ranked_game_data.py, e.g., to benchmark extraction.
+
+Games are deterministic by game id, so files of the same size, region, and number of events are
+identical across runs, and can be regenerated instead of being kept. Games are generated by
+worker processes in chunks, and written in order of game id.
+"""
+CHUNK_SIZE = 100	# Games per task of a worker process
+
+
+def get_file_names(out_dir, region, nbr_games):
+	""" Name files as by the fetcher, e.g., SYNTHETIC-endpoints-KR-RANKED_SOLO_5x5-10000.json """
+	return [os.path.join(out_dir, "SYNTHETIC-" + data_type + "-" + region + "-RANKED_SOLO_5x5-" + str(nbr_games) + ".json")
+			for data_type in ["endpoints", "timelines"]]
+
+
+def generate_game(task):
+	""" Get [game id, match endpoint JSON string, timeline JSON string or None] of a game. """
+	[region, game_id, nbr_events] = task
+	endpoint_str = json.dumps(sg.get_match(region, game_id), separators=(',', ':'))
+	timeline_str = json.dumps(sg.get_timeline(game_id, nbr_events), separators=(',', ':')) if nbr_events is not None else None
+	return [game_id, endpoint_str, timeline_str]
+
+
+def generate_games(out_dir, region, nbr_games, nbr_events=30, workers=1):
+	"""
+	Write endpoint and, unless 'nbr_events' is None, timeline files of 'nbr_games' games,
+	and return their file names and sizes in bytes.
+	"""
+	if not os.path.exists(out_dir):
+		os.makedirs(out_dir)
+	[endpoint_file, timeline_file] = get_file_names(out_dir, region, nbr_games)
+	
+	tasks = ([region, sg.GAME_ID_BASE + i, nbr_events] for i in xrange(nbr_games))
+	pool = multiprocessing.Pool(workers) if workers > 1 else None
+	games = pool.imap(generate_game, tasks, CHUNK_SIZE) if pool is not None else itertools.imap(generate_game, tasks)
+	
+	fh_endpoints = open(endpoint_file, 'w')
+	fh_timelines = open(timeline_file, 'w') if nbr_events is not None else None
+	try:
+		for i, [game_id, endpoint_str, timeline_str] in enumerate(games):
+			fh_endpoints.write(str(game_id) + "\t" + endpoint_str + "\n")
+			if fh_timelines is not None:
+				fh_timelines.write(str(game_id) + "\t" + timeline_str + "\n")
+			if (i + 1) % 10000 == 0:
+				print "INFO: Generated " + str(i + 1) + " games"
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+		fh_endpoints.close()
+		if fh_timelines is not None:
+			fh_timelines.close()
+	
+	file_names = [endpoint_file] + ([timeline_file] if nbr_events is not None else [])
+	return [[x, os.path.getsize(x)] for x in file_names]
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Generate match endpoint and timeline data of synthetic games in JSON files")
+	parser.add_argument('-n', '--nbr-games', type=int, dest='nbr_games', default=10000, help='Specify number of games (default = 10000)')
+	parser.add_argument('-r', '--region', type=ct.check_region_name, dest='region', default='KR', help='Specify region of games (default = KR)')
+	parser.add_argument('-v', '--nbr-events', type=int, dest='nbr_events', default=30, help='Specify mean number of events per timeline frame (default = 30)')
+	parser.add_argument('-E', '--endpoints-only', dest='endpoints_only', action='store_true', help='Generate endpoint data only, without timelines')
+	parser.add_argument('-o', '--output-dir', type=str, dest='out_dir', default="data/synthetic/", help='Provide path to output directory (default = data/synthetic/)')
+	parser.add_argument('-w', '--workers', type=int, dest='workers', default=1, help='Specify number of processes generating games in parallel (default = 1)')
+	args = parser.parse_args()
+	
+	start = time.time()
+	files = generate_games(args.out_dir, args.region, args.nbr_games, None if args.endpoints_only else args.nbr_events, args.workers)
+	elapsed_time = time.time() - start
+	
+	for file_name, size in files:
+		print "INFO: Wrote %s (%.1f MB)" % (file_name, size / 1e6)
+	print "INFO: Generated %d games in %.1f sec (%.1f games/sec)" % (args.nbr_games, elapsed_time, args.nbr_games / elapsed_time)
@@ -0,0 +1,83 @@
+import json
+
+
+"""
+Pluggable JSON decoding shared by the fetcher and the extractor.
+
+The fastest available parser is used, with the standard library as fallback.
+All parsers raise ValueError (or a subclass) on invalid JSON strings.
+"""
+BACKENDS = {'stdlib': json.loads}
+
+try:
+	import orjson
+	BACKENDS['orjson'] = orjson.loads
+except ImportError:
+	pass
+
+try:
+	import simdjson
+	BACKENDS['simdjson'] = simdjson.loads
+except ImportError:
+	simdjson = None
+
+try:
+	import ujson
+	BACKENDS['ujson'] = ujson.loads
+except ImportError:
+	pass
+
+try:
+	import simplejson
+	BACKENDS['simplejson'] = simplejson.loads
+except ImportError:
+	pass
+
+PREFERRED_BACKENDS = ['orjson', 'simdjson', 'ujson', 'simplejson', 'stdlib']
+
+backend = [x for x in PREFERRED_BACKENDS if x in BACKENDS][0]
+loads = BACKENDS[backend]
+
+
+def get_backends():
+	""" Get names of available backends, fastest first. """
+	return [x for x in PREFERRED_BACKENDS if x in BACKENDS]
+
+
+def set_backend(name):
+	""" Use given backend, or the fastest one if 'auto'. """
+	global backend, loads
+	if name == "auto":
+		name = get_backends()[0]
+	if name not in BACKENDS:
+		raise ValueError("JSON backend '" + name + "' is not available")
+	backend = name
+	loads = BACKENDS[name]
+
+
+def materialize(value):
+	""" Turn lazy simdjson object or array into dict or list. """
+	if hasattr(value, "as_dict"):
+		return value.as_dict()
+	elif hasattr(value, "as_list"):
+		return value.as_list()
+	else:
+		return value
+
+
+if simdjson is not None:
+	SIMDJSON_PARSER = simdjson.Parser()
+
+
+def loads_fields(json_str, fields):
+	"""
+	Decode only given top-level fields of a JSON object, into a dict missing all other fields.
+	With simdjson, the document is parsed lazily and only these fields are turned into Python objects.
+	Otherwise, the whole document is decoded by the current backend.
+	"""
+	if simdjson is not None and backend == "simdjson":
+		doc = SIMDJSON_PARSER.parse(json_str)
+		return dict((x, materialize(doc[x])) for x in fields if x in doc)
+	
+	json_data = loads(json_str)
+	return dict((x, json_data[x]) for x in fields if x in json_data)
@@ -0,0 +1,45 @@
+import sqlite3
+import threading
+
+
+"""
+Newest match seen per account, kept in a SQLite database across crawls.
+
+Repeat crawls of a league request only matches newer than the newest match seen,
+instead of the full match history of every player.
+"""
+
+
+class MatchlistState(object):
+	def __init__(self, path):
+		self.lock = threading.Lock()
+		self.db = sqlite3.connect(path, check_same_thread=False)
+		self.db.execute("""CREATE TABLE IF NOT EXISTS matchlists (
+					region TEXT,
+					account_id INTEGER,
+					timestamp INTEGER,
+					game_id INTEGER,
+					PRIMARY KEY (region, account_id))""")
+		self.db.commit()
+	
+	def get(self, region, account_id):
+		""" Get (timestamp, game id) of newest match seen for an account, or None if the account is new. """
+		with self.lock:
+			row = self.db.execute("SELECT timestamp, game_id FROM matchlists WHERE region = ? AND account_id = ?",
+						(region, int(account_id))).fetchone()
+		return tuple(row) if row is not None else None
+	
+	def put(self, region, account_id, last_match):
+		""" Record (timestamp, game id) of newest match seen for an account, unless a newer one is recorded. """
+		with self.lock:
+			row = self.db.execute("SELECT timestamp, game_id FROM matchlists WHERE region = ? AND account_id = ?",
+						(region, int(account_id))).fetchone()
+			if row is not None and tuple(row) >= tuple(last_match):
+				return
+			self.db.execute("INSERT OR REPLACE INTO matchlists VALUES (?, ?, ?, ?)",
+					(region, int(account_id), int(last_match[0]), int(last_match[1])))
+			self.db.commit()
+	
+	def close(self):
+		with self.lock:
+			self.db.close()
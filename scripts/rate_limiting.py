@@ -0,0 +1,218 @@
+import collections
+import random
+import threading
+import time
+
+
+"""
+Client-side enforcement of Riot API rate limits.
+
+Limits are given as a list of (max_requests, period_in_sec) pairs, in the same form as
+the 'X-App-Rate-Limit' response header (e.g., "20:1,100:120" for a development key).
+"""
+class RateLimiter(object):
+	"""
+	Token bucket shared by all threads issuing requests against the same rate budget.
+	
+	Each limit is a bucket holding 'max_requests' tokens. A request takes one token from
+	every bucket, and a token goes back into its bucket exactly 'period' seconds after it was
+	taken, so no window of 'period' seconds ever sees more than 'max_requests' requests.
+	"""
+	def __init__(self, limits):
+		self.limits = sorted(limits, key=lambda x: x[1])
+		self.spent = [collections.deque() for _ in self.limits]	# Times at which tokens were taken
+		self.lock = threading.Lock()
+	
+	def get_wait_time(self, now):
+		""" Return seconds until a token is available in every bucket. Caller holds the lock. """
+		wait_time = 0.0
+		for (max_requests, period), spent in zip(self.limits, self.spent):
+			while spent and spent[0] <= now - period:
+				spent.popleft()
+			if len(spent) >= max_requests:
+				wait_time = max(wait_time, spent[0] + period - now)
+		return wait_time
+	
+	def try_acquire(self):
+		""" Take a token from every bucket if a request may be sent now, and return 0, or return seconds until one may be. """
+		with self.lock:
+			now = time.time()
+			wait_time = self.get_wait_time(now)
+			if wait_time <= 0:
+				for spent in self.spent:
+					spent.append(now)
+			return wait_time
+	
+	def acquire(self):
+		""" Block until a request may be sent, and return the time spent waiting in seconds. """
+		waited = 0.0
+		while True:
+			wait_time = self.try_acquire()
+			if wait_time <= 0:
+				return waited
+			time.sleep(wait_time)
+			waited += wait_time
+
+
+def parse_rate_limit_header(value):
+	""" Parse rate limit header, e.g., "20:1,100:120", into a list of (count, period_in_sec) tuples. """
+	try:
+		return [tuple(int(x) for x in limit.split(":")) for limit in value.split(",") if limit]
+	except ValueError:
+		return []
+
+
+class BackoffScheduler(object):
+	"""
+	Decide how long to sleep after a response, based on its status code and headers.
+	
+	- 429: wait as long as 'Retry-After' says, or back off exponentially if it is missing.
+	- 5xx and network errors: back off exponentially with jitter, so that retries of parallel
+	  requests do not hit the server at the same time.
+	- 200: do not sleep, unless 'X-App-Rate-Limit-Count' or 'X-Method-Rate-Limit-Count' shows
+	  that a window of the app or method rate limit is used up, in which case wait until it ends.
+	
+	Windows of the Riot rate limits start with the first request counted in them, so the start of
+	each window is estimated from the time at which its count was 1. If that was missed, the
+	window is assumed to start now, which can only overestimate the wait.
+	"""
+	def __init__(self, base_time=1.0, max_time=120.0):
+		self.base_time = base_time	# Back-off time of first retry in seconds
+		self.max_time = max_time	# Upper bound of back-off time in seconds
+		self.window_starts = {}		# (scope, period) to estimated start of current window
+		self.lock = threading.Lock()
+	
+	def get_backoff_time(self, nbr_attempts):
+		""" Exponential back-off with jitter, between half and all of base_time * 2^(nbr_attempts - 1). """
+		backoff_time = min(self.max_time, self.base_time * 2 ** max(nbr_attempts - 1, 0))
+		return random.uniform(backoff_time / 2.0, backoff_time)
+	
+	def get_retry_time(self, resp_code, headers, nbr_attempts):
+		""" Return seconds to sleep before retrying a failed request. """
+		if resp_code == 429 and "retry-after" in headers:
+			try:
+				return max(float(headers["retry-after"]), 0.0)
+			except ValueError:
+				pass
+		return self.get_backoff_time(nbr_attempts)
+	
+	def get_success_time(self, headers, method=None):
+		""" Return seconds to sleep after a successful request, which is 0 while budget remains. """
+		now = time.time()
+		wait_time = 0.0
+		
+		with self.lock:
+			for scope, limit_header, count_header in [("app", "x-app-rate-limit", "x-app-rate-limit-count"),
+								(("method", method), "x-method-rate-limit", "x-method-rate-limit-count")]:
+				limits = dict((period, max_requests) for max_requests, period in parse_rate_limit_header(headers.get(limit_header, "")))
+				for count, period in parse_rate_limit_header(headers.get(count_header, "")):
+					key = (scope, period)
+					if count <= 1 or self.window_starts.get(key, 0) + period <= now:
+						self.window_starts[key] = now
+					
+					if period in limits and count >= limits[period]:
+						wait_time = max(wait_time, self.window_starts[key] + period - now)
+		
+		return wait_time
+
+
+class ConcurrencyController(object):
+	"""
+	Adaptive limit of requests in flight, with state of its own per key, e.g., (region host, API method),
+	tuned by additive increase and multiplicative decrease (AIMD) from the outcomes of requests.
+	
+	- Success with stable latency: the limit grows, by 1 per success until the first back-off (slow start,
+	  doubling the limit every round trip), and by 1 per limit successes from then on (1 per round trip).
+	- Success with latency above LATENCY_TOLERANCE times the baseline (the slowly decaying minimum of
+	  latencies seen): the limit is held, as the server or the network is queueing.
+	- 429 or 503: the limit is cut by DECREASE_FACTOR, once per round trip, as requests in flight
+	  at the time of a cut fail together and would otherwise collapse it to MIN_LIMIT.
+	- Other errors: the limit is held.
+	
+	The limit stays between MIN_LIMIT and 'max_limit', e.g., the number of threads sending requests.
+	"""
+	MIN_LIMIT = 1.0
+	DECREASE_FACTOR = 0.5
+	LATENCY_TOLERANCE = 2.0
+	LATENCY_SLACK = 0.005		# Seconds of latency above baseline always deemed stable, e.g., on a LAN
+	BASELINE_DRIFT = 0.01		# Rate at which baseline rises toward latencies above it
+	
+	def __init__(self, max_limit, initial_limit=1.0):
+		self.max_limit = float(max_limit)
+		self.initial_limit = min(float(initial_limit), self.max_limit)
+		self.states = {}	# Key to dict of 'limit', 'in_flight', 'baseline', 'slow_start', 'last_decrease', and counters
+		self.condition = threading.Condition()
+	
+	def get_state(self, key):
+		""" Caller holds the lock. """
+		if key not in self.states:
+			self.states[key] = {	'limit': self.initial_limit,
+						'in_flight': 0,
+						'baseline': None,
+						'slow_start': True,
+						'last_decrease': 0.0,
+						'nbr_increases': 0,
+						'nbr_decreases': 0,
+						'max_in_flight': 0
+						}
+		return self.states[key]
+	
+	def acquire(self, key):
+		""" Block until a request of given key may be sent, and return [start time, time spent waiting in seconds]. """
+		start = time.time()
+		with self.condition:
+			state = self.get_state(key)
+			while state['in_flight'] >= max(int(state['limit']), 1):
+				self.condition.wait()
+			state['in_flight'] += 1
+			state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+		now = time.time()
+		return [now, now - start]
+	
+	def try_acquire(self, key):
+		""" Take a slot of given key if one is free, and return start time, or None without waiting. """
+		with self.condition:
+			state = self.get_state(key)
+			if state['in_flight'] >= max(int(state['limit']), 1):
+				return None
+			state['in_flight'] += 1
+			state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+		return time.time()
+	
+	def release(self, key, start_time, resp_code, latency):
+		""" Record outcome of a request sent at 'start_time', and adapt the limit of its key. """
+		with self.condition:
+			state = self.get_state(key)
+			state['in_flight'] -= 1
+			
+			if resp_code in [429, 503]:
+				if start_time >= state['last_decrease']:
+					state['limit'] = max(self.MIN_LIMIT, state['limit'] * self.DECREASE_FACTOR)
+					state['slow_start'] = False
+					state['last_decrease'] = time.time()
+					state['nbr_decreases'] += 1
+			elif resp_code == 200:
+				baseline = state['baseline']
+				if baseline is None or latency < baseline:
+					state['baseline'] = latency
+				else:
+					state['baseline'] = baseline + self.BASELINE_DRIFT * (latency - baseline)
+				
+				if latency <= self.LATENCY_TOLERANCE * state['baseline'] + self.LATENCY_SLACK and state['limit'] < self.max_limit:
+					increase = 1.0 if state['slow_start'] else 1.0 / state['limit']
+					state['limit'] = min(self.max_limit, state['limit'] + increase)
+					state['nbr_increases'] += 1
+			
+			self.condition.notify_all()
+	
+	def get_limit(self, key):
+		with self.condition:
+			return self.get_state(key)['limit']
+	
+	def get_summary(self):
+		""" Summarize state by key, one line per key. """
+		with self.condition:
+			return ["%s: limit %.1f, max %d in flight, %d increases, %d decreases, baseline latency %s ms" % (
+					" ".join(str(x) for x in key), state['limit'], state['max_in_flight'], state['nbr_increases'], state['nbr_decreases'],
+					"%.0f" % (state['baseline'] * 1000) if state['baseline'] is not None else "NA")
+					for key, state in sorted(self.states.items())]
@@ -0,0 +1,493 @@
+import os
+import json
+import time
+import threading
+from multiprocessing.pool import ThreadPool
+import common_tools as ct
+import rate_limiting as rl
+import riot_client as cl
+import crawl_planner as cp
+import table_sinks as ts
+import extract_ranked_game_data as ex
+import crawl_metrics as cm
+
+
+"""
+Crawl of ranked game data, as run by fetch_ranked_game_data.py, importable by other Python code.
+
+Basic workflow to get match data in each region:
+1. Get list of Challenger/Master players
+2. Get 'account id' for each player by 'summoner name'
+3. Get match list for each player by 'account id'
+4. Get match endpoint data for each match by 'match id'
+5. Get also match timeline data for each match by 'match_id', if available
+6. Dump summoner, match list, endpoint, and timeline data into separate files
+
+Regions are crawled in parallel. Rate limits are enforced per region host,
+so every region has its own client (see riot_client), with its own rate limiter and scheduler.
+"""
+
+"""
+With a match list state, match lists of players seen by earlier crawls are requested from the newest match seen on,
+in pages of at most MATCHLIST_PAGE_SIZE matches, instead of as full match history.
+"""
+MATCHLIST_PAGE_SIZE = 100
+
+"""
+In planned crawls, games are written and checkpointed in batches of GAMES_PER_CHECKPOINT games,
+so that the game store gets blocks of many games.
+"""
+GAMES_PER_CHECKPOINT = 20
+
+
+class Crawl(object):
+	"""
+	Crawl of league players and their games in several regions at the same time, each by a RegionCrawler in a thread
+	of its own. Response cache, game store, match list state, and summoner store are shared by all regions, and are
+	opened and closed by the caller. Requests of a region are sent with up to 'workers' in flight, drawing from
+	a rate limiter of 'rate_limits' if given, and adapting their number to responses if 'adaptive'.
+	"""
+	def __init__(self, regions, api_key, league="CHALLENGER", queue_type="RANKED_SOLO_5x5", nbr_players=100, nbr_games=20,
+			get_timeline=False, out_dir="data/", date=None, workers=1, sleep_time=3, rate_limits=None, adaptive=False,
+			base_url=None, cache=None, game_store=None, matchlist_state=None, summoner_store=None, summoner_max_age=30.0,
+			plan=False, extract=False, output_format="csv", no_json=False, resume=False, metrics_file=None,
+			metrics_interval=60.0, debug=False):
+		self.api_key = api_key
+		self.league = league
+		self.queue_type = queue_type
+		self.nbr_players = nbr_players
+		self.nbr_games = nbr_games
+		self.get_timeline = get_timeline
+		self.out_dir = out_dir
+		self.date = date if date is not None else ct.get_formatted_date()	# In output file names
+		self.workers = workers
+		self.sleep_time = sleep_time
+		self.rate_limits = rate_limits
+		self.adaptive = adaptive
+		self.base_url = base_url
+		self.cache = cache
+		self.game_store = game_store
+		self.matchlist_state = matchlist_state
+		self.summoner_store = summoner_store
+		self.summoner_max_age = summoner_max_age	# Days
+		self.plan = plan
+		self.extract = extract
+		self.output_format = output_format
+		self.no_json = no_json
+		self.resume = resume
+		self.metrics_file = metrics_file
+		self.metrics_interval = metrics_interval
+		self.debug = debug
+		
+		self.crawlers = [RegionCrawler(self, region) for region in regions]
+		self.elapsed_time = 0.0
+	
+	def run(self):
+		"""
+		Crawl all regions, and close their clients. Request metrics are always collected, and written periodically
+		if a metrics file is given. Failures of regions are recorded in their crawlers (see RegionCrawler.run).
+		"""
+		start_time = time.time()
+		
+		reporter = None
+		if self.metrics_file is not None:
+			reporter = cm.MetricsReporter(self.metrics_file, [crawler.metrics for crawler in self.crawlers], interval=self.metrics_interval)
+			reporter.start()
+		
+		threads = [threading.Thread(target=crawler.run) for crawler in self.crawlers]
+		for thread in threads:
+			thread.daemon = True
+			thread.start()
+		for thread in threads:
+			while thread.is_alive():
+				thread.join(1)	# Keep main thread responsive to KeyboardInterrupt
+		
+		self.elapsed_time = time.time() - start_time
+		
+		for crawler in self.crawlers:
+			crawler.client.close()
+		
+		if reporter is not None:
+			reporter.stop()
+	
+	def get_failed_regions(self):
+		return [x.region for x in self.crawlers if x.error is not None]
+
+
+class RegionCrawler(object):
+	""" Crawl league players and their games in one region, with a rate budget of its own, and settings and stores of 'crawl'. """
+	def __init__(self, crawl, region):
+		self.crawl = crawl
+		self.region = region
+		self.metrics = cm.CrawlMetrics(region)
+		
+		""" All requests of the region are sent by one client, with up to 'workers' requests in flight. """
+		self.client = cl.RiotClient(region, self.crawl.api_key, base_url=self.crawl.base_url, max_in_flight=self.crawl.workers, sleep_time=self.crawl.sleep_time,
+						rate_limiter=rl.RateLimiter(self.crawl.rate_limits) if self.crawl.rate_limits is not None else None,
+						concurrency=rl.ConcurrencyController(self.crawl.workers) if self.crawl.adaptive else None,
+						cache=self.crawl.cache, metrics=self.metrics, debug=self.crawl.debug)
+		
+		""" 
+		Keep track of ids of games for which data are already obtained in order to avoid getting duplicate data.
+		Games being fetched by a worker are claimed, so that no other worker fetches them at the same time.
+		"""
+		self.games_retrieved = set()
+		self.players_retrieved = set()
+		self.summoners = {}	# Player id -> [account id, SummonerDTO string], if resolved in bulk
+		self.games_lock = threading.RLock()
+		
+		""" Progress of this run, for the final report. """
+		self.nbr_players = 0
+		self.nbr_games = 0
+		self.elapsed_time = 0.0
+		self.error = None
+	
+	def get_file_name(self, data_type, extension=".json"):
+		return self.crawl.out_dir + "-".join([self.crawl.league, data_type, self.region, self.crawl.queue_type, self.crawl.date]) + extension
+	
+	def open_files(self):
+		"""
+		Checkpoint journal records ids of players and games, once their data are written and flushed.
+		When resuming, output files are appended to, and finished players and games are skipped.
+		Games are also taken from output JSON files, which are written before the journal, e.g., for games
+		written just before a crash, or for crawls started before journaling, so that none is written twice.
+		"""
+		out_file_journal = self.get_file_name("journal", extension=".txt")
+		data_types = ["summoners", "matchlist"]
+		if not self.crawl.no_json:
+			data_types += ["endpoints"] + (["timelines"] if self.crawl.get_timeline else [])
+		out_files = [self.get_file_name(x) for x in data_types]
+		
+		table_types = []
+		if self.crawl.extract:
+			table_types = ["endpoints"] + (["timelines"] if self.crawl.get_timeline else [])
+		out_tables = [self.get_file_name(x, extension="." + self.crawl.output_format) for x in table_types]
+		
+		if self.crawl.resume:
+			for file_name in out_files + out_tables:
+				ct.truncate_partial_line(file_name)
+			
+			if os.path.exists(out_file_journal):
+				ct.truncate_partial_line(out_file_journal)
+				for line in open(out_file_journal, 'r'):
+					[data_type, data_id] = line.rstrip("\n").split("\t")
+					if data_type == "player":
+						self.players_retrieved.add(data_id)
+					elif data_type == "game":
+						self.games_retrieved.add(int(data_id))
+			
+			if not self.crawl.no_json:
+				game_ids = ct.get_json_lines_ids(self.get_file_name("endpoints"))
+				if self.crawl.get_timeline:
+					game_ids &= ct.get_json_lines_ids(self.get_file_name("timelines"))
+				self.games_retrieved.update(int(x) for x in game_ids)
+			
+			print "INFO: Resuming crawl of " + self.region + " with " + str(len(self.players_retrieved)) + " players and " + str(len(self.games_retrieved)) + " games retrieved"
+		
+		file_mode = 'a' if self.crawl.resume else 'w'
+		self.fh_journal = open(out_file_journal, file_mode)
+		self.fh_data = [open(file_name, file_mode) for file_name in out_files]
+		self.fh_json = dict(zip(data_types, self.fh_data))
+		
+		self.sinks = {}
+		for data_type, file_name in zip(table_types, out_tables):
+			[header, column_types] = [ex.get_endpoint_header(), ex.get_endpoint_types()] if data_type == "endpoints" else [ex.TIMELINE_HEADER, ex.TIMELINE_TYPES]
+			table_mode = 'a' if self.crawl.resume and os.path.exists(file_name) else 'w'
+			self.sinks[data_type] = ts.create_sink(file_name, header, column_types, self.crawl.output_format, table_mode)
+	
+	def close_files(self):
+		for fh in self.fh_data + [self.fh_journal]:
+			fh.close()
+		for sink in self.sinks.values():
+			sink.close()
+	
+	def is_game_retrieved(self, game_id):
+		""" Return True if a worker has retrieved or is retrieving the game, or it is in the game store. """
+		with self.games_lock:
+			if game_id in self.games_retrieved:
+				return True
+			return self.crawl.game_store is not None and self.crawl.game_store.has_game(self.region, game_id, "timeline" if self.crawl.get_timeline else "endpoint")
+	
+	def claim_game(self, game_id):
+		""" Return True if no other worker has retrieved or is retrieving the game, and it is not in the game store. """
+		with self.games_lock:
+			if self.is_game_retrieved(game_id):
+				return False
+			self.games_retrieved.add(game_id)
+			return True
+	
+	def release_game(self, game_id):
+		""" Let other workers retry a game for which data could not be retrieved. """
+		with self.games_lock:
+			self.games_retrieved.discard(game_id)
+	
+	def fetch_games(self, game_ids):
+		"""
+		Retrieve match endpoint data and, if requested, match timeline data for games, streamed by the client
+		in order of completion. Games for which data could not be retrieved are released for other workers to retry.
+		With extraction, rows of games are built from the decoded data as they come in.
+		"""
+		for game_id, match_dto, match_str, match_timeline_dto, match_timeline_str in self.client.iter_games(game_ids, self.crawl.get_timeline):
+			if match_dto is None or (self.crawl.get_timeline and match_timeline_dto is None):
+				self.release_game(game_id)
+				continue
+			
+			extracted_data = None
+			if self.crawl.extract:
+				extracted_data = ex.extract_game_data(str(game_id), match_dto, match_timeline_dto, self.crawl.output_format)
+			
+			yield [game_id, match_str, match_timeline_str, extracted_data]
+	
+	def fetch_match_list(self, account_id):
+		"""
+		Retrieve MatchlistDto of a player. For a player seen by earlier crawls, only matches newer than the newest match seen
+		are requested, page by page, and merged into one MatchlistDto. No newer match is found if the first page fails
+		(e.g., with code 404), in which case they are requested by the next crawl.
+		"""
+		last_match = self.crawl.matchlist_state.get(self.region, account_id) if self.crawl.matchlist_state is not None else None
+		if last_match is None:
+			return self.client.get_match_list(account_id)
+		
+		matches = []
+		begin_index = 0
+		while True:
+			[match_list_dto, match_list_str] = self.client.get_match_list(account_id, begin_time=last_match[0],
+											begin_index=begin_index, end_index=begin_index + MATCHLIST_PAGE_SIZE)
+			if match_list_dto is None:
+				if begin_index > 0:
+					return [None, None]
+				break
+			
+			page = match_list_dto["matches"]
+			matches.extend(x for x in page if (x["timestamp"], x["gameId"]) > last_match)
+			begin_index += len(page)
+			if len(page) < MATCHLIST_PAGE_SIZE or begin_index >= match_list_dto["totalGames"]:
+				break
+		
+		match_list_dto = {"matches": matches, "startIndex": 0, "endIndex": len(matches), "totalGames": len(matches)}
+		return [match_list_dto, json.dumps(match_list_dto)]
+	
+	def fetch_summoner(self, player_id):
+		""" Retrieve SummonerDTO of a player, and get [account id, SummonerDTO string], or [None, None] on failure. """
+		[summoner_dto, summoner_str] = self.client.get_summoner(player_id)
+		if summoner_dto is None:
+			return [None, None]
+		return [summoner_dto["accountId"], summoner_str]
+	
+	def resolve_summoners(self, entries, player_pool):
+		"""
+		Resolve summoners of all league entries at once from the summoner store, requesting only summoners unknown,
+		renamed since, or older than 'summoner_max_age' days, on the player pool. Summoners retrieved are recorded in one transaction.
+		"""
+		stored = self.crawl.summoner_store.get_many(self.region, [x["playerOrTeamId"] for x in entries])
+		min_updated = time.time() - self.crawl.summoner_max_age * 86400
+		
+		player_ids = []
+		for entry in entries:
+			player_id = entry["playerOrTeamId"]
+			summoner = stored.get(player_id)
+			if summoner is not None:
+				self.summoners[player_id] = [summoner[0], summoner[2]]
+			if summoner is None or summoner[3] < min_updated or summoner[1] != entry.get("playerOrTeamName", summoner[1]):
+				player_ids.append(player_id)
+		print "INFO: Resolved " + str(len(entries) - len(player_ids)) + " of " + str(len(entries)) + " summoners from summoner store in " + self.region
+		
+		retrieved = []
+		for player_id, [account_id, summoner_str] in zip(player_ids, player_pool.map(self.fetch_summoner, player_ids)):
+			if account_id is not None:
+				self.summoners[player_id] = [account_id, summoner_str]
+				retrieved.append([player_id, json.loads(summoner_str), summoner_str])
+		self.crawl.summoner_store.put_many(self.region, retrieved)
+	
+	def fetch_player_matches(self, league_item_dto):
+		""" Retrieve SummonerDTO and MatchListDTO of a player, with list of MatchReferenceDto and newest match in it. """
+		player_id = league_item_dto["playerOrTeamId"]
+		print "INFO: Getting data for player " + player_id + " in " + self.region
+		
+		""" Extract accountId from SummonerDTO for querying match history, unless resolved in bulk already. """
+		account_id = None
+		
+		if self.crawl.summoner_store is not None:
+			if player_id not in self.summoners:
+				return None
+			[account_id, summoner_str] = self.summoners[player_id]
+		else:
+			[account_id, summoner_str] = self.fetch_summoner(player_id)
+			if account_id is None:
+				return None
+		
+		matches = None
+		
+		[match_list_dto, match_list_str] = self.fetch_match_list(account_id)
+		if match_list_dto is None:
+			return None
+		else:
+			matches = match_list_dto["matches"]
+		
+		""" Newest match in match list, recorded once data of player are on disk. """
+		last_match = max([(x["timestamp"], x["gameId"]) for x in matches] or [None])
+		
+		return [player_id, account_id, summoner_str, match_list_str, matches, last_match]
+	
+	def fetch_player(self, league_item_dto):
+		"""
+		Retrieve SummonerDTO and MatchListDTO of a player, and data for up to 'nbr_games' games
+		not yet retrieved. Games are fetched in parallel by the client of the region.
+		"""
+		player_matches = self.fetch_player_matches(league_item_dto)
+		if player_matches is None:
+			return None
+		[player_id, account_id, summoner_str, match_list_str, matches, last_match] = player_matches
+		
+		"""
+		Skip game unless it belongs to supported queue types:
+		1. RANKED_SOLO_5x5 (queueType=4) or 
+		2. TEAM_BUILDER_RANKED_SOLO (queueType=420) or
+		3. RANKED_TEAM_5x5 (queueType=42)
+		"""
+		game_ids = [x["gameId"] for x in matches if x["queue"] in cp.RANKED_QUEUES]
+		
+		""" Get match endpoint and timeline data for 'nbr_games' games, claiming as many games as still needed at a time. """
+		matches_to_iter = len(matches) if len(matches) < self.crawl.nbr_games else self.crawl.nbr_games
+		games = []
+		while len(games) < matches_to_iter and game_ids:
+			batch = []
+			while len(batch) < matches_to_iter - len(games) and game_ids:
+				game_id = game_ids.pop(0)
+				if self.claim_game(game_id):
+					batch.append(game_id)
+			
+			games.extend(self.fetch_games(batch))
+		
+		return [player_id, account_id, summoner_str, match_list_str, games, last_match]
+	
+	def write_games(self, games):
+		""" Store match endpoint and timeline data and extracted rows, and checkpoint games only after their data are on disk. """
+		for game_id, match_str, match_timeline_str, extracted_data in games:
+			if "endpoints" in self.fh_json:
+				self.fh_json["endpoints"].write(str(game_id) + "\t" + match_str + "\n")
+			if "timelines" in self.fh_json:
+				self.fh_json["timelines"].write(str(game_id) + "\t" + match_timeline_str + "\n")
+			
+			if extracted_data is not None:
+				self.sinks["endpoints"].write(extracted_data[0])
+				if extracted_data[1] is not None:
+					self.sinks["timelines"].write(extracted_data[1])
+		
+		for fh in self.fh_data:
+			fh.flush()
+			os.fsync(fh.fileno())
+		for sink in self.sinks.values():
+			sink.sync()
+		
+		if self.crawl.game_store is not None:
+			for game_id, match_str, match_timeline_str, extracted_data in games:
+				self.crawl.game_store.put_game(self.region, game_id, match_str, match_timeline_str)
+			self.crawl.game_store.flush()
+		
+		for game in games:
+			self.fh_journal.write("game\t" + str(game[0]) + "\n")
+		self.fh_journal.flush()
+		
+		self.nbr_games += len(games)
+	
+	def write_player(self, player_data):
+		""" Store SummonerDTO and MatchListDTO separately, and checkpoint player and games only after their data are on disk. """
+		[player_id, account_id, summoner_str, match_list_str, games, last_match] = player_data
+		
+		self.fh_json["summoners"].write(str(account_id) + "\t" + summoner_str + "\n")
+		self.fh_json["matchlist"].write(str(account_id) + "\t" + match_list_str + "\n")
+		
+		self.write_games(games)
+		
+		self.fh_journal.write("player\t" + player_id + "\n")
+		self.fh_journal.flush()
+		
+		if self.crawl.matchlist_state is not None and last_match is not None:
+			self.crawl.matchlist_state.put(self.region, account_id, last_match)
+		
+		self.nbr_players += 1
+	
+	def crawl_planned(self, entries, player_pool):
+		"""
+		Retrieve SummonerDTO and MatchListDTO of all players first, checkpointing each player once written.
+		Then fetch games of the crawl plan (see crawl_planner), each game once, in order of priority, claiming games as they are requested.
+		When resuming, match lists of finished players are read back from the match list file.
+		"""
+		match_lists = {}
+		if self.crawl.resume:
+			for line in open(self.get_file_name("matchlist"), 'r'):
+				[account_id, match_list_str] = line.rstrip("\n").split("\t", 1)
+				match_lists[account_id] = json.loads(match_list_str)["matches"]
+		
+		for player_matches in player_pool.imap(self.fetch_player_matches, entries):
+			if player_matches is not None:
+				[player_id, account_id, summoner_str, match_list_str, matches, last_match] = player_matches
+				self.write_player([player_id, account_id, summoner_str, match_list_str, [], last_match])
+				match_lists[str(account_id)] = matches
+		
+		game_ids = cp.plan_games(match_lists, self.crawl.nbr_games, self.is_game_retrieved)
+		print "INFO: Planned " + str(len(game_ids)) + " games for " + str(len(match_lists)) + " players in " + self.region
+		
+		games = []
+		for game in self.fetch_games(x for x in game_ids if self.claim_game(x)):
+			games.append(game)
+			if len(games) >= GAMES_PER_CHECKPOINT:
+				self.write_games(games)
+				games = []
+		self.write_games(games)
+	
+	def run(self):
+		"""
+		Crawl region, and record error message instead of exiting if league list is not available, or
+		the crawl fails. Data written until then are kept, and files are always closed.
+		"""
+		start_time = time.time()
+		player_pool = None
+		files_open = False
+		try:
+			""" Retrieve list of current players in specified league. """
+			[league_list_dto, league_list_str] = self.client.get_league(self.crawl.league, self.crawl.queue_type)
+			if league_list_dto is None:
+				self.error = "League list not available by given query parameters"
+				print "ERROR: " + self.error + " in " + self.region + ". Skipping..."
+				return
+			
+			self.open_files()
+			files_open = True
+			
+			"""
+			Players are processed by a pool of threads, whose requests, games of players included, are all sent
+			by the client of the region, so that workers waiting for games never hold up the games themselves.
+			Data are written in league order.
+			"""
+			player_pool = ThreadPool(self.crawl.workers)
+			
+			entries_to_iter = len(league_list_dto["entries"]) if len(league_list_dto["entries"]) < self.crawl.nbr_players else self.crawl.nbr_players
+			entries = [x for x in league_list_dto["entries"][:entries_to_iter] if x["playerOrTeamId"] not in self.players_retrieved]
+			if self.crawl.summoner_store is not None:
+				self.resolve_summoners(entries, player_pool)
+			if self.crawl.plan:
+				self.crawl_planned(entries, player_pool)
+			else:
+				for player_data in player_pool.imap(self.fetch_player, entries):
+					if player_data is not None:
+						self.write_player(player_data)
+			
+			player_pool.close()
+		except Exception as e:
+			self.error = "Crawl failed: " + (str(e) or e.__class__.__name__)
+			print "ERROR: " + self.error + " in " + self.region + ". Stopping..."
+			if player_pool is not None:
+				player_pool.terminate()
+		finally:
+			if files_open:
+				self.close_files()
+			self.elapsed_time = time.time() - start_time
+
+
+def get_report_line(name, nbr_players, nbr_games, nbr_requests, elapsed_time):
+	""" Format progress and throughput of a crawl. """
+	elapsed_min = max(elapsed_time, 1e-6) / 60.0
+	return "%s: %d players, %d games, %d requests in %.1f sec (%.1f games/min, %.1f requests/min)" % (
+		name, nbr_players, nbr_games, nbr_requests, elapsed_time, nbr_games / elapsed_min, nbr_requests / elapsed_min)
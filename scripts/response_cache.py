@@ -0,0 +1,137 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+
+"""
+On-disk cache of Riot API responses, stored zlib-compressed in a SQLite database.
+
+Responses are keyed by a hash of the request URL without the API key, so that cached
+data survive a change of key. Every endpoint type has its own time to live in seconds,
+where None means that a response never expires (e.g., data of a finished match).
+"""
+DEFAULT_TTLS = {	'league': 3600,
+			'summoner': 86400,
+			'matchlist': 3600,
+			'match': None,
+			'timeline': None,
+			'other': 0
+			}
+ACCESS_BATCH_SIZE = 1000	# Cache hits whose access times are written in one transaction
+
+
+def get_cache_key(api_cmd):
+	""" Hash request URL without API key. """
+	url = re.sub(r"api_key=[^&]*&?", "", api_cmd).rstrip("?&")
+	return hashlib.sha1(url).hexdigest()
+
+
+class ResponseCache(object):
+	"""
+	Size-bounded cache of JSON strings returned by the Riot API.
+	When the total size of compressed responses exceeds 'max_size' bytes,
+	the least recently used responses are evicted.
+	
+	Access times of cache hits are kept in memory, and written in one transaction every ACCESS_BATCH_SIZE
+	hits, before evictions, and on close, so that hits do not commit, i.e., sync to disk, one by one.
+	"""
+	def __init__(self, path, max_size=1024 ** 3, ttls=None):
+		self.max_size = max_size
+		self.ttls = dict(DEFAULT_TTLS)
+		self.ttls.update(ttls or {})
+		self.hits = {}		# Endpoint type to number of cache hits
+		self.misses = {}	# Endpoint type to number of cache misses
+		self.accessed = {}	# Key to access time of hits not written yet
+		self.lock = threading.Lock()
+		
+		self.db = sqlite3.connect(path, check_same_thread=False)
+		self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+					key TEXT PRIMARY KEY,
+					endpoint_type TEXT,
+					created REAL,
+					accessed REAL,
+					size INTEGER,
+					body BLOB)""")
+		self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+		self.db.commit()
+		self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+	
+	def is_cacheable(self, endpoint_type):
+		""" Responses with time to live of 0 are never cached. """
+		return self.ttls.get(endpoint_type, 0) != 0
+	
+	def get(self, api_cmd, endpoint_type):
+		""" Return cached JSON string of request, or None if it is not cached or has expired. """
+		if not self.is_cacheable(endpoint_type):
+			return None
+		
+		key = get_cache_key(api_cmd)
+		ttl = self.ttls[endpoint_type]
+		now = time.time()
+		
+		with self.lock:
+			row = self.db.execute("SELECT created, body FROM responses WHERE key = ?", (key,)).fetchone()
+			if row is None or (ttl is not None and row[0] + ttl < now):
+				self.misses[endpoint_type] = self.misses.get(endpoint_type, 0) + 1
+				return None
+			
+			self.accessed[key] = now
+			if len(self.accessed) >= ACCESS_BATCH_SIZE:
+				self.write_accessed()
+				self.db.commit()
+			self.hits[endpoint_type] = self.hits.get(endpoint_type, 0) + 1
+		
+		return zlib.decompress(row[1])
+	
+	def put(self, api_cmd, endpoint_type, json_str):
+		""" Store JSON string of request, and evict least recently used responses if cache is full. """
+		if not self.is_cacheable(endpoint_type):
+			return
+		
+		key = get_cache_key(api_cmd)
+		body = zlib.compress(json_str)
+		if len(body) > self.max_size:
+			return
+		now = time.time()
+		
+		with self.lock:
+			row = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+			if row is not None:
+				self.size -= row[0]
+			
+			self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+					(key, endpoint_type, now, now, len(body), sqlite3.Binary(body)))
+			self.accessed.pop(key, None)
+			self.size += len(body)
+			
+			if self.size > self.max_size:
+				self.write_accessed()	# Least recently used responses are found by access times
+			while self.size > self.max_size:
+				[lru_key, lru_size] = self.db.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 1").fetchone()
+				self.db.execute("DELETE FROM responses WHERE key = ?", (lru_key,))
+				self.size -= lru_size
+			
+			self.db.commit()
+	
+	def write_accessed(self):
+		""" Write access times of hits kept in memory, in the current transaction. Called with lock held. """
+		self.db.executemany("UPDATE responses SET accessed = ? WHERE key = ?", [(x, y) for y, x in self.accessed.items()])
+		self.accessed = {}
+	
+	def get_summary(self):
+		""" Summarize cache hits and misses by endpoint type. """
+		summary = []
+		for endpoint_type in sorted(set(self.hits.keys() + self.misses.keys())):
+			hits = self.hits.get(endpoint_type, 0)
+			misses = self.misses.get(endpoint_type, 0)
+			summary.append(endpoint_type + ": " + str(hits) + " hits, " + str(misses) + " misses")
+		return summary
+	
+	def close(self):
+		with self.lock:
+			self.write_accessed()
+			self.db.commit()
+			self.db.close()
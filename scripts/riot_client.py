@@ -0,0 +1,407 @@
+import collections
+import errno
+import fcntl
+import heapq
+import os
+import pycurl
+import select
+import threading
+import time
+import Queue
+import common_tools as ct
+from StringIO import StringIO
+
+
+"""
+Importable client of the Riot API for one region, e.g., to embed crawls in other services:
+
+	client = RiotClient("NA1", ct.get_api_key(), max_in_flight=256)
+	[league_list_dto, league_list_str] = client.get_league("CHALLENGER", "RANKED_SOLO_5x5")
+	for game_id, match_dto, match_str, timeline_dto, timeline_str in client.iter_games(game_ids, get_timeline=True):
+		...
+	client.close()
+
+All requests of a client are multiplexed on one event loop (a thread driving a pycurl CurlMulti), which keeps
+up to 'max_in_flight' requests in flight over shared keep-alive connections, with no thread per request.
+Requests are submitted into a bounded queue of 'queue_size' requests, so that submitters block rather than
+queue without bound, and are answered as by common_tools.get_json_data: with [decoded JSON data, JSON string],
+or [None, None] if the request failed after retries, under the same rate limiter, adaptive concurrency,
+back-off scheduler, cache, and metrics (see get_json_data).
+
+Methods get_* block the calling thread until their response is in, and can be called from many threads at once.
+Method submit returns a ClientRequest at once, and iter_games streams games as their responses come in.
+
+If the event loop fails, e.g., on an error of the cache, all requests not done are completed with [None, None],
+and ClientError is raised by get_result and iter_games for them, and by submit from then on.
+"""
+MAX_SELECT_TIME = 0.1	# Upper bound of time in sec the event loop waits without checking for due requests
+
+
+class ClientError(Exception):
+	pass
+
+
+class ClientRequest(object):
+	""" Request submitted to a client, done once its result is set, with 'tag' of the submitter, e.g., a game id. """
+	def __init__(self, api_cmd, callback=None, tag=None):
+		self.api_cmd = api_cmd
+		self.endpoint_type = ct.get_endpoint_type(api_cmd)
+		self.callback = callback
+		self.tag = tag
+		self.result = [None, None]
+		self.error = None		# ClientError, if the event loop failed before the request was done
+		self.done = threading.Event()
+		self.submit_time = time.time()
+		
+		""" State of current attempt, kept by the event loop """
+		self.nbr_attempts = 0
+		self.ready_time = self.submit_time	# Time from which next attempt may be sent
+		self.waited_on = None		# 'concurrency' or 'limiter', if next attempt waited for either
+		self.start_time = None
+		self.concurrency_start = None
+		self.buffer = None
+		self.headers = None
+	
+	def get_result(self):
+		""" Block until the request is done, and return [decoded JSON data, JSON string], or [None, None]. """
+		self.done.wait()	# Untimed, as timed waits of Python 2 poll, and every request is done even if the event loop fails
+		if self.error is not None:
+			raise self.error
+		return self.result
+
+
+class RiotClient(object):
+	""" Client of the Riot API for one region, whose requests are sent by an event loop of its own (see above). """
+	def __init__(self, region, api_key, base_url=None, max_in_flight=16, queue_size=1024, max_attempts=5, sleep_time=3,
+			rate_limiter=None, concurrency=None, scheduler=None, cache=None, metrics=None, debug=False):
+		self.region = region
+		self.url_prefix = (base_url if base_url is not None else ct.BASE_URL).replace("{region}", region)
+		self.url_suffix = ct.get_url_suffix(api_key)
+		self.max_in_flight = max_in_flight
+		self.queue_size = queue_size
+		self.max_attempts = max_attempts
+		self.rate_limiter = rate_limiter
+		self.concurrency = concurrency
+		self.scheduler = scheduler if scheduler is not None else ct.get_default_scheduler(ct.get_host(self.url_prefix + "/"), sleep_time)
+		self.cache = cache
+		self.metrics = metrics
+		self.debug = debug
+		self.nbr_requests = 0		# Requests submitted, as counted by the crawler
+		
+		""" Requests submitted, and admitted by the event loop: due ones by endpoint type, and delayed ones by time """
+		self.submitted = Queue.Queue(queue_size)
+		self.ready = collections.OrderedDict()
+		self.delayed = []
+		self.admitted = set()		# Requests admitted and not done, wherever they are
+		self.nbr_delayed = 0
+		self.hold_until = 0.0		# Time until which no request is sent, e.g., after a rate limit window is used up
+		self.stopping = False
+		self.error = None		# ClientError, once the event loop has failed
+		self.fail_lock = threading.Lock()
+		
+		self.multi = pycurl.CurlMulti()
+		self.free_handles = []
+		self.in_flight = {}		# Curl handle to request
+		
+		""" Pipe by which submitters wake up the event loop from waiting on sockets """
+		[self.wakeup_read, self.wakeup_write] = os.pipe()
+		for fd in [self.wakeup_read, self.wakeup_write]:
+			fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+		
+		self.thread = threading.Thread(target=self.run_loop, name="RiotClient-" + region)
+		self.thread.daemon = True
+		self.thread.start()
+	
+	""" Riot API methods, each returning [decoded JSON data, JSON string], or [None, None] on failure """
+	def get_league(self, league, queue_type):
+		""" Get LeagueListDTO of CHALLENGER or MASTER league. """
+		if league == "MASTER":
+			return self.get_json_data(ct.get_masters_by_queue(self.url_prefix, self.url_suffix, queue_type))
+		return self.get_json_data(ct.get_challengers_by_queue(self.url_prefix, self.url_suffix, queue_type))
+	
+	def get_summoner(self, summoner_id):
+		""" Get SummonerDTO. """
+		return self.get_json_data(ct.get_summoner_by_id(self.url_prefix, self.url_suffix, summoner_id))
+	
+	def get_match_list(self, account_id, begin_time=None, begin_index=None, end_index=None):
+		""" Get MatchlistDto, optionally of matches since 'begin_time' and paged (see common_tools.get_match_list_by_account_id). """
+		return self.get_json_data(ct.get_match_list_by_account_id(self.url_prefix, self.url_suffix, account_id,
+								begin_time=begin_time, begin_index=begin_index, end_index=end_index))
+	
+	def get_match(self, game_id):
+		""" Get MatchDto. """
+		return self.get_json_data(ct.get_match_endpoint_by_match_id(self.url_prefix, self.url_suffix, game_id))
+	
+	def get_timeline(self, game_id):
+		""" Get MatchTimelineDto. """
+		return self.get_json_data(ct.get_match_timeline_by_match_id(self.url_prefix, self.url_suffix, game_id))
+	
+	def get_json_data(self, api_cmd):
+		""" Send request, and block until its response is in. """
+		return self.submit(api_cmd).get_result()
+	
+	def iter_games(self, game_ids, get_timeline=False, window=None):
+		"""
+		Stream [game id, MatchDto, JSON string, MatchTimelineDto, JSON string] of games in order of completion, with up to
+		'window' games (default = max_in_flight) requested at a time, and 'game_ids' consumed only as games complete,
+		so that it can be a generator, e.g., claiming games as they are requested. Timelines are requested once match data
+		are in, if 'get_timeline'. Data of failed requests are None, and so are timelines unless requested.
+		"""
+		window = window if window is not None else self.max_in_flight
+		completed = Queue.Queue()
+		game_ids = iter(game_ids)
+		matches = {}
+		nbr_pending = 0
+		while True:
+			while nbr_pending < window:
+				game_id = next(game_ids, None)
+				if game_id is None:
+					break
+				self.submit(ct.get_match_endpoint_by_match_id(self.url_prefix, self.url_suffix, game_id), callback=completed.put, tag=game_id)
+				nbr_pending += 1
+			if nbr_pending == 0:
+				return
+			
+			request = completed.get()
+			if request.error is not None:
+				raise request.error
+			game_id = request.tag
+			if request.endpoint_type == "match" and request.result[0] is not None and get_timeline:
+				matches[game_id] = request.result
+				self.submit(ct.get_match_timeline_by_match_id(self.url_prefix, self.url_suffix, game_id), callback=completed.put, tag=game_id)
+				continue
+			
+			nbr_pending -= 1
+			if request.endpoint_type == "timeline":
+				yield [game_id] + matches.pop(game_id) + request.result
+			else:
+				yield [game_id] + request.result + [None, None]
+	
+	def submit(self, api_cmd, callback=None, tag=None):
+		"""
+		Submit request, blocking only while the queue of requests is full, and return its ClientRequest.
+		If given, 'callback' is called with the request once it is done, on the event loop unless the response is cached.
+		"""
+		if self.error is not None:
+			raise self.error
+		if self.debug: print "DEBUG: " + api_cmd
+		self.nbr_requests += 1
+		request = ClientRequest(api_cmd, callback, tag)
+		
+		if self.cache is not None:
+			[json_data, json_str] = ct.get_cached_json_data(api_cmd, request.endpoint_type, self.cache, self.metrics)
+			if json_data is not None:
+				request.result = [json_data, json_str]
+				self.complete(request)
+				return request
+		
+		self.submitted.put(request)
+		if self.error is not None:
+			self.fail_requests()	# Event loop failed while the request was put, so it is failed here
+		else:
+			self.wake_up()
+		return request
+	
+	def close(self):
+		""" Finish requests submitted, and stop the event loop. """
+		self.stopping = True
+		self.wake_up()
+		self.thread.join()
+		for c in self.free_handles:
+			c.close()
+		self.multi.close()
+		os.close(self.wakeup_read)
+		os.close(self.wakeup_write)
+	
+	""" Event loop """
+	def wake_up(self):
+		try:
+			os.write(self.wakeup_write, "x")
+		except OSError as e:
+			if e.errno != errno.EAGAIN:	# Pipe is full, so the event loop wakes up anyway
+				raise
+	
+	def complete(self, request):
+		request.done.set()
+		if request.callback is not None:
+			request.callback(request)
+	
+	def admit_requests(self):
+		""" Take requests from the queue of submitted requests, as long as fewer than 'queue_size' requests are admitted. """
+		while len(self.admitted) < self.queue_size:
+			try:
+				request = self.submitted.get_nowait()
+			except Queue.Empty:
+				return
+			self.ready.setdefault(request.endpoint_type, collections.deque()).append(request)
+			self.admitted.add(request)
+	
+	def start_requests(self):
+		"""
+		Send due requests, up to 'max_in_flight' at a time, while slots of the concurrency controller and tokens of the
+		rate limiter are available, and return seconds until the next request may be sent, or None if none is waiting.
+		"""
+		now = time.time()
+		while self.delayed and self.delayed[0][0] <= now:
+			request = heapq.heappop(self.delayed)[2]
+			self.ready.setdefault(request.endpoint_type, collections.deque()).append(request)
+		
+		wait_time = (self.delayed[0][0] - now) if self.delayed else None
+		if not any(self.ready.values()):
+			return wait_time
+		if self.hold_until > now:
+			return self.hold_until - now
+		
+		for endpoint_type, requests in self.ready.items():
+			while requests and len(self.in_flight) < self.max_in_flight:
+				request = requests[0]
+				if self.concurrency is not None:
+					request.concurrency_start = self.concurrency.try_acquire((ct.get_host(request.api_cmd), endpoint_type))
+					if request.concurrency_start is None:
+						request.waited_on = request.waited_on or "concurrency"
+						break
+				
+				if self.rate_limiter is not None:
+					limiter_time = self.rate_limiter.try_acquire()
+					if limiter_time > 0:
+						if self.concurrency is not None:
+							self.concurrency.release((ct.get_host(request.api_cmd), endpoint_type), request.concurrency_start, None, 0.0)
+						request.waited_on = "limiter"
+						return limiter_time
+				
+				requests.popleft()
+				self.send(request)
+		return wait_time
+	
+	def send(self, request):
+		""" Send an attempt of a request. """
+		now = time.time()
+		if self.metrics is not None and request.waited_on is not None:
+			self.metrics.record_sleep(request.endpoint_type, request.waited_on, now - request.ready_time)
+		request.waited_on = None
+		
+		c = self.free_handles.pop() if self.free_handles else ct.create_curl_handle()
+		request.buffer = StringIO()
+		request.headers = {}
+		c.setopt(c.URL, request.api_cmd)
+		c.setopt(c.WRITEDATA, request.buffer)
+		c.setopt(c.HEADERFUNCTION, lambda line: ct.parse_header_line(line, request.headers))
+		
+		request.start_time = now
+		self.in_flight[c] = request
+		self.multi.add_handle(c)
+	
+	def finish(self, c, error):
+		""" Handle response of an attempt, and either complete its request or schedule the next attempt. """
+		self.multi.remove_handle(c)
+		request = self.in_flight.pop(c)
+		self.free_handles.append(c)
+		
+		resp_code = None
+		if error is None:
+			resp_code = c.getinfo(c.RESPONSE_CODE)
+		else:
+			print "ERROR: Request failed with '" + str(error) + "'. Retry..."
+		
+		now = time.time()
+		latency = now - request.start_time
+		if self.concurrency is not None:
+			self.concurrency.release((ct.get_host(request.api_cmd), request.endpoint_type), request.concurrency_start, resp_code, latency)
+			request.concurrency_start = None
+		
+		[json_data, json_str, retry_time, success_time] = ct.handle_attempt(request.api_cmd, request.endpoint_type, resp_code, request.buffer,
+											request.headers, latency, request.nbr_attempts, self.max_attempts,
+											self.scheduler, self.cache, self.metrics)
+		request.nbr_attempts += 1
+		if retry_time is not None:
+			request.ready_time = now + retry_time
+			self.nbr_delayed += 1
+			heapq.heappush(self.delayed, (request.ready_time, self.nbr_delayed, request))
+			return
+		
+		""" Hold all requests only if rate limit would be exceeded """
+		request.result = [json_data, json_str]
+		self.hold_until = max(self.hold_until, now + success_time)
+		
+		request.buffer = None
+		self.admitted.discard(request)
+		self.complete(request)
+	
+	def perform(self):
+		""" Let curl read and write sockets, and finish requests whose responses are in. """
+		while True:
+			[ret, nbr_handles] = self.multi.perform()
+			if ret != pycurl.E_CALL_MULTI_PERFORM:
+				break
+		while True:
+			[nbr_queued, ok_list, error_list] = self.multi.info_read()
+			for c in ok_list:
+				self.finish(c, None)
+			for c, error_number, error_message in error_list:
+				self.finish(c, error_message)
+			if nbr_queued == 0:
+				break
+	
+	def wait(self, wait_time):
+		""" Wait for sockets of requests in flight, or a wake-up by a submitter, for up to 'wait_time' seconds. """
+		[read_fds, write_fds, except_fds] = self.multi.fdset() if self.in_flight else [[], [], []]
+		curl_time = self.multi.timeout() / 1000.0 if self.in_flight else -1
+		timeout = MAX_SELECT_TIME
+		for x in [wait_time, curl_time]:
+			if x is not None and x >= 0:
+				timeout = min(timeout, x)
+		
+		select.select(read_fds + [self.wakeup_read], write_fds, except_fds, timeout)
+		try:
+			while os.read(self.wakeup_read, 4096):
+				pass
+		except OSError as e:
+			if e.errno != errno.EAGAIN:
+				raise
+	
+	def fail_requests(self):
+		""" Complete all requests not done with [None, None] and the error of the event loop, which has stopped. """
+		with self.fail_lock:
+			for c in self.in_flight:
+				try:
+					self.multi.remove_handle(c)
+				except pycurl.error:
+					pass
+			self.in_flight = {}
+			self.ready.clear()
+			self.delayed = []
+			requests = list(self.admitted)
+			self.admitted.clear()
+			while True:
+				try:
+					requests.append(self.submitted.get_nowait())
+				except Queue.Empty:
+					break
+		
+		for request in requests:
+			request.result = [None, None]
+			request.error = self.error
+			request.done.set()
+			if request.callback is not None:
+				try:
+					request.callback(request)
+				except Exception as e:
+					print "ERROR: Callback of failed request raised '" + str(e) + "'"
+	
+	def run_loop(self):
+		""" Run until closed, or, on any error, fail all requests not done, and those submitted from then on. """
+		try:
+			while True:
+				self.admit_requests()
+				wait_time = self.start_requests()
+				if self.in_flight:
+					self.perform()
+				if self.stopping and not self.admitted and self.submitted.empty():
+					return
+				self.wait(wait_time)
+				if self.in_flight:
+					self.perform()
+		except Exception as e:
+			print "ERROR: Event loop of client in " + self.region + " failed with " + type(e).__name__ + " '" + str(e) + "'. Failing its requests..."
+			self.error = ClientError("Event loop of client in " + self.region + " failed with " + type(e).__name__ + " '" + str(e) + "'")
+			self.fail_requests()
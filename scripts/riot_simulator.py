@@ -0,0 +1,238 @@
+import argparse
+import glob
+import json
+import math
+import os
+import random
+import threading
+import time
+import urlparse
+import BaseHTTPServer
+import SocketServer
+import common_tools as ct
+import synthetic_games as sg
+
+
+"""
+Local Riot API (v3) simulator, serving league, summoner, match list, match, and timeline data
+for the endpoints used by fetch_ranked_game_data.py, so that crawls can be run and benchmarked
+without API key or network.
+
+Requests are expected under http://HOST:PORT/{region}/lol (see DEFAULT_BASE_URL), and every
+region has its own rate limits. The simulator emulates:
+- rate limits of the API key, with 'X-App-Rate-Limit' and 'X-App-Rate-Limit-Count' headers, and
+  429 responses with 'Retry-After' header once a limit is exceeded in its fixed window
+- server errors (500 and 503) at random with given probability
+- network and server latency, drawn at random around a given mean
+
+Payloads are synthetic (see synthetic_games), or replayed from SummonerDTO and MatchlistDto
+files of a data directory, e.g., example_data, for regions and players found there.
+"""
+DEFAULT_BASE_URL = "http://127.0.0.1:{port}/{region}/lol"
+
+
+def dump_json(data):
+	""" Encode data as JSON in UTF-8, with non-ASCII characters as they are, as the Riot API does. """
+	json_str = json.dumps(data, ensure_ascii=False)
+	return json_str.encode("utf-8") if isinstance(json_str, unicode) else json_str
+
+
+class RegionBudget(object):
+	""" Rate limits of the API key in one region, counted in fixed windows starting with their first request. """
+	def __init__(self, limits):
+		self.limits = limits
+		self.windows = [[0.0, 0] for _ in limits]	# Start time and count of current window of each limit
+		self.lock = threading.Lock()
+	
+	def take(self):
+		""" Count a request, and return [None, counts header] if it is allowed, or [Retry-After seconds, counts header] if not. """
+		with self.lock:
+			now = time.time()
+			retry_after = None
+			for (max_requests, period), window in zip(self.limits, self.windows):
+				if now - window[0] >= period:
+					window[0] = now
+					window[1] = 0
+				if window[1] >= max_requests:
+					retry_after = max(retry_after, int(math.ceil(window[0] + period - now)))
+			
+			if retry_after is None:
+				for window in self.windows:
+					window[1] += 1
+			
+			counts = ",".join(str(window[1]) + ":" + str(period) for (max_requests, period), window in zip(self.limits, self.windows))
+			return [retry_after, counts]
+
+
+class RiotSimulator(object):
+	def __init__(self, rate_limits=None, error_rate=0.0, latency=0.0, nbr_matches=100, pool_size=2000, data_dir=None):
+		self.rate_limits = rate_limits
+		self.error_rate = error_rate
+		self.latency = latency
+		self.nbr_matches = nbr_matches
+		self.pool_size = pool_size
+		self.budgets = {}	# Region to RegionBudget
+		self.lock = threading.Lock()
+		
+		""" Replayed data by region: summoner id to SummonerDTO string, and account id to MatchlistDto string """
+		self.summoners = {}
+		self.match_lists = {}
+		if data_dir is not None:
+			self.load_data(data_dir)
+	
+	def load_data(self, data_dir):
+		""" Load files of 'id<TAB>JSON string' lines, named as by the fetcher, e.g., challengers-summoners-OC1-...json """
+		for data_type, data in [("summoners", self.summoners), ("matchlist", self.match_lists)]:
+			for file_name in glob.glob(os.path.join(data_dir, "*-" + data_type + "-*.json")):
+				region = os.path.basename(file_name).split("-")[2]
+				region_data = data.setdefault(region, {})
+				for line in open(file_name, 'r'):
+					[data_id, json_str] = line.rstrip("\n").split("\t", 1)
+					if data_type == "summoners":
+						region_data[str(json.loads(json_str)["id"])] = json_str
+					else:
+						region_data[data_id] = json_str
+	
+	def get_budget(self, region):
+		with self.lock:
+			if region not in self.budgets:
+				self.budgets[region] = RegionBudget(self.rate_limits)
+			return self.budgets[region]
+	
+	def get_league_list(self, region, league, queue_type, nbr_players):
+		if region in self.summoners:
+			entries = [{"playerOrTeamId": x, "playerOrTeamName": json.loads(s)["name"], "leaguePoints": 1000, "rank": "I"}
+					for x, s in sorted(self.summoners[region].items())]
+			return dump_json({"tier": league, "queue": queue_type, "name": "Replayed League", "entries": entries})
+		return dump_json(sg.get_league_list(region, league, queue_type, nbr_players))
+	
+	def get_summoner(self, region, summoner_id):
+		if summoner_id in self.summoners.get(region, {}):
+			return self.summoners[region][summoner_id]
+		return dump_json(sg.get_summoner(summoner_id))
+	
+	def get_match_list(self, region, account_id, query):
+		""" Get MatchlistDto, filtered by 'beginTime' and paged by 'beginIndex' and 'endIndex', or None if no match is left. """
+		if account_id in self.match_lists.get(region, {}):
+			match_list = json.loads(self.match_lists[region][account_id])
+		else:
+			match_list = sg.get_match_list(region, account_id, self.nbr_matches, self.pool_size)
+		
+		matches = match_list["matches"]
+		if "beginTime" in query:
+			matches = [x for x in matches if x["timestamp"] >= int(query["beginTime"])]
+		begin_index = int(query.get("beginIndex", 0))
+		end_index = int(query.get("endIndex", begin_index + 100))
+		total_games = len(matches)
+		matches = matches[begin_index:end_index]
+		if not matches:
+			return None
+		return json.dumps({"matches": matches, "startIndex": begin_index, "endIndex": begin_index + len(matches), "totalGames": total_games})
+	
+	def get_response(self, path):
+		""" Get [response code, JSON string, headers] of a request path, e.g., /KR/lol/match/v3/matches/1?api_key=... """
+		url = urlparse.urlparse(path)
+		query = dict(urlparse.parse_qsl(url.query))
+		parts = url.path.strip("/").split("/")
+		if len(parts) < 5 or parts[1] != "lol":
+			return [404, None, {}]
+		region = parts[0]
+		
+		headers = {}
+		if self.rate_limits:
+			[retry_after, counts] = self.get_budget(region).take()
+			headers["X-App-Rate-Limit"] = ",".join(str(x) + ":" + str(y) for x, y in self.rate_limits)
+			headers["X-App-Rate-Limit-Count"] = counts
+			if retry_after is not None:
+				headers["Retry-After"] = str(retry_after)
+				headers["X-Rate-Limit-Type"] = "application"
+				return [429, None, headers]
+		
+		if self.latency > 0:
+			time.sleep(random.uniform(0.5, 1.5) * self.latency)
+		
+		if random.random() < self.error_rate:
+			return [random.choice([500, 503]), None, headers]
+		
+		[api, version, resource] = parts[2:5]
+		args = parts[5:]
+		json_str = None
+		if api == "league":
+			league = "CHALLENGER" if resource == "challengerleagues" else "MASTER"
+			json_str = self.get_league_list(region, league, args[-1], int(query.get("players", 200)))
+		elif api == "summoner" and resource == "summoners" and len(args) == 1:
+			json_str = self.get_summoner(region, args[0])
+		elif resource == "matchlists" and len(args) >= 2:
+			if len(args) == 3 and args[2] == "recent":
+				query = {"beginIndex": 0, "endIndex": 20}
+			json_str = self.get_match_list(region, args[1], query)
+		elif resource == "matches" and len(args) == 1:
+			json_str = json.dumps(sg.get_match(region, args[0]))
+		elif resource == "timelines" and len(args) == 2:
+			json_str = json.dumps(sg.get_timeline(args[1]))
+		
+		if json_str is None:
+			return [404, None, headers]
+		return [200, json_str, headers]
+
+
+class SimulatorHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	""" Answer GET requests with responses of the simulator of the server, keeping connections alive. """
+	protocol_version = "HTTP/1.1"
+	disable_nagle_algorithm = True
+	
+	def do_GET(self):
+		[resp_code, json_str, headers] = self.server.simulator.get_response(self.path)
+		body = json_str if json_str is not None else json.dumps({"status": {"status_code": resp_code, "message": "Simulated"}})
+		
+		self.send_response(resp_code)
+		self.send_header("Content-Type", "application/json;charset=utf-8")
+		self.send_header("Content-Length", str(len(body)))
+		for name, value in headers.items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(body)
+	
+	def log_message(self, format, *args):
+		pass
+
+
+class SimulatorServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+	request_queue_size = 1024	# Backlog of connections, for clients with many requests in flight
+	
+	def __init__(self, address, simulator):
+		BaseHTTPServer.HTTPServer.__init__(self, address, SimulatorHandler)
+		self.simulator = simulator
+
+
+def start_simulator(port, simulator):
+	""" Serve simulator in a background thread, and return the server, to be stopped with shutdown(). """
+	server = SimulatorServer(("127.0.0.1", port), simulator)
+	server_thread = threading.Thread(target=server.serve_forever)
+	server_thread.daemon = True
+	server_thread.start()
+	return server
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Simulate Riot API locally for fetch_ranked_game_data.py")
+	parser.add_argument('-p', '--port', type=int, dest='port', default=8080, help='Specify port of simulator (default = 8080)')
+	parser.add_argument('-R', '--rate-limits', type=ct.check_rate_limits, dest='rate_limits', help='Specify rate limits of API key enforced per region as max_requests:period pairs (e.g., 20:1,100:120)')
+	parser.add_argument('-e', '--error-rate', type=float, dest='error_rate', default=0.0, help='Specify probability of server errors (500 or 503) (default = 0)')
+	parser.add_argument('-l', '--latency', type=float, dest='latency', default=0.0, help='Specify mean latency of responses in sec (default = 0)')
+	parser.add_argument('-g', '--nbr-matches', type=int, dest='nbr_matches', default=100, help='Specify number of matches in synthetic match lists (default = 100)')
+	parser.add_argument('-s', '--pool-size', type=int, dest='pool_size', default=2000, help='Specify number of synthetic games shared by players of a region (default = 2000)')
+	parser.add_argument('-i', '--data-dir', type=str, dest='data_dir', help='Provide directory with summoner and match list files to replay, e.g., example_data')
+	args = parser.parse_args()
+	
+	simulator = RiotSimulator(rate_limits=args.rate_limits, error_rate=args.error_rate, latency=args.latency,
+					nbr_matches=args.nbr_matches, pool_size=args.pool_size, data_dir=args.data_dir)
+	server = SimulatorServer(("127.0.0.1", args.port), simulator)
+	
+	print "INFO: Simulating Riot API at " + DEFAULT_BASE_URL.format(port=args.port, region="{region}")
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		server.shutdown()
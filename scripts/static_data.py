@@ -0,0 +1,139 @@
+import array
+import json
+import marshal
+import os
+
+
+"""
+Champion static data (static_data/champion.json), compiled into compact arrays indexed by champion id:
+- a bitmask of tags, with bits in order of TAG_NAMES
+- the index of the primary (first) tag in TAG_NAMES, or -1
+- selected base stats, one array of floats per stat in STAT_NAMES
+
+Compiled arrays are cached in a binary file next to champion.json, so that the JSON file is parsed
+only when it changes. Lookups are O(1), and champion ids missing from static data (e.g., newer
+champions) get no tags and "NA" stats.
+"""
+CHAMPION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "static_data", "champion.json")
+
+TAG_NAMES = ["Assassin", "Fighter", "Mage", "Marksman", "Support", "Tank"]
+
+""" Base stats of champions, and names of their columns in endpoint rows """
+STAT_NAMES = ["hp", "mp", "armor", "spellblock", "attackdamage", "attackrange", "movespeed"]
+STAT_COLUMNS = {	'hp': "baseHp",
+			'mp': "baseMp",
+			'armor': "baseArmor",
+			'spellblock': "baseSpellBlock",
+			'attackdamage': "baseAttackDamage",
+			'attackrange': "baseAttackRange",
+			'movespeed': "baseMoveSpeed"
+			}
+
+""" Columns that can be joined into endpoint rows by champion id """
+COLUMN_NAMES = ["tagMask", "primaryTag"] + [STAT_COLUMNS[x] for x in STAT_NAMES]
+COLUMN_TYPES = dict([('tagMask', "int"), ('primaryTag', "str")] + [(STAT_COLUMNS[x], "float") for x in STAT_NAMES])
+
+CACHE_FORMAT = 1	# Version of cache layout, bumped when it changes
+
+
+class ChampionTable(object):
+	def __init__(self, version, tag_masks, primary_tags, stats):
+		self.version = version
+		self.tag_masks = tag_masks		# array of tag bitmasks by champion id
+		self.primary_tags = primary_tags	# array of indices in TAG_NAMES by champion id
+		self.stats = stats			# Stat name to array of base stats by champion id
+		
+		""" Column name to function of champion id """
+		self.columns = {'tagMask': self.get_tag_mask, 'primaryTag': self.get_primary_tag}
+		for stat_name in STAT_NAMES:
+			self.columns[STAT_COLUMNS[stat_name]] = lambda champ_id, stat_name=stat_name: self.get_stat(champ_id, stat_name)
+	
+	def get_tag_mask(self, champ_id):
+		return self.tag_masks[champ_id] if 0 <= champ_id < len(self.tag_masks) else 0
+	
+	def has_tag(self, champ_id, tag):
+		return (self.get_tag_mask(champ_id) >> TAG_NAMES.index(tag)) & 1 == 1
+	
+	def get_primary_tag(self, champ_id):
+		if 0 <= champ_id < len(self.primary_tags) and self.primary_tags[champ_id] >= 0:
+			return TAG_NAMES[self.primary_tags[champ_id]]
+		return "NA"
+	
+	def get_stat(self, champ_id, stat_name):
+		values = self.stats[stat_name]
+		if 0 <= champ_id < len(values) and values[champ_id] == values[champ_id]:
+			return values[champ_id]
+		return "NA"
+	
+	def get_champion_ids(self):
+		""" Get set of ids of champions in static data. """
+		return set(i for i, x in enumerate(self.primary_tags) if x >= 0)
+	
+	def get_champions_with_primary_tag(self, tag):
+		""" Get set of ids of champions with given primary tag, e.g., "Marksman". """
+		tag_index = TAG_NAMES.index(tag)
+		return set(i for i, x in enumerate(self.primary_tags) if x == tag_index)
+	
+	def get_columns(self, champ_id, column_names):
+		""" Get values of given columns (see COLUMN_NAMES) for a champion. """
+		return [self.columns[x](champ_id) for x in column_names]
+
+
+def compile_champions(json_data):
+	""" Compile ChampionListDto into a ChampionTable. """
+	champions = json_data["data"].values()
+	size = max(int(x["key"]) for x in champions) + 1
+	
+	tag_masks = array.array('i', [0] * size)
+	primary_tags = array.array('b', [-1] * size)
+	stats = dict((x, array.array('d', [float("nan")] * size)) for x in STAT_NAMES)
+	
+	for champion in champions:
+		champ_id = int(champion["key"])
+		tags = [x for x in champion["tags"] if x in TAG_NAMES]
+		for tag in tags:
+			tag_masks[champ_id] |= 1 << TAG_NAMES.index(tag)
+		if tags:
+			primary_tags[champ_id] = TAG_NAMES.index(tags[0])
+		for stat_name in STAT_NAMES:
+			stats[stat_name][champ_id] = float(champion["stats"].get(stat_name, float("nan")))
+	
+	return ChampionTable(json_data["version"], tag_masks, primary_tags, stats)
+
+
+def get_source_key(json_file):
+	""" Identify version of champion.json by size and modification time, without reading it. """
+	stat = os.stat(json_file)
+	return [CACHE_FORMAT, stat.st_size, int(stat.st_mtime)]
+
+
+def load_champions(json_file=CHAMPION_FILE, cache_file=None):
+	"""
+	Load ChampionTable from binary cache if it is up to date with champion.json,
+	and compile it from champion.json otherwise, updating the cache if possible.
+	"""
+	if cache_file is None:
+		cache_file = json_file + ".cache"
+	source_key = get_source_key(json_file)
+	
+	if os.path.exists(cache_file):
+		try:
+			with open(cache_file, 'rb') as fh:
+				[cache_key, version, tag_masks, primary_tags, stats] = marshal.load(fh)
+			if cache_key == source_key:
+				return ChampionTable(version, array.array('i', tag_masks), array.array('b', primary_tags),
+							dict((x, array.array('d', stats[x])) for x in STAT_NAMES))
+		except (EOFError, ValueError, TypeError, KeyError):
+			pass	# Corrupt or outdated cache, compiled again below
+	
+	with open(json_file, 'r') as fh:
+		table = compile_champions(json.load(fh))
+	
+	try:
+		with open(cache_file, 'wb') as fh:
+			marshal.dump([source_key, table.version, table.tag_masks.tostring(), table.primary_tags.tostring(),
+					dict((x, table.stats[x].tostring()) for x in STAT_NAMES)], fh)
+	except IOError:
+		pass	# Read-only static data, compiled on every load
+	
+	return table
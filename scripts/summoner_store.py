@@ -0,0 +1,61 @@
+import sqlite3
+import threading
+import time
+
+
+"""
+SummonerDTO per summoner id, kept in a SQLite database across crawls.
+
+Account ids of summoners almost never change, so crawls look up league entries here in bulk, and request
+SummonerDTO only of summoners unknown, renamed since (as seen from names in league entries), or not refreshed
+for longer than a maximum age.
+
+SummonerDTO strings are UTF-8 encoded, e.g., with Korean names, and are stored as unicode text, as
+sqlite3 refuses 8-bit byte strings, and encoded again when read.
+"""
+
+
+def get_text(value):
+	""" Decode UTF-8 byte string into unicode, as accepted by sqlite3, leaving unicode and None as they are. """
+	return value.decode("utf-8") if isinstance(value, str) else value
+
+
+class SummonerStore(object):
+	def __init__(self, path):
+		self.lock = threading.Lock()
+		self.db = sqlite3.connect(path, check_same_thread=False)
+		self.db.execute("""CREATE TABLE IF NOT EXISTS summoners (
+					region TEXT,
+					summoner_id TEXT,
+					account_id INTEGER,
+					name TEXT,
+					summoner TEXT,
+					updated REAL,
+					PRIMARY KEY (region, summoner_id))""")
+		self.db.commit()
+	
+	def get_many(self, region, summoner_ids):
+		""" Get {summoner id: [account id, name, SummonerDTO string, time of update]} of summoners known. """
+		summoners = {}
+		summoner_ids = [str(x) for x in summoner_ids]
+		with self.lock:
+			for i in range(0, len(summoner_ids), 500):	# Bound number of parameters per query
+				chunk = summoner_ids[i:i + 500]
+				rows = self.db.execute("SELECT summoner_id, account_id, name, summoner, updated FROM summoners WHERE region = ? AND summoner_id IN ("
+							+ ",".join("?" * len(chunk)) + ")", [region] + chunk).fetchall()
+				for row in rows:
+					summoners[str(row[0])] = [row[1], row[2], row[3].encode("utf-8"), row[4]]
+		return summoners
+	
+	def put_many(self, region, summoners):
+		""" Record SummonerDTOs, given as list of [summoner id, SummonerDTO, SummonerDTO string], in one transaction. """
+		now = time.time()
+		with self.lock:
+			self.db.executemany("INSERT OR REPLACE INTO summoners VALUES (?, ?, ?, ?, ?, ?)",
+					[(region, str(summoner_id), int(summoner_dto["accountId"]), get_text(summoner_dto.get("name")), get_text(summoner_str), now)
+						for summoner_id, summoner_dto, summoner_str in summoners])
+			self.db.commit()
+	
+	def close(self):
+		with self.lock:
+			self.db.close()
@@ -0,0 +1,206 @@
+import random
+import static_data as sd
+
+
+"""
+Synthetic Riot API (v3) payloads, e.g., for the Riot API simulator and for benchmarks.
+
+Every payload is a deterministic function of its ids, so that the same game is the same
+in the match lists of all its players, across requests, runs, and processes. Games of a league
+are drawn from a shared pool, so that players share games as Challenger players do, and game ids
+grow with time, so that newer games have larger ids and timestamps.
+"""
+SUMMONER_ID_BASE = 1000000
+ACCOUNT_ID_BASE = 200000000
+GAME_ID_BASE = 3000000000
+BASE_TIME = 1498000000000	# Epoch milliseconds of the oldest game
+GAME_INTERVAL = 60000		# Milliseconds between start times of consecutive game ids
+
+""" Stats of ParticipantStatsDto, as used by extract_ranked_game_data.py """
+STAT_NAMES = [
+		"totalScoreRank", "totalPlayerScore", "objectivePlayerScore", "combatPlayerScore",
+		"champLevel", "assists", "deaths", "goldEarned", "goldSpent",
+		"totalDamageDealt", "physicalDamageDealt", "magicDamageDealt", "trueDamageDealt",
+		"totalDamageDealtToChampions", "physicalDamageDealtToChampions", "magicDamageDealtToChampions", "trueDamageDealtToChampions",
+		"largestCriticalStrike", "totalTimeCrowdControlDealt", "timeCCingOthers",
+		"longestTimeSpentLiving", "damageSelfMitigated",
+		"totalDamageTaken", "physicalDamageTaken", "magicalDamageTaken", "trueDamageTaken",
+		"totalHeal", "totalUnitsHealed",
+		"turretKills", "inhibitorKills", "damageDealtToTurrets", "damageDealtToObjectives",
+		"totalMinionsKilled", "neutralMinionsKilled", "neutralMinionsKilledTeamJungle", "neutralMinionsKilledEnemyJungle",
+		"kills", "doubleKills", "tripleKills", "quadraKills", "pentaKills",
+		"largestMultiKill", "killingSprees", "largestKillingSpree",
+		"visionScore", "wardsPlaced", "wardsKilled", "sightWardsBoughtInGame", "visionWardsBoughtInGame"
+		]
+
+POSITIONS = [["SOLO", "TOP"], ["NONE", "JUNGLE"], ["SOLO", "MIDDLE"], ["DUO_CARRY", "BOTTOM"], ["DUO_SUPPORT", "BOTTOM"]]
+MONSTER_TYPES = ["DRAGON", "RIFTHERALD", "BARON_NASHOR"]
+OTHER_EVENT_TYPES = ["ITEM_PURCHASED", "SKILL_LEVEL_UP", "WARD_KILL", "ITEM_DESTROYED"]
+
+CHAMPION_IDS = sorted(sd.load_champions().get_champion_ids())
+
+
+def get_account_id(summoner_id):
+	return ACCOUNT_ID_BASE + int(summoner_id) - SUMMONER_ID_BASE
+
+
+def get_timestamp(game_id):
+	return BASE_TIME + (int(game_id) - GAME_ID_BASE) * GAME_INTERVAL
+
+
+def get_summoner_name(summoner_id):
+	""" Get name of a summoner, in Hangul for every seventh one, as names in KR, to exercise UTF-8 payloads. """
+	return (u"\ud50c\ub808\uc774\uc5b4" if summoner_id % 7 == 0 else u"Player") + unicode(summoner_id)
+
+
+def get_league_list(region, league, queue_type, nbr_players):
+	""" Get LeagueListDTO of 'nbr_players' players, with summoner ids following SUMMONER_ID_BASE. """
+	rng = random.Random(region + league)
+	entries = []
+	for i in range(nbr_players):
+		summoner_id = SUMMONER_ID_BASE + i
+		entries.append({	"playerOrTeamId": str(summoner_id),
+					"playerOrTeamName": get_summoner_name(summoner_id),
+					"leaguePoints": rng.randint(500, 1500),
+					"wins": rng.randint(100, 400),
+					"losses": rng.randint(100, 400),
+					"rank": "I"
+					})
+	return {"tier": league, "queue": queue_type, "name": "Synthetic League", "entries": entries}
+
+
+def get_summoner(summoner_id):
+	""" Get SummonerDTO. """
+	summoner_id = int(summoner_id)
+	return {	"id": summoner_id,
+			"accountId": get_account_id(summoner_id),
+			"name": get_summoner_name(summoner_id),
+			"profileIconId": 1665,
+			"revisionDate": BASE_TIME,
+			"summonerLevel": 30
+			}
+
+
+def get_match_list(region, account_id, nbr_matches, pool_size):
+	"""
+	Get full MatchlistDto of an account, newest match first, with 'nbr_matches' games drawn
+	from a pool of 'pool_size' games shared by all accounts.
+	"""
+	rng = random.Random(int(account_id))
+	game_ids = sorted(rng.sample(xrange(GAME_ID_BASE, GAME_ID_BASE + pool_size), min(nbr_matches, pool_size)), reverse=True)
+	matches = []
+	for game_id in game_ids:
+		[role, lane] = rng.choice(POSITIONS)
+		matches.append({	"platformId": region,
+					"gameId": game_id,
+					"champion": rng.choice(CHAMPION_IDS),
+					"queue": 420,
+					"season": 8,
+					"timestamp": get_timestamp(game_id),
+					"role": role,
+					"lane": lane
+					})
+	return {"matches": matches, "startIndex": 0, "endIndex": len(matches), "totalGames": len(matches)}
+
+
+def get_match(region, game_id):
+	""" Get MatchDto of a game of 10 players, with team 100 winning games of even id. """
+	game_id = int(game_id)
+	rng = random.Random(game_id)
+	
+	participant_identities = []
+	participants = []
+	champion_ids = rng.sample(CHAMPION_IDS, 10)
+	for participant_id in range(1, 11):
+		team_id = 100 if participant_id <= 5 else 200
+		summoner_id = SUMMONER_ID_BASE + rng.randrange(10000)
+		[role, lane] = POSITIONS[(participant_id - 1) % 5]
+		
+		stats = dict((x, rng.randint(0, 50000)) for x in STAT_NAMES)
+		stats["participantId"] = participant_id
+		stats["win"] = (team_id == 100) == (game_id % 2 == 0)
+		
+		participant_identities.append({	"participantId": participant_id,
+							"player": {	"platformId": region,
+									"accountId": get_account_id(summoner_id),
+									"summonerId": summoner_id,
+									"summonerName": "Player" + str(summoner_id)
+									}
+							})
+		participants.append({	"participantId": participant_id,
+					"teamId": team_id,
+					"championId": champion_ids[participant_id - 1],
+					"spell1Id": 4,
+					"spell2Id": rng.choice([7, 11, 12, 14]),
+					"stats": stats,
+					"timeline": {"participantId": participant_id, "role": role, "lane": lane}
+					})
+	
+	teams = [{"teamId": x, "win": "Win" if (x == 100) == (game_id % 2 == 0) else "Fail"} for x in [100, 200]]
+	
+	return {	"gameId": game_id,
+			"platformId": region,
+			"gameCreation": get_timestamp(game_id),
+			"gameDuration": random.Random(game_id).randint(1200, 2700),
+			"queueId": 420,
+			"mapId": 11,
+			"seasonId": 8,
+			"gameVersion": "7.12.190.9967",
+			"gameMode": "CLASSIC",
+			"gameType": "MATCHED_GAME",
+			"teams": teams,
+			"participants": participants,
+			"participantIdentities": participant_identities
+			}
+
+
+def get_event(rng, timestamp):
+	""" Get a random MatchEventDto, with participant id 0 standing for minions and turrets. """
+	event_type = rng.choice(["CHAMPION_KILL", "WARD_PLACED", "BUILDING_KILL", "ELITE_MONSTER_KILL"] + OTHER_EVENT_TYPES * 6)
+	event = {"type": event_type, "timestamp": timestamp}
+	if event_type == "CHAMPION_KILL":
+		event["killerId"] = rng.randint(0, 10)
+		event["victimId"] = rng.randint(1, 10)
+		event["assistingParticipantIds"] = rng.sample(range(1, 11), rng.randint(0, 4))
+		event["position"] = {"x": rng.randint(0, 14820), "y": rng.randint(0, 14881)}
+	elif event_type == "WARD_PLACED":
+		event["creatorId"] = rng.randint(0, 10)
+		event["wardType"] = "YELLOW_TRINKET"
+	elif event_type == "BUILDING_KILL":
+		event["killerId"] = rng.randint(0, 10)
+		event["assistingParticipantIds"] = rng.sample(range(1, 11), rng.randint(0, 3))
+		event["buildingType"] = "TOWER_BUILDING"
+	elif event_type == "ELITE_MONSTER_KILL":
+		event["killerId"] = rng.randint(1, 10)
+		event["monsterType"] = rng.choice(MONSTER_TYPES)
+	else:
+		event["participantId"] = rng.randint(1, 10)
+	return event
+
+
+def get_timeline(game_id, nbr_events=30):
+	""" Get MatchTimelineDto of a game, with one frame per minute and about 'nbr_events' events per frame. """
+	rng = random.Random(-int(game_id))
+	game_duration = random.Random(int(game_id)).randint(1200, 2700)
+	
+	frames = []
+	for frame_index in range(game_duration // 60 + 2):
+		timestamp = frame_index * 60000 + (rng.randint(0, 50) if frame_index > 0 else 0)
+		participant_frames = {}
+		for participant_id in range(1, 11):
+			participant_frame = {	"participantId": participant_id,
+						"currentGold": rng.randint(0, 1500),
+						"totalGold": 500 + frame_index * rng.randint(300, 500),
+						"level": min(1 + frame_index // 2, 18),
+						"xp": frame_index * rng.randint(300, 600),
+						"minionsKilled": frame_index * rng.randint(0, 9),
+						"jungleMinionsKilled": frame_index * rng.randint(0, 4)
+						}
+			if frame_index < game_duration // 60 + 1:
+				participant_frame["position"] = {"x": rng.randint(0, 14820), "y": rng.randint(0, 14881)}	# Missing in last frame
+			participant_frames[str(participant_id)] = participant_frame
+		
+		events = [get_event(rng, timestamp - rng.randint(0, 59999)) for i in range(rng.randint(nbr_events // 2, nbr_events * 3 // 2))] if frame_index > 0 else []
+		frames.append({"participantFrames": participant_frames, "events": sorted(events, key=lambda x: x["timestamp"]), "timestamp": timestamp})
+	
+	return {"frames": frames, "frameInterval": 60000}
@@ -0,0 +1,149 @@
+import os
+import timeline_tensors as tt
+
+try:
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+except ImportError:
+	pa = None
+
+
+"""
+Output tables of extracted rows, written as CSV text or as typed, compressed columnar files.
+
+Columns are typed by a dict of column name to "int", "float", "bool", or "str". In columnar files,
+"NA" placeholders become nulls and "True"/"False" strings become booleans.
+"""
+VALID_OUTPUT_FORMATS = ['csv', 'parquet', 'arrow', 'feather']
+VALID_TIMELINE_FORMATS = VALID_OUTPUT_FORMATS + ['tensor']	# Timeline tables can also be written as tensors (see timeline_tensors)
+
+ROW_GROUP_SIZE = 100000		# Rows per row group (Parquet) or record batch (Arrow/Feather)
+
+
+def get_csv_text(rows):
+	return "".join(",".join(str(x) for x in row) + "\n" for row in rows)
+
+
+def encode_rows(rows, output_format):
+	"""
+	Encode rows for a sink of given format. CSV text is formatted here, so that it can be done
+	by the processes building the rows. Columnar sinks take the rows as they are.
+	"""
+	if output_format == "csv":
+		return get_csv_text(rows)
+	else:
+		return rows
+
+
+class CsvSink(object):
+	def __init__(self, file_name, header, mode='w'):
+		self.fh = open(file_name, mode)
+		if mode == 'w':
+			self.fh.write(",".join(header) + "\n")
+	
+	def write(self, data):
+		self.fh.write(data)
+	
+	def sync(self):
+		""" Make rows written so far durable. """
+		self.fh.flush()
+		os.fsync(self.fh.fileno())
+	
+	def close(self):
+		self.fh.close()
+
+
+class ColumnarSink(object):
+	"""
+	Typed columnar table, written in row groups of ROW_GROUP_SIZE rows as rows come in:
+	- parquet: Parquet file with snappy compression
+	- arrow/feather: Arrow IPC file, which is also read as Feather (V2) by pyarrow >= 0.17,
+	  and compressed with zstd by pyarrow versions supporting IPC compression
+	"""
+	def __init__(self, file_name, header, column_types, output_format):
+		if pa is None:
+			raise SystemExit("ERROR: pyarrow is required for " + output_format + " output. Exiting...")
+		
+		arrow_types = {'int': pa.int64(), 'float': pa.float64(), 'bool': pa.bool_(), 'str': pa.string()}
+		self.column_types = [column_types.get(x, "int") for x in header]
+		self.schema = pa.schema([pa.field(x, arrow_types[t]) for x, t in zip(header, self.column_types)])
+		self.rows = []
+		
+		if output_format == "parquet":
+			self.writer = pq.ParquetWriter(file_name, self.schema, compression='snappy')
+		else:
+			self.fh = pa.OSFile(file_name, 'wb')
+			if hasattr(pa.ipc, "IpcWriteOptions"):
+				self.writer = pa.ipc.new_file(self.fh, self.schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+			else:
+				self.writer = pa.RecordBatchFileWriter(self.fh, self.schema)
+		self.output_format = output_format
+	
+	def write(self, rows):
+		self.rows.extend(rows)
+		if len(self.rows) >= ROW_GROUP_SIZE:
+			self.flush()
+	
+	def get_column(self, values, column_type):
+		if column_type == "int":
+			return [None if x == "NA" or x is None else int(x) for x in values]
+		elif column_type == "float":
+			return [None if x == "NA" or x is None else float(x) for x in values]
+		elif column_type == "bool":
+			return [None if x == "NA" or x is None else (x == "True" if isinstance(x, basestring) else bool(x)) for x in values]
+		else:
+			return [None if x is None else unicode(x) for x in values]
+	
+	def flush(self):
+		""" Write buffered rows as one row group. """
+		if not self.rows:
+			return
+		
+		columns = zip(*self.rows)
+		arrays = [pa.array(self.get_column(values, column_type), type=field.type)
+				for values, column_type, field in zip(columns, self.column_types, self.schema)]
+		batch = pa.RecordBatch.from_arrays(arrays, [field.name for field in self.schema])
+		
+		if self.output_format == "parquet":
+			self.writer.write_table(pa.Table.from_batches([batch]))
+		else:
+			self.writer.write_batch(batch)
+		self.rows = []
+	
+	def sync(self):
+		""" Columnar files are complete only once closed, so rows are kept for full row groups. """
+		pass
+	
+	def close(self):
+		self.flush()
+		self.writer.close()
+		if self.output_format != "parquet":
+			self.fh.close()
+
+
+def create_sink(file_name, header, column_types, output_format="csv", mode='w'):
+	""" CSV tables and timeline tensors (a directory) can be appended to with mode 'a'; columnar files are always written anew. """
+	if output_format == "csv":
+		return CsvSink(file_name, header, mode)
+	elif output_format == "tensor":
+		return tt.TensorSink(file_name, header, mode)
+	elif mode != 'w':
+		raise SystemExit("ERROR: " + output_format + " output files cannot be appended to. Exiting...")
+	else:
+		return ColumnarSink(file_name, header, column_types, output_format)
+
+
+def count_rows(file_name, output_format="csv"):
+	""" Get number of rows of a table written by a sink, without its header. """
+	if output_format == "csv":
+		with open(file_name, 'rb') as fh:
+			return max(sum(1 for line in fh) - 1, 0)
+	elif output_format == "tensor":
+		return len(tt.TimelineTensors(file_name).frames) * tt.NBR_PLAYERS
+	elif pa is None:
+		raise SystemExit("ERROR: pyarrow is required to read " + output_format + " files. Exiting...")
+	elif output_format == "parquet":
+		return pq.ParquetFile(file_name).metadata.num_rows
+	else:
+		reader = pa.ipc.open_file(pa.memory_map(file_name, 'r'))
+		return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
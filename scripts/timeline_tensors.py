@@ -0,0 +1,208 @@
+import json
+import os
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+
+"""
+Timeline tensors: timeline rows of games (see extract_ranked_game_data.TIMELINE_HEADER) stored as
+fixed-dtype arrays in memory-mappable files, so that the timeline of any game is a zero-copy slice.
+
+A tensor dataset is a directory with three files:
+- frames.bin: int32 values of all frames of all games, in shape (frames, 10 players, features),
+  games one after another, with features being the timeline columns but gameId, gameDuration, and accountId
+- index.bin: one record per game, in order of games in frames.bin (see INDEX_DTYPE), with its id,
+  offset and number of frames in frames.bin, duration, and account ids of players 1 to 10
+- meta.json: names of features, dtypes, and NA value
+
+Positions missing in last frames ("NA") are stored as NA_VALUE, and outcomes ("Win" or "Fail") as 1 or 0.
+Games are appended, frames before their index record, so that a dataset is consistent after a crash
+(frames past the last index record are ignored), and can be appended to by incremental extraction.
+"""
+TENSOR_FORMAT = 1	# Version of layout, bumped when it changes
+NBR_PLAYERS = 10
+NA_VALUE = -1
+GAME_COLUMNS = ["gameId", "gameDuration", "accountId"]	# Timeline columns stored in index, not in frames
+OUTCOME_VALUES = {"Win": 1, "Fail": 0, "True": 1, "False": 0, "NA": NA_VALUE}
+
+FRAME_DTYPE = "<i4"
+INDEX_DTYPE = [('gameId', "<i8"), ('offset', "<i8"), ('nbrFrames', "<i4"), ('gameDuration', "<i4"), ('accountIds', "<i8", (NBR_PLAYERS,))]
+
+
+def check_numpy():
+	if np is None:
+		raise SystemExit("ERROR: numpy is required for timeline tensors. Exiting...")
+
+
+def get_value(x):
+	if isinstance(x, (int, long)):
+		return x
+	if x in OUTCOME_VALUES:
+		return OUTCOME_VALUES[x]
+	return int(x)
+
+
+class TensorSink(object):
+	""" Sink of timeline rows (see table_sinks), taking the rows of whole games at a time, in frame then player order. """
+	def __init__(self, path, header, mode='w'):
+		check_numpy()
+		if not os.path.exists(path):
+			os.makedirs(path)
+		
+		self.header = header
+		self.features = [x for x in header if x not in GAME_COLUMNS]
+		self.feature_indices = [header.index(x) for x in self.features]
+		self.outcome_index = self.features.index("win") if "win" in self.features else None
+		self.position_indices = [self.features.index(x) for x in ["positionX", "positionY"] if x in self.features]
+		[self.game_id_index, self.duration_index, self.account_index] = [header.index(x) for x in GAME_COLUMNS]
+		
+		meta_file = os.path.join(path, "meta.json")
+		if mode == 'a' and os.path.exists(meta_file):
+			with open(meta_file, 'r') as fh:
+				if json.load(fh)["features"] != self.features:
+					raise SystemExit("ERROR: Features of timeline tensors in " + path + " differ. Exiting...")
+		else:
+			mode = 'w'
+			with open(meta_file, 'w') as fh:
+				json.dump({	"format": TENSOR_FORMAT,
+						"features": self.features,
+						"nbr_players": NBR_PLAYERS,
+						"frame_dtype": FRAME_DTYPE,
+						"index_dtype": [list(x) for x in INDEX_DTYPE],
+						"na_value": NA_VALUE
+						}, fh, indent=2)
+		
+		self.fh_frames = open(os.path.join(path, "frames.bin"), mode + 'b')
+		self.fh_index = open(os.path.join(path, "index.bin"), mode + 'b')
+		
+		""" Drop frames of games whose index records were not written, and continue after the last game """
+		index_size = np.dtype(INDEX_DTYPE).itemsize
+		self.fh_index.seek(0, os.SEEK_END)
+		nbr_games = self.fh_index.tell() // index_size
+		self.fh_index.truncate(nbr_games * index_size)
+		self.nbr_frames = 0
+		if nbr_games > 0:
+			last_game = np.memmap(os.path.join(path, "index.bin"), dtype=INDEX_DTYPE, mode='r', shape=(nbr_games,))[-1]
+			self.nbr_frames = int(last_game['offset'] + last_game['nbrFrames'])
+		self.frame_size = NBR_PLAYERS * len(self.features) * np.dtype(FRAME_DTYPE).itemsize
+		self.fh_frames.truncate(self.nbr_frames * self.frame_size)
+		self.fh_frames.seek(0, os.SEEK_END)
+	
+	def write(self, rows):
+		""" Append rows of one or more games. """
+		start = 0
+		while start < len(rows):
+			game_id = rows[start][self.game_id_index]
+			end = start
+			while end < len(rows) and rows[end][self.game_id_index] == game_id:
+				end += 1
+			self.write_game(rows[start:end])
+			start = end
+	
+	def write_game(self, rows):
+		nbr_frames = len(rows) // NBR_PLAYERS
+		values = [[row[i] for i in self.feature_indices] for row in rows]
+		
+		""" Only outcomes and positions missing in last frames are not integers """
+		for row_values in values:
+			if self.outcome_index is not None:
+				row_values[self.outcome_index] = OUTCOME_VALUES.get(row_values[self.outcome_index], row_values[self.outcome_index])
+			for i in self.position_indices:
+				if row_values[i] == "NA":
+					row_values[i] = NA_VALUE
+		try:
+			frames = np.array(values, dtype=FRAME_DTYPE)
+		except ValueError:
+			frames = np.array([[get_value(x) for x in row_values] for row_values in values], dtype=FRAME_DTYPE)
+		
+		record = np.zeros(1, dtype=INDEX_DTYPE)
+		record['gameId'] = int(rows[0][self.game_id_index])
+		record['offset'] = self.nbr_frames
+		record['nbrFrames'] = nbr_frames
+		record['gameDuration'] = int(rows[0][self.duration_index])
+		record['accountIds'] = [int(row[self.account_index]) for row in rows[:NBR_PLAYERS]]
+		
+		self.fh_frames.write(frames.tostring())
+		self.fh_index.write(record.tostring())
+		self.nbr_frames += nbr_frames
+	
+	def sync(self):
+		""" Make games written so far durable, frames first. """
+		self.fh_frames.flush()
+		os.fsync(self.fh_frames.fileno())
+		self.fh_index.flush()
+		os.fsync(self.fh_index.fileno())
+	
+	def close(self):
+		self.sync()
+		self.fh_frames.close()
+		self.fh_index.close()
+
+
+class TimelineTensors(object):
+	""" Read-only, memory-mapped view of a tensor dataset. """
+	def __init__(self, path):
+		check_numpy()
+		with open(os.path.join(path, "meta.json"), 'r') as fh:
+			meta = json.load(fh)
+		if meta["format"] != TENSOR_FORMAT:
+			raise SystemExit("ERROR: Timeline tensors in " + path + " have an outdated format. Exiting...")
+		
+		self.features = [str(x) for x in meta["features"]]
+		
+		index_file = os.path.join(path, "index.bin")
+		nbr_games = os.path.getsize(index_file) // np.dtype(INDEX_DTYPE).itemsize
+		self.index = np.memmap(index_file, dtype=INDEX_DTYPE, mode='r', shape=(nbr_games,)) if nbr_games > 0 else np.zeros(0, dtype=INDEX_DTYPE)
+		
+		nbr_frames = int(self.index['offset'][-1] + self.index['nbrFrames'][-1]) if nbr_games > 0 else 0
+		shape = (nbr_frames, NBR_PLAYERS, len(self.features))
+		self.frames = np.memmap(os.path.join(path, "frames.bin"), dtype=FRAME_DTYPE, mode='r', shape=shape) if nbr_frames > 0 else np.zeros(shape, dtype=FRAME_DTYPE)
+		
+		""" Game ids sorted, with positions of games in index, for lookups by binary search """
+		self.game_order = np.argsort(self.index['gameId'], kind='mergesort')
+		self.sorted_game_ids = self.index['gameId'][self.game_order]
+	
+	def __len__(self):
+		return len(self.index)
+	
+	def get_game_ids(self):
+		return self.index['gameId']
+	
+	def get_position(self, game_id):
+		""" Get position of a game in index, or raise KeyError. """
+		i = np.searchsorted(self.sorted_game_ids, int(game_id))
+		if i == len(self.sorted_game_ids) or self.sorted_game_ids[i] != int(game_id):
+			raise KeyError(game_id)
+		return self.game_order[i]
+	
+	def get_game(self, game_id):
+		""" Get timeline of a game as array of shape (frames, 10 players, features), a view of the mapped file. """
+		record = self.index[self.get_position(game_id)]
+		return self.frames[record['offset']:record['offset'] + record['nbrFrames']]
+	
+	def get_feature(self, game_id, feature):
+		""" Get one feature of a game as array of shape (frames, 10 players), e.g., "totalGold". """
+		return self.get_game(game_id)[:, :, self.features.index(feature)]
+	
+	def get_game_info(self, game_id):
+		""" Get [game duration, account ids of players 1 to 10] of a game. """
+		record = self.index[self.get_position(game_id)]
+		return [int(record['gameDuration']), [int(x) for x in record['accountIds']]]
+	
+	def get_batch(self, game_ids, nbr_frames=None):
+		"""
+		Get timelines of games as one array of shape (games, frames, 10 players, features), padded with NA_VALUE
+		after the last frame of each game, or cut after 'nbr_frames' frames, and the numbers of frames of the games.
+		"""
+		records = self.index[[self.get_position(x) for x in game_ids]]
+		if nbr_frames is None:
+			nbr_frames = int(records['nbrFrames'].max()) if len(records) > 0 else 0
+		
+		batch = np.full((len(records), nbr_frames, NBR_PLAYERS, len(self.features)), NA_VALUE, dtype=FRAME_DTYPE)
+		lengths = np.minimum(records['nbrFrames'], nbr_frames)
+		for i, (record, length) in enumerate(zip(records, lengths)):
+			batch[i, :length] = self.frames[record['offset']:record['offset'] + length]
+		return [batch, lengths]
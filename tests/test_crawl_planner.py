@@ -0,0 +1,40 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import crawl_planner as cp
+
+
+def get_match_lists():
+	""" Match lists of three players of a league, who share some of their ranked games. """
+	games = {	"1": [10, 11, 12, 13, 14],
+			"2": [10, 11, 15, 16, 17],
+			"3": [11, 12, 16, 18, 19]
+			}
+	return dict((account_id, [{"gameId": x, "queue": 420, "timestamp": x * 1000} for x in game_ids]) for account_id, game_ids in games.items())
+
+
+class PlanGamesTest(unittest.TestCase):
+	def test_shared_games_first(self):
+		plan = cp.plan_games(get_match_lists(), 2)
+		self.assertEqual(plan[0], 11)	# Game of all three players
+		self.assertEqual(len(plan), 3)
+	
+	def test_resume_of_complete_crawl(self):
+		""" Games retrieved by a finished crawl fill the quotas of their players, so nothing is planned again. """
+		match_lists = get_match_lists()
+		for nbr_games in [1, 2, 3, 5]:
+			retrieved = set(cp.plan_games(match_lists, nbr_games))
+			self.assertEqual(cp.plan_games(match_lists, nbr_games, lambda x: x in retrieved), [])
+	
+	def test_resume_of_partial_crawl(self):
+		""" Games retrieved count for their players, so that a resumed crawl plans only games still missing. """
+		match_lists = get_match_lists()
+		plan = cp.plan_games(match_lists, 3)
+		retrieved = set(plan[:2])
+		self.assertEqual(cp.plan_games(match_lists, 3, lambda x: x in retrieved), plan[2:])
+
+
+if __name__ == "__main__":
+	unittest.main()